@@ -18,8 +18,20 @@ sqlite3 src/db/demo.db < src/db/schema.sql
 # seed the database with test data
 sqlite3 src/db/demo.db < src/db/seed.sql
 
+# start from an empty job queue
+rm -f src/db/jobs.db src/db/jobs.db-wal src/db/jobs.db-shm
+
+# forget the nonces of the previous chain
+rm -f src/db/nonces.db src/db/nonces.db-wal src/db/nonces.db-shm
+
 # start a eth node
 npx hardhat node &
 
+# start the purchase job worker
+python src/worker.py &
+
+# start the chain indexer
+python src/indexer.py &
+
 # replace this process with main app
 exec streamlit run src/app.py
\ No newline at end of file
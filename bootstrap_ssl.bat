@@ -40,6 +40,17 @@ if not exist "src\ssl_watermarking\models\dino_r50_plus.pth" (
     curl -k -L -o "src\ssl_watermarking\models\dino_r50_plus.pth" https://dl.fbaipublicfiles.com/ssl_watermarking/dino_r50_plus.pth
 )
 
+REM Convert the checkpoints into memory-mappable weights if needed
+set CONVERT_WEIGHTS=0
+if not exist "src\ssl_watermarking\models\dino_r50_plus.safetensors" set CONVERT_WEIGHTS=1
+if not exist "src\ssl_watermarking\normlayers\out2048_yfcc_orig.safetensors" set CONVERT_WEIGHTS=1
+if "%CONVERT_WEIGHTS%"=="1" (
+    echo Converting SSL watermarking weights to safetensors...
+    pushd src\ssl_watermarking
+    python convert_weights.py
+    popd
+)
+
 REM remove the current database and create new one from schema
 if exist "src\db\demo.db" del /q "src\db\demo.db"
 type "src\db\schema.sql" | sqlite3 "src\db\demo.db"
@@ -47,12 +58,24 @@ type "src\db\schema.sql" | sqlite3 "src\db\demo.db"
 REM seed the database with test data
 type "src\db\seed.sql" | sqlite3 "src\db\demo.db"
 
+REM start from an empty job queue
+if exist "src\db\jobs.db" del /q "src\db\jobs.db" "src\db\jobs.db-wal" "src\db\jobs.db-shm" 2>nul
+
+REM forget the nonces of the previous chain
+if exist "src\db\nonces.db" del /q "src\db\nonces.db" "src\db\nonces.db-wal" "src\db\nonces.db-shm" 2>nul
+
 REM start a eth node in background
 start "Hardhat Node" cmd /c "npx hardhat node"
 
 REM wait a bit for the node to start
 timeout /t 3 /nobreak >nul
 
+REM start the purchase job worker in background
+start "Job Worker" cmd /c "python src/worker.py"
+
+REM start the chain indexer in background
+start "Chain Indexer" cmd /c "python src/indexer.py"
+
 REM run main app
 streamlit run src/app.py
 
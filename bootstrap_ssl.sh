@@ -24,6 +24,12 @@ if ! [ -f src/ssl_watermarking/models/dino_r50_plus.pth ]; then
     wget --no-check-certificate https://dl.fbaipublicfiles.com/ssl_watermarking/dino_r50_plus.pth -P src/ssl_watermarking/models
 fi
 
+# convert the checkpoints into memory-mappable weights
+if ! [ -f src/ssl_watermarking/models/dino_r50_plus.safetensors ] || ! [ -f src/ssl_watermarking/normlayers/out2048_yfcc_orig.safetensors ]; then
+    echo "Converting SSL watermarking weights to safetensors..."
+    (cd src/ssl_watermarking && python convert_weights.py)
+fi
+
 # remove the current database and create new one from schema
 rm -f src/db/demo.db
 sqlite3 src/db/demo.db < src/db/schema.sql
@@ -31,8 +37,20 @@ sqlite3 src/db/demo.db < src/db/schema.sql
 # seed the database with test data
 sqlite3 src/db/demo.db < src/db/seed.sql
 
+# start from an empty job queue
+rm -f src/db/jobs.db src/db/jobs.db-wal src/db/jobs.db-shm
+
+# forget the nonces of the previous chain
+rm -f src/db/nonces.db src/db/nonces.db-wal src/db/nonces.db-shm
+
 # start a eth node
 npx hardhat node &
 
+# start the purchase job worker
+python src/worker.py &
+
+# start the chain indexer
+python src/indexer.py &
+
 # replace this process with main app
 exec streamlit run src/app.py
\ No newline at end of file
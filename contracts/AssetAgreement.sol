@@ -2,10 +2,19 @@
 pragma solidity ^0.8.0;
 
 import "erc721a/contracts/ERC721A.sol";
+import "erc721a/contracts/extensions/ERC721AQueryable.sol";
 import "@openzeppelin/contracts/utils/Strings.sol";
+import "@openzeppelin/contracts/utils/math/SafeCast.sol";
+import "@openzeppelin/contracts/utils/cryptography/ECDSA.sol";
+import "@openzeppelin/contracts/utils/cryptography/EIP712.sol";
+import "./IAssetAgreement.sol";
 import "@openzeppelin/contracts/access/AccessControl.sol";
 
-contract AssetAgreement is ERC721A, AccessControl {
+/**
+ * ERC721AQueryable adds the tokensOfOwner / tokensOfOwnerIn views, so the
+ * holdings of a wallet are read without scanning every asset off chain
+ */
+contract AssetAgreement is ERC721AQueryable, AccessControl, EIP712 {
     /**
      * There are two roles,
      * MARKET_ROLE: granted to the Market Contract
@@ -30,21 +39,67 @@ contract AssetAgreement is ERC721A, AccessControl {
     address public market;
 
     /**
-     * Stores information regarding each individual minted asset
+     * Clones share the implementation's code but not its storage, so the
+     * token name and symbol set by the ERC721A constructor are kept here
+     */
+    string private agreementName;
+    string private agreementSymbol;
+
+    /**
+     * Set once the agreement has been initialized, by its constructor or,
+     * for a clone, by the factory
+     */
+    bool private initialized;
+
+    /**
+     * Stores information regarding each individual minted asset, packed in a
+     * single storage slot so that minting writes one slot per asset
      */
     struct DataAsset {
+        uint128 price; // sale price of asset
+        bool forSale; // asset for sale flag
+        bool resaleAllowed; // whether this asset is allowed for resale
+    }
+
+    /**
+     * Read-only view of an asset returned by the batched metadata query
+     */
+    struct AssetMetaData {
         uint256 price; // sale price of asset
         bytes32 assetHash; // hash of asset
         bool forSale; // asset for sale flag
         bool resaleAllowed; // whether this asset is allowed for resale
+        address owner; // current holder of the asset
     }
 
-
     /*
      * Maps an asset Token ID to a DataAsset structure
      */
     mapping(uint256 => DataAsset) mintedAssets;
 
+    /*
+     * Maps an asset Token ID to the hash of its last watermarked sale. Kept
+     * apart from DataAsset: it is only written on sales, never on mint
+     */
+    mapping(uint256 => bytes32) assetHashes;
+
+    bytes32 private constant VOUCHER_TYPEHASH =
+        keccak256(
+            "Voucher(uint256 voucherId,bytes32 assetDigest,uint256 price,bool resaleAllowed)"
+        );
+
+    /*
+     * Maps a redeemed or cancelled voucher ID to the Token ID minted for it
+     * plus one (zero for vouchers that are still open, max for cancelled ones)
+     */
+    mapping(uint256 => uint256) voucherTokens;
+
+    event VoucherRedeemed(
+        uint256 indexed voucherId,
+        uint256 tokenId,
+        address to
+    );
+
     /*
      * Maps Asset Hash to Token ID
      */
@@ -55,18 +110,80 @@ contract AssetAgreement is ERC721A, AccessControl {
         string memory _symbol,
         address _owner,
         address _market
-    ) ERC721A(_name, _symbol) {
+    ) ERC721A(_name, _symbol) EIP712("AssetAgreement", "1") {
+        initialize(_name, _symbol, _owner, _market);
+    }
+
+    /**
+     * Sets up an agreement. Called by the constructor, or by the factory right
+     * after creating an EIP-1167 clone of the implementation agreement.
+     *
+     * The Market is approved to transfer the owner's assets from the start,
+     * see isApprovedForAll, so publishing needs no separate
+     * setApprovalForAll transaction.
+     *
+     * @param _name the token name
+     * @param _symbol the token symbol
+     * @param _owner the original data owner
+     * @param _market the Market Contract address
+     */
+    function initialize(
+        string memory _name,
+        string memory _symbol,
+        address _owner,
+        address _market
+    ) public {
+        require(!initialized, "Agreement already initialized");
+        initialized = true;
+
+        agreementName = _name;
+        agreementSymbol = _symbol;
         owner = _owner;
         market = _market;
 
         //grant roles to agreement owner and market contract
         _grantRole(OWNER_ROLE, owner);
         _grantRole(MARKET_ROLE, market);
+
+        emit ApprovalForAll(owner, market, true);
+    }
+
+    function name()
+        public
+        view
+        override(ERC721A, IERC721A)
+        returns (string memory)
+    {
+        return agreementName;
+    }
+
+    function symbol()
+        public
+        view
+        override(ERC721A, IERC721A)
+        returns (string memory)
+    {
+        return agreementSymbol;
+    }
+
+    /**
+     * The Market is always an approved operator of the original data owner.
+     * Other holders approve it themselves.
+     */
+    function isApprovedForAll(
+        address _holder,
+        address _operator
+    ) public view override(ERC721A, IERC721A) returns (bool) {
+        if (_holder == owner && _operator == market) {
+            return true;
+        }
+
+        return super.isApprovedForAll(_holder, _operator);
     }
 
     function supportsInterface(
         bytes4 interfaceId
-    ) public view override(ERC721A, AccessControl) returns (bool) {
+    ) public view override(IERC721A, ERC721A, AccessControl) returns (bool) {
         return super.supportsInterface(interfaceId);
     }
 
@@ -79,12 +196,65 @@ contract AssetAgreement is ERC721A, AccessControl {
     ) public view returns (uint256, bytes32, bool, bool) {
         require(_exists(_tokenId), "Token ID does not exist.");
 
-        uint256 price = mintedAssets[_tokenId].price;
-        bytes32 assetHash = mintedAssets[_tokenId].assetHash;
-        bool forSale = mintedAssets[_tokenId].forSale;
-        bool resaleAllowed = mintedAssets[_tokenId].resaleAllowed;
+        DataAsset memory asset = mintedAssets[_tokenId];
+
+        return (
+            asset.price,
+            assetHashes[_tokenId],
+            asset.forSale,
+            asset.resaleAllowed
+        );
+    }
+
+    /**
+     * Returns the metadata and current holder of several assets at once
+     *
+     * @param _tokenIds the Token IDs of the assets
+     */
+    function fetchAssetsMetaData(
+        uint256[] calldata _tokenIds
+    ) public view returns (AssetMetaData[] memory) {
+        AssetMetaData[] memory assets = new AssetMetaData[](_tokenIds.length);
+
+        for (uint256 i = 0; i < _tokenIds.length; i++) {
+            uint256 tokenId = _tokenIds[i];
+            require(_exists(tokenId), "Token ID does not exist.");
+
+            DataAsset memory asset = mintedAssets[tokenId];
+
+            assets[i] = AssetMetaData(
+                asset.price,
+                assetHashes[tokenId],
+                asset.forSale,
+                asset.resaleAllowed,
+                ownerOf(tokenId)
+            );
+        }
+
+        return assets;
+    }
+
+    /**
+     * Returns everything the Market needs to settle a sale of an asset in a
+     * single call: price, sale status, current holder, original data owner
+     * and the owner's Royalty Fee Percentage
+     *
+     * @param _tokenId the Token ID of the asset
+     */
+    function saleInfo(
+        uint256 _tokenId
+    ) public view returns (uint256, bool, address, address, uint256) {
+        require(_exists(_tokenId), "Asset Token ID does not exist.");
+
+        DataAsset memory asset = mintedAssets[_tokenId];
 
-        return (price, assetHash, forSale, resaleAllowed);
+        return (
+            asset.price,
+            asset.forSale,
+            ownerOf(_tokenId),
+            owner,
+            ownerRoyalty
+        );
     }
 
     /**
@@ -136,7 +306,7 @@ contract AssetAgreement is ERC721A, AccessControl {
 
         require(_exists(tokenID), "Asset Token ID does not exist");
 
-        require(mintedAssets[tokenID].assetHash == _hash, "Asset Hash does not exist");
+        require(assetHashes[tokenID] == _hash, "Asset Hash does not exist");
 
         return (ownerOf(tokenID), tokenID);
     }
@@ -164,7 +334,7 @@ contract AssetAgreement is ERC721A, AccessControl {
     ) public onlyRole(MARKET_ROLE) {
         require(_exists(_tokenId), "Token ID does not exist");
 
-        mintedAssets[_tokenId].price = _price;
+        mintedAssets[_tokenId].price = SafeCast.toUint128(_price);
     }
 
     /**
@@ -183,7 +353,7 @@ contract AssetAgreement is ERC721A, AccessControl {
         require(_exists(_tokenId), "Token ID does not exist");
 
         hashRecord[_hash] = _tokenId;
-        mintedAssets[_tokenId].assetHash = _hash; 
+        assetHashes[_tokenId] = _hash;
     }
 
     /**
@@ -197,17 +367,17 @@ contract AssetAgreement is ERC721A, AccessControl {
      * @param _market new Market Contract address
      */
     function updateMarketAddress(address _market) public onlyRole(OWNER_ROLE) {
-        // remove the old market address from the MARKET_ROLE and revoke
-        // approvals
+        // remove the old market address from the MARKET_ROLE, the owner's
+        // approval follows the market address (see isApprovedForAll)
         _revokeRole(MARKET_ROLE, market);
-        setApprovalForAll(market, false);
+        emit ApprovalForAll(owner, market, false);
 
         // update the market address
         market = _market;
 
-        // grant the new market address the MARKET_ROLE and approvals
+        // grant the new market address the MARKET_ROLE
         _grantRole(MARKET_ROLE, market);
-        setApprovalForAll(market, true);
+        emit ApprovalForAll(owner, market, true);
     }
 
     /**
@@ -302,13 +472,117 @@ contract AssetAgreement is ERC721A, AccessControl {
 
         uint256 endTokenID = _nextTokenId();
 
-        for (uint256 i = startTokenID; i < endTokenID; i++) {
-            mintedAssets[i].price = _prices[i - startTokenID];
-            mintedAssets[i].forSale = true;
-            mintedAssets[i].resaleAllowed = _resaleAllowed[i - startTokenID];
+        // one packed slot written per asset
+        for (uint256 i = startTokenID; i < endTokenID; ) {
+            mintedAssets[i] = DataAsset(
+                SafeCast.toUint128(_prices[i - startTokenID]),
+                true,
+                _resaleAllowed[i - startTokenID]
+            );
+
+            unchecked {
+                ++i;
+            }
         }
     }
 
+    /**
+     * Returns the EIP-712 digest the owner signs for a lazy mint voucher. The
+     * domain uses the agreement's own address, clones included.
+     *
+     * @param _voucher the voucher
+     */
+    function hashVoucher(
+        IAssetAgreement.Voucher calldata _voucher
+    ) public view returns (bytes32) {
+        return
+            _hashTypedDataV4(
+                keccak256(
+                    abi.encode(
+                        VOUCHER_TYPEHASH,
+                        _voucher.voucherId,
+                        _voucher.assetDigest,
+                        _voucher.price,
+                        _voucher.resaleAllowed
+                    )
+                )
+            );
+    }
+
+    /**
+     * Returns whether a voucher was redeemed or cancelled, and the Token ID
+     * minted for a redeemed voucher
+     *
+     * @param _voucherId the voucher ID
+     */
+    function voucherStatus(
+        uint256 _voucherId
+    ) public view returns (bool, uint256) {
+        uint256 token = voucherTokens[_voucherId];
+
+        if (token == 0 || token == type(uint256).max) {
+            return (token != 0, 0);
+        }
+
+        return (true, token - 1);
+    }
+
+    /**
+     * Mints the asset of a voucher signed by the owner to its buyer. The new
+     * asset is not for sale, it has just been sold.
+     *
+     * Can only be called by the Market, as part of the purchase.
+     *
+     * @param _voucher the voucher signed by the owner
+     * @param _signature the owner's EIP-712 signature of the voucher
+     * @param _to the buyer
+     */
+    function redeemVoucher(
+        IAssetAgreement.Voucher calldata _voucher,
+        bytes calldata _signature,
+        address _to
+    ) public onlyRole(MARKET_ROLE) returns (uint256) {
+        require(
+            voucherTokens[_voucher.voucherId] == 0,
+            "Voucher redeemed or cancelled"
+        );
+        require(
+            ECDSA.recover(hashVoucher(_voucher), _signature) == owner,
+            "Invalid voucher signature"
+        );
+
+        uint256 tokenId = _nextTokenId();
+        voucherTokens[_voucher.voucherId] = tokenId + 1;
+
+        _mint(_to, 1);
+
+        mintedAssets[tokenId] = DataAsset(
+            SafeCast.toUint128(_voucher.price),
+            false,
+            _voucher.resaleAllowed
+        );
+
+        emit VoucherRedeemed(_voucher.voucherId, tokenId, _to);
+
+        return tokenId;
+    }
+
+    /**
+     * Cancels an open voucher on chain
+     *
+     * Can only be called by the Owner.
+     *
+     * @param _voucherId the voucher ID
+     */
+    function cancelVoucher(uint256 _voucherId) public onlyRole(OWNER_ROLE) {
+        require(
+            voucherTokens[_voucherId] == 0,
+            "Voucher redeemed or cancelled"
+        );
+
+        voucherTokens[_voucherId] = type(uint256).max;
+    }
+
     /**
      * Returns the Asset Token URI
      *
@@ -316,7 +590,7 @@ contract AssetAgreement is ERC721A, AccessControl {
      */
     function tokenURI(
         uint256 _tokenId
-    ) public view override returns (string memory) {
+    ) public view override(ERC721A, IERC721A) returns (string memory) {
         require(_exists(_tokenId), "Asset Token ID does not exist.");
         return "https://www.example.com?id={id}";
     }
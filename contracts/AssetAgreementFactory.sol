@@ -1,24 +1,54 @@
 // SPDX-License-Identifier: UNLICENSED
 pragma solidity ^0.8.0;
 
-import "@openzeppelin/contracts/token/ERC721/ERC721.sol";
+import "@openzeppelin/contracts/proxy/Clones.sol";
 import "./AssetAgreement.sol";
 
 contract AssetAgreementFactory {
     event NewContract(address contractAddress);
 
+    /**
+     * Agreement every new agreement is an EIP-1167 minimal proxy of. It is
+     * initialized here, owned by the factory, so nobody can take it over.
+     */
+    address public immutable implementation;
+
+    /**
+     * Deploys the implementation agreement, owned by the factory. The
+     * factory's deployment therefore costs about one full agreement more,
+     * and the Market has to be deployed before the factory.
+     *
+     * @param _market the Market Contract address the implementation is bound to
+     */
+    constructor(address _market) {
+        implementation = address(
+            new AssetAgreement("", "", address(this), _market)
+        );
+    }
+
+    /**
+     * Creates an agreement for the caller as a clone of the implementation:
+     * a 45 byte proxy instead of the full ERC721A + AccessControl bytecode.
+     * The Market is approved by the initializer.
+     *
+     * @param _name the token name
+     * @param _symbol the token symbol
+     * @param _market the Market Contract address
+     */
     function createNewAssetAgreement(
         string memory _name,
         string memory _symbol,
         address _market
     ) public {
-        AssetAgreement agreement = new AssetAgreement(
+        address agreement = Clones.clone(implementation);
+
+        AssetAgreement(agreement).initialize(
             _name,
             _symbol,
             msg.sender,
             _market
         );
 
-        emit NewContract(address(agreement));
+        emit NewContract(agreement);
     }
 }
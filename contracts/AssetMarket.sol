@@ -2,19 +2,99 @@
 pragma solidity ^0.8.17;
 import "./IAssetAgreement.sol";
 import "@openzeppelin/contracts/access/Ownable.sol";
+import "@openzeppelin/contracts/utils/cryptography/ECDSA.sol";
+import "@openzeppelin/contracts/utils/cryptography/EIP712.sol";
+import "@openzeppelin/contracts/utils/cryptography/MerkleProof.sol";
+import "@openzeppelin/contracts/utils/math/SafeCast.sol";
 
-contract AssetMarket is Ownable {
-    bool internal locked = false;
+contract AssetMarket is Ownable, EIP712 {
+    /**
+     * Re-entrancy guard status. Non-zero values only, so that entering and
+     * leaving a guarded function never pays for a zero to non-zero write
+     */
+    uint256 private constant NOT_ENTERED = 1;
+    uint256 private constant ENTERED = 2;
+    uint256 private status = NOT_ENTERED;
 
     uint256 marketRoyalty = 0;
 
-    event Purchase(address from, address to, uint256 tokenId, uint256 price);
+    /**
+     * Escrowed sale proceeds. Purchases credit the original owner and the
+     * seller here instead of transferring to them, they withdraw later
+     */
+    mapping(address => uint256) balances;
+
+    /**
+     * Market royalty fees collected and not withdrawn yet
+     */
+    uint256 marketBalance = 0;
+
+    event Purchase(
+        address indexed agreement,
+        address from,
+        address to,
+        uint256 tokenId,
+        uint256 price
+    );
+
+    event Withdrawal(address indexed account, uint256 amount);
+
+    event ListingCancelled(address indexed seller, uint256 nonce);
+
+    event SaleRootCommitted(uint256 indexed epoch, bytes32 root);
+
+    /**
+     * Asset a hash of a watermarked image was written for, packed into a
+     * single storage slot
+     */
+    struct SaleRecord {
+        address agreement; // Asset Agreement contract address
+        uint96 tokenId; // Token ID of the asset
+    }
+
+    /**
+     * Every hash written through this market, across all agreements, so that
+     * a leak is traced without knowing its original owner
+     */
+    mapping(bytes32 => SaleRecord) saleRecords;
+
+    /**
+     * Merkle roots of the sale hashes committed per epoch. Sales settled
+     * without writing their hash are accumulated off chain and committed
+     * here once per epoch, each sale is proven with its Merkle proof.
+     */
+    mapping(uint256 => bytes32) saleRoots;
+
+    /**
+     * Sale order signed off chain (EIP-712) by the holder of an asset. Listing
+     * and repricing cost no gas, the Market verifies the order at purchase.
+     */
+    struct Listing {
+        address seller; // holder of the asset, signer of the listing
+        address agreement; // Asset Agreement contract address
+        uint256 tokenId; // Token ID of the asset
+        uint256 price; // sale price in wei
+        uint256 nonce; // chosen by the seller, a filled or cancelled nonce cannot be used again
+        uint256 deadline; // timestamp after which the listing expires
+    }
+
+    bytes32 private constant LISTING_TYPEHASH =
+        keccak256(
+            "Listing(address seller,address agreement,uint256 tokenId,uint256 price,uint256 nonce,uint256 deadline)"
+        );
+
+    /**
+     * Listing nonces of every seller that were filled or cancelled
+     */
+    mapping(address => mapping(uint256 => bool)) usedNonces;
+
+    constructor() EIP712("AssetMarket", "1") {}
 
     modifier noReEntrancy() {
-        require(!locked, "Re-entrancy not allowed");
-        locked = true;
+        require(status == NOT_ENTERED, "Re-entrancy not allowed");
+        status = ENTERED;
         _;
-        locked = false;
+        status = NOT_ENTERED;
     }
 
     /**
@@ -32,6 +112,53 @@ contract AssetMarket is Ownable {
         return agreement.getOwnerOfAssetFromHash(_hash);
     }
 
+    /**
+     * Traceability: Finds the asset of a hash of a watermarked image in any
+     * agreement, with a single lookup. Reverts like getAssetSaleRecord if
+     * the hash is unknown or was overwritten by a later sale.
+     *
+     * @param _hash the hash of the watermarked image
+     * @return agreement the Asset Agreement Address
+     * @return holder the current holder of the asset
+     * @return tokenId the Token ID of the asset
+     */
+    function findSaleRecord(
+        bytes32 _hash
+    )
+        public
+        view
+        returns (address agreement, address holder, uint256 tokenId)
+    {
+        agreement = saleRecords[_hash].agreement;
+
+        require(agreement != address(0), "Asset Hash does not exist");
+
+        (holder, tokenId) = IAssetAgreement(agreement).getOwnerOfAssetFromHash(
+            _hash
+        );
+    }
+
+    /**
+     * Writes the hash of an asset to its agreement and to the market-wide
+     * registry
+     *
+     * @param _agreement the Asset Agreeement Address
+     * @param _tokenId the Token ID of the asset
+     * @param _hash the hash of the watermarked image
+     */
+    function writeHash(
+        address _agreement,
+        uint256 _tokenId,
+        bytes32 _hash
+    ) private {
+        IAssetAgreement(_agreement).updateHash(_tokenId, _hash);
+
+        saleRecords[_hash] = SaleRecord(
+            _agreement,
+            SafeCast.toUint96(_tokenId)
+        );
+    }
+
     /**
      * Updates the hash of an asset for an agreement.
      *
@@ -46,8 +173,107 @@ contract AssetMarket is Ownable {
         uint256 _tokenId,
         bytes32 _hash
     ) public noReEntrancy onlyOwner {
-        IAssetAgreement agreementContract = IAssetAgreement(_agreement);
-        agreementContract.updateHash(_tokenId, _hash);
+        writeHash(_agreement, _tokenId, _hash);
+    }
+
+    /**
+     * Updates the hashes of several assets, possibly across agreements, in a
+     * single transaction.
+     *
+     * Can only be called by Market.
+     *
+     * @param _agreements the Asset Agreement Address of every asset
+     * @param _tokenIds the Token ID of every asset
+     * @param _hashes the hash of every watermarked image
+     */
+    function updateHashBatch(
+        address[] calldata _agreements,
+        uint256[] calldata _tokenIds,
+        bytes32[] calldata _hashes
+    ) public noReEntrancy onlyOwner {
+        require(
+            _agreements.length == _tokenIds.length &&
+                _tokenIds.length == _hashes.length,
+            "Agreements, Token IDs and hashes must be same length!"
+        );
+
+        for (uint256 i = 0; i < _tokenIds.length; i++) {
+            writeHash(_agreements[i], _tokenIds[i], _hashes[i]);
+        }
+    }
+
+    /**
+     * Commits the Merkle root of the sale hashes of an epoch. A committed
+     * root cannot be replaced.
+     *
+     * Can only be called by Market.
+     *
+     * @param _epoch the epoch number
+     * @param _root the Merkle root of the epoch's sale leaves, see saleLeaf
+     */
+    function commitSaleRoot(uint256 _epoch, bytes32 _root) public onlyOwner {
+        require(_root != bytes32(0), "Empty root");
+        require(saleRoots[_epoch] == bytes32(0), "Epoch already committed");
+
+        saleRoots[_epoch] = _root;
+
+        emit SaleRootCommitted(_epoch, _root);
+    }
+
+    /**
+     * Returns the committed Merkle root of an epoch, zero if not committed
+     *
+     * @param _epoch the epoch number
+     */
+    function getSaleRoot(uint256 _epoch) public view returns (bytes32) {
+        return saleRoots[_epoch];
+    }
+
+    /**
+     * Returns the Merkle leaf of a sale: the hash of the watermarked image
+     * for an asset, hashed twice so that it cannot collide with an inner node
+     *
+     * @param _agreement the Asset Agreeement Address
+     * @param _tokenId the Token ID of the asset
+     * @param _hash the hash of the watermarked image
+     */
+    function saleLeaf(
+        address _agreement,
+        uint256 _tokenId,
+        bytes32 _hash
+    ) public pure returns (bytes32) {
+        return
+            keccak256(
+                bytes.concat(keccak256(abi.encode(_agreement, _tokenId, _hash)))
+            );
+    }
+
+    /**
+     * Traceability: Checks that the hash of a watermarked image was committed
+     * for an asset in an epoch
+     *
+     * @param _epoch the epoch the sale was committed in
+     * @param _agreement the Asset Agreeement Address
+     * @param _tokenId the Token ID of the asset
+     * @param _hash the hash of the watermarked image
+     * @param _proof the Merkle proof of the sale leaf
+     */
+    function verifySaleHash(
+        uint256 _epoch,
+        address _agreement,
+        uint256 _tokenId,
+        bytes32 _hash,
+        bytes32[] calldata _proof
+    ) public view returns (bool) {
+        bytes32 root = saleRoots[_epoch];
+
+        return
+            root != bytes32(0) &&
+            MerkleProof.verifyCalldata(
+                _proof,
+                root,
+                saleLeaf(_agreement, _tokenId, _hash)
+            );
     }
 
     /**
@@ -67,12 +293,64 @@ contract AssetMarket is Ownable {
     }
 
     /**
-     * Withdraws all royalty fees to a specified account
+     * Withdraws all royalty fees to a specified account. Escrowed sale
+     * proceeds of owners and sellers are not part of it.
      *
      * @param _to wallet address to send funds to
      */
-    function withdrawRoyalty(address _to) public onlyOwner {
-        payable(_to).transfer(address(this).balance);
+    function withdrawRoyalty(address _to) public noReEntrancy onlyOwner {
+        uint256 amount = marketBalance;
+        marketBalance = 0;
+
+        payable(_to).transfer(amount);
+    }
+
+    /**
+     * Returns the escrowed sale proceeds of an account
+     *
+     * @param _account the wallet address of an owner or seller
+     */
+    function balanceOf(address _account) public view returns (uint256) {
+        return balances[_account];
+    }
+
+    /**
+     * Pays out the escrowed sale proceeds of an account to itself
+     *
+     * @param _account the wallet address of an owner or seller
+     */
+    function payout(address _account) private {
+        uint256 amount = balances[_account];
+
+        if (amount == 0) {
+            return;
+        }
+
+        balances[_account] = 0;
+        payable(_account).transfer(amount);
+
+        emit Withdrawal(_account, amount);
+    }
+
+    /**
+     * Withdraws the sender's escrowed sale proceeds
+     */
+    function withdraw() public noReEntrancy {
+        require(balances[msg.sender] > 0, "Nothing to withdraw");
+
+        payout(msg.sender);
+    }
+
+    /**
+     * Pays out the escrowed sale proceeds of several accounts, each to
+     * itself, in a single transaction. Anyone can settle on their behalf.
+     *
+     * @param _accounts the wallet addresses of owners and sellers
+     */
+    function withdrawBatch(address[] calldata _accounts) public noReEntrancy {
+        for (uint256 i = 0; i < _accounts.length; i++) {
+            payout(_accounts[i]);
+        }
     }
 
     /**
@@ -123,14 +401,16 @@ contract AssetMarket is Ownable {
     }
 
     /**
-     * Processes the payment, ensuring Royalty Fees are paid to respective
-     * parties
+     * Processes the payment, crediting Royalty Fees and proceeds to the
+     * respective parties' escrowed balances
      *
+     * @param _amount the amount paid for the asset
      * @param _originalOwner the original data owner of the asset
      * @param _seller the party who is currently selling this asset
      * @param _ownerRoyalty the royalty fee percentage of the owners
      */
     function processPayment(
+        uint256 _amount,
         address _originalOwner,
         address _seller,
         uint256 _ownerRoyalty
@@ -142,55 +422,490 @@ contract AssetMarket is Ownable {
         );
 
         // compute market royalty
-        uint256 marketCut = (msg.value * marketRoyalty) / 1 ether;
+        uint256 marketCut = (_amount * marketRoyalty) / 1 ether;
+        marketBalance += marketCut;
 
         // funds remaining after Market takes it's cut
-        uint256 remaining = msg.value - marketCut;
+        uint256 remaining = _amount - marketCut;
 
-        // for sales from original owner, we just transfer remaining funds
+        // for sales from original owner, we just credit remaining funds
         // Otherwise, we compute the owner's cut from their royalty percentage
         if (_originalOwner == _seller) {
-            payable(_originalOwner).transfer(remaining);
+            balances[_originalOwner] += remaining;
         } else {
             uint256 ownerCut = (remaining * _ownerRoyalty) / 1 ether;
-            payable(_originalOwner).transfer(ownerCut);
-            payable(_seller).transfer(remaining - ownerCut);
+            balances[_originalOwner] += ownerCut;
+            balances[_seller] += remaining - ownerCut;
         }
     }
 
     /**
-     * Purchase an asset
+     * Transfers an asset to the buyer and pays its seller. Returns the price
+     * paid, the caller checks that the buyer sent enough ETH.
      *
      * @param _agreement Owner's Asset Agreement contract address
      * @param _tokenId Token ID of asset
      */
-    function purchase(
+    function settlePurchase(
         address _agreement,
         uint256 _tokenId
-    ) public payable noReEntrancy {
+    ) private returns (uint256) {
         IAssetAgreement agreementContract = IAssetAgreement(_agreement);
 
-        uint256 price = agreementContract.priceOf(_tokenId);
-
-        // ensure buyer paid the correct price for the asset
-        require(msg.value >= price, "Not enough ETH!");
+        // one call for everything the sale needs
+        (
+            uint256 price,
+            bool forSale,
+            address assetOwner,
+            address originalOwner,
+            uint256 ownerRoyalty
+        ) = agreementContract.saleInfo(_tokenId);
 
         // ensure that the asset is for sale
-        require(agreementContract.isForSale(_tokenId), "Asset is not for sale");
-
-        address assetOwner = agreementContract.ownerOf(_tokenId);
+        require(forSale, "Asset is not for sale");
 
         // transfer the asset from owner to buyer
         agreementContract.transferFrom(assetOwner, msg.sender, _tokenId);
         agreementContract.updateSaleStatus(_tokenId, false);
 
         // pay respective parties
+        processPayment(price, originalOwner, assetOwner, ownerRoyalty);
+
+        emit Purchase(_agreement, assetOwner, msg.sender, _tokenId, price);
+
+        return price;
+    }
+
+    /**
+     * Sends back whatever the buyer paid above the total price
+     *
+     * @param _total the total price of the purchased assets
+     */
+    function refundExcess(uint256 _total) private {
+        // ensure buyer paid the correct price for the assets
+        require(msg.value >= _total, "Not enough ETH!");
+
+        if (msg.value > _total) {
+            payable(msg.sender).transfer(msg.value - _total);
+        }
+    }
+
+    /**
+     * Purchase an asset
+     *
+     * @param _agreement Owner's Asset Agreement contract address
+     * @param _tokenId Token ID of asset
+     */
+    function purchase(
+        address _agreement,
+        uint256 _tokenId
+    ) public payable noReEntrancy {
+        refundExcess(settlePurchase(_agreement, _tokenId));
+    }
+
+    /**
+     * Purchase an asset and record the hash of its watermarked image in the
+     * same transaction. The hash must be authorized by the Market: its owner
+     * signs (market, chain ID, agreement, token ID, hash, buyer), so the
+     * signature cannot be replayed on another market, chain, asset or buyer.
+     *
+     * @param _agreement Owner's Asset Agreement contract address
+     * @param _tokenId Token ID of asset
+     * @param _hash the hash of the watermarked image
+     * @param _signature the Market owner's signature of the sale
+     */
+    function purchaseWithHash(
+        address _agreement,
+        uint256 _tokenId,
+        bytes32 _hash,
+        bytes calldata _signature
+    ) public payable noReEntrancy {
+        recordAuthorizedHash(_agreement, _tokenId, _hash, _signature);
+
+        refundExcess(settlePurchase(_agreement, _tokenId));
+    }
+
+    /**
+     * Writes the hash of a sale to the buyer (msg.sender) after checking the
+     * Market owner's signature of (market, chain ID, agreement, token ID,
+     * hash, buyer)
+     *
+     * @param _agreement Owner's Asset Agreement contract address
+     * @param _tokenId Token ID of asset
+     * @param _hash the hash of the watermarked image
+     * @param _signature the Market owner's signature of the sale
+     */
+    function recordAuthorizedHash(
+        address _agreement,
+        uint256 _tokenId,
+        bytes32 _hash,
+        bytes calldata _signature
+    ) private {
+        bytes32 digest = ECDSA.toEthSignedMessageHash(
+            keccak256(
+                abi.encodePacked(
+                    address(this),
+                    block.chainid,
+                    _agreement,
+                    _tokenId,
+                    _hash,
+                    msg.sender
+                )
+            )
+        );
+
+        require(
+            ECDSA.recover(digest, _signature) == owner(),
+            "Hash not authorized by Market"
+        );
+
+        writeHash(_agreement, _tokenId, _hash);
+    }
+
+    /**
+     * Purchase the asset of a lazy mint voucher: the agreement mints it to the
+     * buyer, the owner is paid and the hash of the watermarked image is
+     * recorded, all in this transaction.
+     *
+     * The hash is authorized like in purchaseWithHash, with the voucher ID in
+     * place of the Token ID (unknown until the asset is minted): the Market
+     * owner signs (market, chain ID, agreement, "voucher", voucher ID, hash, buyer).
+     *
+     * @param _agreement Owner's Asset Agreement contract address
+     * @param _voucher the voucher signed by the agreement owner
+     * @param _signature the owner's EIP-712 signature of the voucher
+     * @param _hash the hash of the watermarked image
+     * @param _hashSignature the Market owner's signature of the sale
+     */
+    function purchaseVoucher(
+        address _agreement,
+        IAssetAgreement.Voucher calldata _voucher,
+        bytes calldata _signature,
+        bytes32 _hash,
+        bytes calldata _hashSignature
+    ) public payable noReEntrancy {
+        requireAuthorizedVoucherHash(
+            _agreement,
+            _voucher.voucherId,
+            _hash,
+            _hashSignature
+        );
+
+        IAssetAgreement agreementContract = IAssetAgreement(_agreement);
+
+        uint256 tokenId = agreementContract.redeemVoucher(
+            _voucher,
+            _signature,
+            msg.sender
+        );
+
+        writeHash(_agreement, tokenId, _hash);
+
+        // first sale: the seller is the original owner
+        address originalOwner = agreementContract.getOwner();
+
         processPayment(
-            agreementContract.getOwner(),
-            assetOwner,
+            _voucher.price,
+            originalOwner,
+            originalOwner,
             agreementContract.getOwnerRoyalty()
         );
 
-        emit Purchase(assetOwner, msg.sender, _tokenId, price);
+        emit Purchase(
+            _agreement,
+            originalOwner,
+            msg.sender,
+            tokenId,
+            _voucher.price
+        );
+
+        refundExcess(_voucher.price);
+    }
+
+    /**
+     * Checks the Market owner's authorization of the hash of a voucher sale
+     * to the buyer (msg.sender)
+     *
+     * @param _agreement Owner's Asset Agreement contract address
+     * @param _voucherId the voucher ID
+     * @param _hash the hash of the watermarked image
+     * @param _signature the Market owner's signature of the sale
+     */
+    function requireAuthorizedVoucherHash(
+        address _agreement,
+        uint256 _voucherId,
+        bytes32 _hash,
+        bytes calldata _signature
+    ) private view {
+        bytes32 digest = ECDSA.toEthSignedMessageHash(
+            keccak256(
+                abi.encodePacked(
+                    address(this),
+                    block.chainid,
+                    _agreement,
+                    "voucher",
+                    _voucherId,
+                    _hash,
+                    msg.sender
+                )
+            )
+        );
+
+        require(
+            ECDSA.recover(digest, _signature) == owner(),
+            "Hash not authorized by Market"
+        );
+    }
+
+    /**
+     * Returns the EIP-712 digest a seller signs for a listing
+     *
+     * @param _listing the listing
+     */
+    function hashListing(
+        Listing calldata _listing
+    ) public view returns (bytes32) {
+        return
+            _hashTypedDataV4(
+                keccak256(
+                    abi.encode(
+                        LISTING_TYPEHASH,
+                        _listing.seller,
+                        _listing.agreement,
+                        _listing.tokenId,
+                        _listing.price,
+                        _listing.nonce,
+                        _listing.deadline
+                    )
+                )
+            );
+    }
+
+    /**
+     * Checks whether a listing nonce of a seller was filled or cancelled
+     *
+     * @param _seller the seller's wallet address
+     * @param _nonce the listing nonce
+     */
+    function isListingNonceUsed(
+        address _seller,
+        uint256 _nonce
+    ) public view returns (bool) {
+        return usedNonces[_seller][_nonce];
+    }
+
+    /**
+     * Cancels a signed listing of the sender on chain. Off-chain listings that
+     * were never shared can simply be discarded instead.
+     *
+     * @param _nonce the listing nonce
+     */
+    function cancelListing(uint256 _nonce) public {
+        usedNonces[msg.sender][_nonce] = true;
+
+        emit ListingCancelled(msg.sender, _nonce);
+    }
+
+    /**
+     * Verifies a signed listing, transfers the asset to the buyer and pays
+     * the seller. Returns the listing price, the caller checks that the
+     * buyer sent enough ETH.
+     *
+     * @param _listing the listing signed by the seller
+     * @param _signature the seller's EIP-712 signature of the listing
+     */
+    function fillListing(
+        Listing calldata _listing,
+        bytes calldata _signature
+    ) private returns (uint256) {
+        require(block.timestamp <= _listing.deadline, "Listing expired");
+        require(
+            !usedNonces[_listing.seller][_listing.nonce],
+            "Listing filled or cancelled"
+        );
+        require(
+            ECDSA.recover(hashListing(_listing), _signature) == _listing.seller,
+            "Invalid listing signature"
+        );
+
+        usedNonces[_listing.seller][_listing.nonce] = true;
+
+        (
+            ,
+            bool forSale,
+            address assetOwner,
+            address originalOwner,
+            uint256 ownerRoyalty
+        ) = IAssetAgreement(_listing.agreement).saleInfo(_listing.tokenId);
+
+        require(assetOwner == _listing.seller, "Seller does not hold asset");
+
+        // resold assets must allow resale, the original owner always can sell
+        if (assetOwner != originalOwner) {
+            require(
+                IAssetAgreement(_listing.agreement).isResaleAllowed(
+                    _listing.tokenId
+                ),
+                "Resale not allowed"
+            );
+        }
+
+        IAssetAgreement(_listing.agreement).transferFrom(
+            assetOwner,
+            msg.sender,
+            _listing.tokenId
+        );
+
+        // an on-chain sale status does not survive the sale either
+        if (forSale) {
+            IAssetAgreement(_listing.agreement).updateSaleStatus(
+                _listing.tokenId,
+                false
+            );
+        }
+
+        processPayment(_listing.price, originalOwner, assetOwner, ownerRoyalty);
+
+        emit Purchase(
+            _listing.agreement,
+            assetOwner,
+            msg.sender,
+            _listing.tokenId,
+            _listing.price
+        );
+
+        return _listing.price;
+    }
+
+    /**
+     * Purchase an asset from a signed listing and record the hash of its
+     * watermarked image in the same transaction
+     *
+     * @param _listing the listing signed by the seller
+     * @param _signature the seller's EIP-712 signature of the listing
+     * @param _hash the hash of the watermarked image
+     * @param _hashSignature the Market owner's signature of the sale, see purchaseWithHash
+     */
+    function purchaseListing(
+        Listing calldata _listing,
+        bytes calldata _signature,
+        bytes32 _hash,
+        bytes calldata _hashSignature
+    ) public payable noReEntrancy {
+        recordAuthorizedHash(
+            _listing.agreement,
+            _listing.tokenId,
+            _hash,
+            _hashSignature
+        );
+
+        refundExcess(fillListing(_listing, _signature));
+    }
+
+    /**
+     * Checks the optional hashes of a batch purchase: either none, or one
+     * hash and one Market owner's signature per asset
+     *
+     * @param _count the number of assets in the batch
+     * @param _hashes the hash of every watermarked image, or none
+     * @param _hashSignatures the Market owner's signature of every sale, or none
+     */
+    function requireBatchHashes(
+        uint256 _count,
+        bytes32[] calldata _hashes,
+        bytes[] calldata _hashSignatures
+    ) private pure {
+        require(
+            _hashes.length == _hashSignatures.length &&
+                (_hashes.length == 0 || _hashes.length == _count),
+            "Hashes and signatures must match the assets!"
+        );
+    }
+
+    /**
+     * Purchase several signed listings in a single transaction. msg.value
+     * must cover the sum of their prices, the excess is refunded.
+     *
+     * The hash of every sale is recorded in the same transaction, each
+     * authorized like in purchaseWithHash. Pass no hashes when they are
+     * committed per epoch instead (see commitSaleRoot).
+     *
+     * @param _listings the listings signed by their sellers
+     * @param _signatures the sellers' EIP-712 signatures of the listings
+     * @param _hashes the hash of every watermarked image, or none
+     * @param _hashSignatures the Market owner's signature of every sale, or none
+     */
+    function purchaseListingBatch(
+        Listing[] calldata _listings,
+        bytes[] calldata _signatures,
+        bytes32[] calldata _hashes,
+        bytes[] calldata _hashSignatures
+    ) public payable noReEntrancy {
+        require(
+            _listings.length == _signatures.length,
+            "Listings and signatures must be same length!"
+        );
+        requireBatchHashes(_listings.length, _hashes, _hashSignatures);
+
+        uint256 total = 0;
+
+        for (uint256 i = 0; i < _listings.length; i++) {
+            if (_hashes.length > 0) {
+                recordAuthorizedHash(
+                    _listings[i].agreement,
+                    _listings[i].tokenId,
+                    _hashes[i],
+                    _hashSignatures[i]
+                );
+            }
+
+            total += fillListing(_listings[i], _signatures[i]);
+        }
+
+        refundExcess(total);
+    }
+
+    /**
+     * Purchase several assets, possibly across agreements, in a single
+     * transaction. msg.value must cover the sum of their prices, the excess
+     * is refunded.
+     *
+     * The hash of every sale is recorded in the same transaction, each
+     * authorized like in purchaseWithHash. Pass no hashes when they are
+     * committed per epoch instead (see commitSaleRoot).
+     *
+     * @param _agreements the Asset Agreement contract address of every asset
+     * @param _tokenIds the Token ID of every asset
+     * @param _hashes the hash of every watermarked image, or none
+     * @param _hashSignatures the Market owner's signature of every sale, or none
+     */
+    function purchaseBatch(
+        address[] calldata _agreements,
+        uint256[] calldata _tokenIds,
+        bytes32[] calldata _hashes,
+        bytes[] calldata _hashSignatures
+    ) public payable noReEntrancy {
+        require(
+            _agreements.length == _tokenIds.length,
+            "Agreements and Token IDs must be same length!"
+        );
+        requireBatchHashes(_tokenIds.length, _hashes, _hashSignatures);
+
+        uint256 total = 0;
+
+        for (uint256 i = 0; i < _tokenIds.length; i++) {
+            if (_hashes.length > 0) {
+                recordAuthorizedHash(
+                    _agreements[i],
+                    _tokenIds[i],
+                    _hashes[i],
+                    _hashSignatures[i]
+                );
+            }
+
+            total += settlePurchase(_agreements[i], _tokenIds[i]);
+        }
+
+        refundExcess(total);
     }
 }
@@ -4,6 +4,23 @@ pragma solidity ^0.8.0;
 import "erc721a/contracts/IERC721A.sol";
 
 interface IAssetAgreement is IERC721A {
+    /**
+     * Lazy mint voucher signed off chain (EIP-712) by the agreement owner.
+     * The asset is only minted when it is bought, see redeemVoucher.
+     */
+    struct Voucher {
+        uint256 voucherId; // chosen by the owner, a voucher is redeemed once
+        bytes32 assetDigest; // SHA-256 of the original asset
+        uint256 price; // sale price in wei
+        bool resaleAllowed; // whether the minted asset is allowed for resale
+    }
+
+    function redeemVoucher(
+        Voucher calldata _voucher,
+        bytes calldata _signature,
+        address _to
+    ) external returns (uint256);
+
     function getOwner() external view returns (address);
 
     function getOwnerRoyalty() external view returns (uint256);
@@ -18,6 +35,10 @@ interface IAssetAgreement is IERC721A {
 
     function priceOf(uint256 _tokenId) external view returns (uint256);
 
+    function saleInfo(
+        uint256 _tokenId
+    ) external view returns (uint256, bool, address, address, uint256);
+
     function updatePrice(uint256 _tokenId, uint256 _price) external;
 
     function updateHash(uint256 _tokenId, bytes32 _hash) external;
@@ -0,0 +1,63 @@
+// SPDX-License-Identifier: UNLICENSED
+pragma solidity ^0.8.0;
+
+/**
+ * Aggregates read-only calls to several contracts into a single eth_call
+ */
+contract Multicall {
+    struct Call {
+        address target;
+        bytes callData;
+    }
+
+    struct Result {
+        bool success;
+        bytes returnData;
+    }
+
+    /**
+     * Executes every call and reverts if any of them fails
+     *
+     * @param _calls the target contracts and their ABI encoded calls
+     */
+    function aggregate(
+        Call[] calldata _calls
+    ) public view returns (uint256 blockNumber, bytes[] memory returnData) {
+        blockNumber = block.number;
+        returnData = new bytes[](_calls.length);
+
+        for (uint256 i = 0; i < _calls.length; i++) {
+            (bool success, bytes memory data) = _calls[i].target.staticcall(
+                _calls[i].callData
+            );
+            require(success, "Multicall: call failed");
+            returnData[i] = data;
+        }
+    }
+
+    /**
+     * Executes every call and returns their success flags along with the
+     * results instead of reverting on the first failure
+     *
+     * @param _requireSuccess revert if any call fails
+     * @param _calls the target contracts and their ABI encoded calls
+     */
+    function tryAggregate(
+        bool _requireSuccess,
+        Call[] calldata _calls
+    ) public view returns (Result[] memory returnData) {
+        returnData = new Result[](_calls.length);
+
+        for (uint256 i = 0; i < _calls.length; i++) {
+            (bool success, bytes memory data) = _calls[i].target.staticcall(
+                _calls[i].callData
+            );
+
+            if (_requireSuccess) {
+                require(success, "Multicall: call failed");
+            }
+
+            returnData[i] = Result(success, data);
+        }
+    }
+}
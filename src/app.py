@@ -4,8 +4,10 @@ NFT Market Demo
 Author: David Yue
 """
 import streamlit as st
-from contract import AssetFactory, AssetMarket
+from contract import AssetFactory, AssetMarket, Multicall
 from provider import get_web3_provider
+from jobs import JobQueue
+from commitments import HASH_MODES, ONCHAIN, MERKLE, count_queued_sale_hashes, enqueue_commit_epoch
 
 from user_registration import UserRegistration
 from extract_watermark import ExtractWatermark
@@ -24,9 +26,13 @@ class NFTApp:
         self.market_contract_address = AssetMarket.deploy(
             eth_endpoint, self.web3.eth.accounts[0])[0]
 
+        # the factory's constructor deploys its implementation agreement bound to the market
         self.factory_address = AssetFactory.deploy(
             eth_endpoint, self.web3.eth.accounts[0], self.market_contract_address)[0]
 
+        self.multicall_address = Multicall.deploy(
+            eth_endpoint, self.web3.eth.accounts[0])[0]
+
         # self.owner_registration = OwnerRegistration(
         #     self.factory_address, self.market_contract_address)
         # self.buyer_registration = BuyerRegistration()
@@ -36,7 +42,8 @@ class NFTApp:
         self.upload = Upload(self.factory_address,
                              self.market_contract_address)
         self.market = Market(self.market_contract_address)
-        self.dasboard = Dashboard(self.market_contract_address)
+        self.dasboard = Dashboard(
+            self.market_contract_address, self.multicall_address)
 
     def render_app(self):
 
@@ -58,6 +65,26 @@ class NFTApp:
                 help="Choose between LSB (Least Significant Bit) or SSL watermarking algorithm"
             )
             st.info(f"Current: **{watermark_method.upper()}** watermarking")
+
+            if "hash_mode" not in st.session_state:
+                st.session_state["hash_mode"] = ONCHAIN
+
+            hash_mode = st.selectbox(
+                "Sale Hash Recording",
+                options=HASH_MODES,
+                key="hash_mode",
+                format_func=lambda mode: "Merkle root per epoch" if mode == MERKLE else "On chain per sale",
+                help="Write every sale hash on chain, or commit the accumulated hashes as one Merkle root per epoch"
+            )
+
+            if hash_mode == MERKLE:
+                queued = count_queued_sale_hashes()
+                st.write("%d sale hash(es) waiting for the next epoch" % queued)
+
+                if st.button("Commit epoch", disabled=queued == 0):
+                    job_id = enqueue_commit_epoch(
+                        JobQueue(), self.market_contract_address, self.web3.eth.accounts[0])
+                    st.info(f"Commitment queued (job #{job_id})")
         
         user, dashboard, upload, market, extract = st.tabs(
             ["User Registration", "Dashboard", "Publish Asset", "Trade", "Identifiability/Traceability"])
@@ -0,0 +1,106 @@
+"""
+Process-wide registry of the Hardhat build artifacts (ABI and bytecode).
+
+Each artifact file is parsed once. Later lookups only stat the file: if its
+size or modification time changed, the content hash is recomputed and the
+artifact is reparsed only when the content actually differs.
+"""
+import os
+import pickle
+import threading
+from hashlib import sha256
+from json import loads
+
+
+class Artifact:
+
+    def __init__(self, filename: str, digest: str, abi: list, bytecode: str, signature: tuple) -> None:
+        self.filename = filename
+        self.sha256 = digest
+        self.abi = abi
+        self.bytecode = bytecode
+        self.signature = signature
+
+
+class ArtifactRegistry:
+
+    def __init__(self, snapshot_dir: str = None) -> None:
+        """
+        Args:
+            snapshot_dir: Optional directory where pre-parsed (pickled) artifacts
+            are stored, keyed by the content hash of the JSON artifact
+        """
+        self.snapshot_dir = snapshot_dir
+        self._artifacts: 'dict[str, Artifact]' = dict()
+        self._lock = threading.Lock()
+
+    def get(self, filename: str) -> Artifact:
+        st = os.stat(filename)
+        signature = (st.st_mtime_ns, st.st_size)
+
+        cached = self._artifacts.get(filename)
+
+        if cached is not None and cached.signature == signature:
+            return cached
+
+        with self._lock:
+            cached = self._artifacts.get(filename)
+
+            if cached is not None and cached.signature == signature:
+                return cached
+
+            with open(filename, "rb") as f:
+                data = f.read()
+
+            digest = sha256(data).hexdigest()
+
+            # touched but unchanged: keep the parsed artifact
+            if cached is not None and cached.sha256 == digest:
+                cached.signature = signature
+                return cached
+
+            abi, bytecode = self._load_snapshot(filename, digest) or self._parse(
+                filename, digest, data)
+
+            artifact = Artifact(filename, digest, abi, bytecode, signature)
+            self._artifacts[filename] = artifact
+
+            return artifact
+
+    def _snapshot_path(self, filename: str, digest: str):
+        name = os.path.splitext(os.path.basename(filename))[0]
+        return os.path.join(self.snapshot_dir, "%s.%s.pickle" % (name, digest))
+
+    def _load_snapshot(self, filename: str, digest: str):
+        if self.snapshot_dir is None:
+            return None
+
+        try:
+            with open(self._snapshot_path(filename, digest), "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def _parse(self, filename: str, digest: str, data: bytes):
+        artifact = loads(data)
+        abi, bytecode = artifact["abi"], artifact["bytecode"]
+
+        if self.snapshot_dir is not None:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            path = self._snapshot_path(filename, digest)
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump((abi, bytecode), f)
+            os.replace(path + ".tmp", path)
+
+        return abi, bytecode
+
+
+ARTIFACTS = ArtifactRegistry()
+
+
+def get_abi(filename: str):
+    return ARTIFACTS.get(filename).abi
+
+
+def get_bytecode(filename: str):
+    return ARTIFACTS.get(filename).bytecode
@@ -0,0 +1,267 @@
+"""
+asyncio counterpart of contract.py built on AsyncWeb3.
+
+Reads issued through one AsyncContractClient share a pooled aiohttp session
+and are bounded by a semaphore, so fanning out over hundreds of assets
+overlaps on the wire instead of paying the round trips one after another.
+
+Transactions go through Contract.send_contract_call on a worker thread, so
+they share the nonce manager (nonce.py) with the synchronous client, and are
+awaited on the endpoint's receipt tracker (receipts.py).
+
+Streamlit pages are synchronous: they use the client through SyncContractClient,
+which runs the coroutines on a background event loop thread.
+"""
+import asyncio
+import threading
+import aiohttp
+from web3 import AsyncWeb3, Web3
+from contract import Contract, get_contract_handle
+from artifacts import get_abi
+from receipts import get_receipt_tracker
+
+AGREEMENT_ARTIFACT = "artifacts/contracts/AssetAgreement.sol/AssetAgreement.json"
+FACTORY_ARTIFACT = "artifacts/contracts/AssetAgreementFactory.sol/AssetAgreementFactory.json"
+MARKET_ARTIFACT = "artifacts/contracts/AssetMarket.sol/AssetMarket.json"
+
+
+class AsyncContract:
+
+    def __init__(self, client: 'AsyncContractClient', contract, artifact: str, account: str = None) -> None:
+        self.client = client
+        self.w3 = client.w3
+        self.contract = contract
+        self.artifact = artifact
+        self.account = account
+
+    async def call(self, name: str, *args):
+        async with self.client.semaphore:
+            return await self.contract.get_function_by_name(name)(*args).call()
+
+    async def transact(self, name: str, *args, value: float = None, timeout: float = 600):
+        # signing holds the account's nonce lock, keep it off the event loop
+        call = get_contract_handle(self.client.endpoint, self.contract.address,
+                                   self.artifact).get_function_by_name(name)(*args)
+        tx_hash = await asyncio.to_thread(Contract.send_contract_call, call, value, self.account)
+
+        return await asyncio.wrap_future(get_receipt_tracker(self.client.endpoint).track(tx_hash, timeout))
+
+
+class AsyncAssetFactory(AsyncContract):
+
+    async def deploy_asset_agreement(self, name: str, symbol: str, market_address: str = None):
+        tx_receipt = await self.transact("createNewAssetAgreement", name, symbol, market_address)
+
+        data = self.contract.events.NewContract().process_receipt(tx_receipt)
+
+        return data[0]["args"]["contractAddress"], tx_receipt.gasUsed
+
+
+class AsyncAssetMarket(AsyncContract):
+
+    async def get_asset_sale_record(self, agreement_address: str, hash: bytes):
+        return await self.call("getAssetSaleRecord", agreement_address, hash)
+
+    async def find_sale_record(self, hash: bytes):
+        return await self.call("findSaleRecord", hash)
+
+    async def update_hash(self, agreement_address: str, tokenID: int, hash: bytes):
+        return await self.transact("updateHash", agreement_address, tokenID, hash)
+
+    async def update_sale_status(self, agreement: str, tokenID: int, status: bool):
+        return await self.transact("updateSaleStatus", agreement, tokenID, status)
+
+    async def update_price(self, agreement: str, tokenID: int, price: float):
+        return await self.transact("updatePrice", agreement, tokenID, Web3.to_wei(price, "ether"))
+
+    async def purchase(self, agreement_address: str, tokenID: int, price: float):
+        return await self.transact("purchase", agreement_address, tokenID, value=price)
+
+
+class AsyncAssetAgreement(AsyncContract):
+
+    async def owner_of(self, tokenID: int):
+        return await self.call("ownerOf", tokenID)
+
+    async def get_next_token_id(self):
+        return await self.call("getNextTokenId")
+
+    async def fetch_asset_metadata(self, tokenID: int):
+        return await self.call("fetchAssetMetaData", tokenID)
+
+    async def fetch_assets_metadata(self, tokenIDs: 'list[int]'):
+        return await self.call("fetchAssetsMetaData", tokenIDs)
+
+    async def tokens_of_owner(self, address: str):
+        return await self.call("tokensOfOwner", address)
+
+    async def get_owner(self):
+        return await self.call("getOwner")
+
+    async def get_owner_of_asset_from_hash(self, hash: bytes):
+        return await self.call("getOwnerOfAssetFromHash", hash)
+
+    async def price_of(self, tokenID: int):
+        value = await self.call("priceOf", tokenID)
+        return float(Web3.from_wei(value, "ether"))
+
+    async def is_for_sale(self, tokenID: int):
+        return await self.call("isForSale", tokenID)
+
+    async def is_resale_allowed(self, tokenID: int):
+        return await self.call("isResaleAllowed", tokenID)
+
+    async def set_approval_for_all(self, operator: str, approved: bool):
+        return await self.transact("setApprovalForAll", operator, approved)
+
+
+class AsyncContractClient:
+
+    def __init__(self, endpoint: str, max_concurrency: int = 32, pool_size: int = 64) -> None:
+        """
+        Args:
+            max_concurrency: Maximum number of requests in flight
+            pool_size: Maximum number of keep-alive connections to the node
+
+        Must be created inside the event loop it is used from.
+        """
+        self.endpoint = endpoint
+        self.pool_size = pool_size
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(endpoint))
+        self._session: aiohttp.ClientSession = None
+        self._contracts = dict()
+
+    async def connect(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size))
+            await self.w3.provider.cache_async_session(self._session)
+        return self
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _contract(self, address: str, artifact: str):
+        # handles carry no account, one per address is enough
+        if address not in self._contracts:
+            self._contracts[address] = self.w3.eth.contract(
+                address=address, abi=get_abi(artifact))
+        return self._contracts[address]
+
+    def agreement(self, address: str, account: str = None) -> AsyncAssetAgreement:
+        return AsyncAssetAgreement(self, self._contract(address, AGREEMENT_ARTIFACT), AGREEMENT_ARTIFACT, account)
+
+    def market(self, address: str, account: str = None) -> AsyncAssetMarket:
+        return AsyncAssetMarket(self, self._contract(address, MARKET_ARTIFACT), MARKET_ARTIFACT, account)
+
+    def factory(self, address: str, account: str = None) -> AsyncAssetFactory:
+        return AsyncAssetFactory(self, self._contract(address, FACTORY_ARTIFACT), FACTORY_ARTIFACT, account)
+
+    async def gather(self, coros, return_exceptions: bool = False):
+        """Runs the coroutines concurrently, the semaphore bounds what is actually in flight"""
+        return await asyncio.gather(*coros, return_exceptions=return_exceptions)
+
+    async def fetch_assets_metadata(self, assets: 'dict[str, list[int]]'):
+        """
+        Fetches the metadata of assets spread over several agreements, one
+        concurrent call per agreement.
+
+        Returns:
+            dict mapping (agreement address, Token ID) to (price, hash, forSale, resaleAllowed, owner).
+            Assets of an agreement whose call failed are left out.
+        """
+        results = await self.gather([self.agreement(agreement).fetch_assets_metadata(token_ids)
+                                     for agreement, token_ids in assets.items()], return_exceptions=True)
+
+        metadata = dict()
+
+        for (agreement, token_ids), result in zip(assets.items(), results):
+
+            if isinstance(result, Exception):
+                continue
+
+            for token_id, asset in zip(token_ids, result):
+                metadata[(agreement, token_id)] = tuple(asset)
+
+        return metadata
+
+    async def fetch_holdings(self, address: str, agreements: 'list[str]'):
+        """
+        Returns the Token IDs a wallet holds in every agreement, one concurrent
+        call per agreement. Agreements where it holds nothing or whose call
+        failed are left out.
+        """
+        results = await self.gather([self.agreement(agreement).tokens_of_owner(address)
+                                     for agreement in agreements], return_exceptions=True)
+
+        return {agreement: list(result) for agreement, result in zip(agreements, results)
+                if not isinstance(result, Exception) and result}
+
+    async def fetch_owners(self, tokens: 'list[tuple[str, int]]'):
+        """Returns the holder of every (agreement address, Token ID), None if the call failed"""
+        results = await self.gather([self.agreement(agreement).owner_of(token_id)
+                                     for agreement, token_id in tokens], return_exceptions=True)
+
+        return [None if isinstance(r, Exception) else r for r in results]
+
+
+class SyncContractClient:
+    """
+    Blocking facade over AsyncContractClient for Streamlit pages.
+
+    The event loop (and with it the aiohttp session) lives on a daemon thread,
+    so it survives reruns and is shared by every session of the process.
+
+        client = get_sync_client(LOCAL_ENDPOINT)
+        metadata = client.run(client.client.fetch_assets_metadata(assets))
+    """
+
+    def __init__(self, endpoint: str, **kwargs) -> None:
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+        async def create():
+            return await AsyncContractClient(endpoint, **kwargs).connect()
+
+        self.client: AsyncContractClient = self.run(create())
+
+    def run(self, coro, timeout: float = None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def fetch_assets_metadata(self, assets: 'dict[str, list[int]]'):
+        return self.run(self.client.fetch_assets_metadata(assets))
+
+    def fetch_holdings(self, address: str, agreements: 'list[str]'):
+        return self.run(self.client.fetch_holdings(address, agreements))
+
+    def fetch_owners(self, tokens: 'list[tuple[str, int]]'):
+        return self.run(self.client.fetch_owners(tokens))
+
+    def close(self):
+        self.run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+SYNC_CLIENTS: 'dict[str, SyncContractClient]' = dict()
+SYNC_CLIENTS_LOCK = threading.Lock()
+
+
+def get_sync_client(endpoint: str) -> SyncContractClient:
+    """Returns the process-wide blocking client of an endpoint, starting it on first use"""
+
+    with SYNC_CLIENTS_LOCK:
+        if endpoint not in SYNC_CLIENTS:
+            SYNC_CLIENTS[endpoint] = SyncContractClient(endpoint)
+
+    return SYNC_CLIENTS[endpoint]
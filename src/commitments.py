@@ -0,0 +1,250 @@
+"""
+Merkle commitments of sale hashes. In the "merkle" hash mode a purchase writes
+no hash on chain: its sale leaf is queued locally and commit_epoch() commits
+the root of every queued leaf with a single AssetMarket.commitSaleRoot
+transaction. The proof of every leaf is kept so that any sale can later be
+verified against its epoch root with AssetMarket.verifySaleHash.
+
+An epoch is persisted before its root is submitted: its number is assigned to
+its leaves and a pending sale_roots row holds the root. A retry after a crash
+commits exactly that leaf set, whatever was queued since.
+
+Trees follow OpenZeppelin's MerkleProof: pairs are sorted before hashing and
+the last node of an odd level is carried up unchanged.
+
+Usage (from the repository root):
+    python src/commitments.py --commit
+"""
+import argparse
+import time
+from json import loads, dumps
+from eth_abi import encode
+from web3 import Web3
+from web3.exceptions import ContractLogicError
+from db import get_demo_db
+from contract import AssetMarket, get_web3_provider
+from constants import LOCAL_ENDPOINT
+from ledger import record_fee, COMMIT_SALE_ROOT
+from traceability import confirm_sale_hash
+
+# every sale writes its hash on chain
+ONCHAIN = "onchain"
+# sale hashes are committed as one Merkle root per epoch
+MERKLE = "merkle"
+
+HASH_MODES = [ONCHAIN, MERKLE]
+
+# status of an epoch in sale_roots
+PENDING = "pending"
+COMMITTED = "committed"
+
+
+def sale_leaf(agreement: str, token_id: int, img_hash: bytes) -> bytes:
+    """Same as AssetMarket.saleLeaf"""
+    return Web3.keccak(Web3.keccak(encode(["address", "uint256", "bytes32"], [agreement, token_id, img_hash])))
+
+
+def _hash_pair(a: bytes, b: bytes) -> bytes:
+    return Web3.keccak(a + b if a < b else b + a)
+
+
+def merkle_tree(leaves: 'list[bytes]'):
+    """
+    Returns:
+        (root, proof of every leaf)
+    """
+    proofs = [[] for _ in leaves]
+    # position of every leaf's ancestor in the current level
+    positions = list(range(len(leaves)))
+    level = list(leaves)
+
+    while len(level) > 1:
+        for leaf, i in enumerate(positions):
+            if i ^ 1 < len(level):
+                proofs[leaf].append(level[i ^ 1])
+            positions[leaf] = i // 2
+
+        level = [_hash_pair(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+
+    return level[0], proofs
+
+
+def queue_sale_hash(img_hash: bytes, agreement: str, token_id: int):
+    """Queues the leaf of a settled sale for the next epoch"""
+    con = get_demo_db()
+    # a leaf already assigned to an epoch must keep it
+    con.execute("INSERT OR IGNORE INTO sale_leaves (hash, agreement, token_id, leaf, created_at) VALUES (?, ?, ?, ?, ?)", [
+        img_hash.hex(), agreement, token_id, sale_leaf(agreement, token_id, img_hash).hex(), time.time()])
+    con.commit()
+    con.close()
+
+
+def get_sale_proof(img_hash: bytes):
+    """
+    Returns:
+        (epoch, proof) of a queued sale hash, epoch is None until committed,
+        or None if the hash was never queued
+    """
+    con = get_demo_db()
+    res = con.execute(
+        "SELECT epoch, proof FROM sale_leaves WHERE hash = ?", [img_hash.hex()])
+    row = res.fetchone()
+    con.close()
+
+    if row is None:
+        return None
+
+    epoch, proof = row
+
+    # assigned to an epoch whose root is not committed yet
+    if proof is None:
+        return None, []
+
+    return epoch, [bytes.fromhex(p) for p in loads(proof)]
+
+
+def count_queued_sale_hashes() -> int:
+    """Sale hashes not committed yet, including those of a pending epoch"""
+    con = get_demo_db()
+    res = con.execute("SELECT COUNT(*) FROM sale_leaves WHERE proof IS NULL")
+    count, = res.fetchone()
+    con.close()
+    return count
+
+
+def _assign_epoch(con):
+    """
+    Assigns every queued leaf to the next epoch and records its root as
+    pending, in one database transaction.
+
+    Returns:
+        the epoch, or None if no leaf was queued
+    """
+    res = con.execute(
+        "SELECT hash, leaf FROM sale_leaves WHERE epoch IS NULL ORDER BY rowid")
+    rows = res.fetchall()
+
+    if not rows:
+        return None
+
+    res = con.execute("SELECT COALESCE(MAX(epoch) + 1, 0) FROM sale_roots")
+    epoch, = res.fetchone()
+
+    root, _ = merkle_tree([bytes.fromhex(leaf) for _, leaf in rows])
+
+    con.execute("INSERT INTO sale_roots (epoch, root, leaf_count, status, created_at) VALUES (?, ?, ?, ?, ?)", [
+        epoch, root.hex(), len(rows), PENDING, time.time()])
+    con.executemany("UPDATE sale_leaves SET epoch = ? WHERE hash = ?", [
+        (epoch, img_hash) for img_hash, _ in rows])
+    con.commit()
+
+    return epoch
+
+
+def commit_epoch(endpoint: str, market_address: str, manager_address: str):
+    """
+    Commits the Merkle root of every queued sale leaf as the next epoch and
+    stores the proof of each leaf. An epoch left pending by a previous attempt
+    is committed first, with exactly the leaves assigned to it.
+
+    Returns:
+        dict summarizing the commitment, or None if no leaf was queued
+    """
+    con = get_demo_db()
+    res = con.execute(
+        "SELECT epoch, root FROM sale_roots WHERE status = ? ORDER BY epoch LIMIT 1", [PENDING])
+    row = res.fetchone()
+
+    if row is not None:
+        epoch, pending_root = row
+    else:
+        epoch = _assign_epoch(con)
+
+        if epoch is None:
+            con.close()
+            return None
+
+        pending_root = None
+
+    res = con.execute(
+        "SELECT hash, leaf FROM sale_leaves WHERE epoch = ? ORDER BY rowid", [epoch])
+    rows = res.fetchall()
+
+    root, proofs = merkle_tree([bytes.fromhex(leaf) for _, leaf in rows])
+
+    if pending_root is not None and root.hex() != pending_root:
+        con.close()
+        raise RuntimeError(
+            "Leaves of pending epoch %d no longer match its root" % epoch)
+
+    market = AssetMarket(endpoint, market_address, manager_address)
+    gas_used, fee_eth = 0, 0
+    block_number = tx_hash = None
+
+    committed_root = market.get_sale_root(epoch)
+
+    if committed_root == bytes(32):
+        # a transaction of a previous attempt may commit the same root meanwhile
+        try:
+            receipt = market.commit_sale_root(epoch, root)
+        except ContractLogicError:
+            if market.get_sale_root(epoch) != root:
+                con.close()
+                raise
+            receipt = None
+
+        if receipt is not None:
+            if receipt.status != 1 and market.get_sale_root(epoch) != root:
+                con.close()
+                raise RuntimeError("commitSaleRoot transaction %s reverted" %
+                                   receipt.transactionHash.to_0x_hex())
+
+            gas_used, fee_eth = record_fee(receipt, COMMIT_SALE_ROOT)
+
+            if receipt.status == 1:
+                block_number, tx_hash = receipt.blockNumber, receipt.transactionHash.to_0x_hex()
+    elif committed_root != root:
+        con.close()
+        raise RuntimeError(
+            "Epoch %d is committed on chain with another root" % epoch)
+
+    con.execute("UPDATE sale_roots SET status = ?, block_number = ?, tx_hash = ? WHERE epoch = ?", [
+        COMMITTED, block_number, tx_hash, epoch])
+    con.executemany("UPDATE sale_leaves SET proof = ? WHERE hash = ?", [
+        (dumps([p.hex() for p in proof]), img_hash) for (img_hash, _), proof in zip(rows, proofs)])
+    con.commit()
+    con.close()
+
+    for img_hash, _ in rows:
+        confirm_sale_hash(bytes.fromhex(img_hash), block_number, tx_hash)
+
+    return {
+        "epoch": epoch,
+        "root": root.hex(),
+        "leaf_count": len(rows),
+        "total_gas": gas_used,
+        "total_fee_eth": str(fee_eth),
+    }
+
+
+def enqueue_commit_epoch(queue, market_address: str, manager_address: str) -> int:
+    """Queues a commit_epoch job for the workers, at most one is in flight"""
+    return queue.enqueue("commit_epoch", {
+        "market_address": market_address,
+        "manager_address": manager_address,
+    }, idempotency_key="commit_epoch", subject="commitments")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commit", action="store_true",
+                        help="Commit the queued sale hashes as a new epoch")
+    params = parser.parse_args()
+
+    if params.commit:
+        with open("contracts.json", "r") as f:
+            market_address = loads(f.read())["market"][0]
+
+        print(commit_epoch(LOCAL_ENDPOINT, market_address,
+                           get_web3_provider(LOCAL_ENDPOINT).eth.accounts[0]))
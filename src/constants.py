@@ -1 +1,4 @@
 LOCAL_ENDPOINT = "http://127.0.0.1:8545/"
+
+# blocks mined on top of a transaction before its receipt is handed out
+RECEIPT_CONFIRMATIONS = 0
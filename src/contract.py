@@ -1,8 +1,51 @@
 from web3 import Web3
+from web3.logs import DISCARD
+from eth_utils.abi import get_abi_output_types
+from eth_account.messages import encode_defunct
+from hexbytes import HexBytes
 from provider import get_web3_provider
+from nonce import get_nonce_manager
+from receipts import get_receipt_tracker
+from artifacts import get_abi, get_bytecode
 from json import loads, dumps
-
-PROVIDER_CACHE: 'dict[str, Web3]' = dict()
+from collections import OrderedDict
+import threading
+
+# fields of AssetMarket.Listing, in their EIP-712 order
+LISTING_FIELDS = [("seller", "address"), ("agreement", "address"), ("tokenId", "uint256"),
+                  ("price", "uint256"), ("nonce", "uint256"), ("deadline", "uint256")]
+
+CONTRACT_CACHE_SIZE = 1024
+CONTRACT_CACHE: 'OrderedDict[tuple, object]' = OrderedDict()
+CONTRACT_CACHE_LOCK = threading.Lock()
+
+
+# fields of IAssetAgreement.Voucher, in their EIP-712 order
+VOUCHER_FIELDS = [("voucherId", "uint256"), ("assetDigest", "bytes32"),
+                  ("price", "uint256"), ("resaleAllowed", "bool")]
+
+
+def typed_data(primary_type: str, fields: list, message: dict, domain_name: str, chain_id: int, verifying_contract: str):
+    """Full EIP-712 typed data of a struct, for a contract using OpenZeppelin's EIP712(domain_name, "1")"""
+    return {
+        "types": {
+            "EIP712Domain": [
+                {"name": "name", "type": "string"},
+                {"name": "version", "type": "string"},
+                {"name": "chainId", "type": "uint256"},
+                {"name": "verifyingContract", "type": "address"},
+            ],
+            primary_type: [{"name": name, "type": type} for name, type in fields],
+        },
+        "primaryType": primary_type,
+        "domain": {
+            "name": domain_name,
+            "version": "1",
+            "chainId": chain_id,
+            "verifyingContract": verifying_contract,
+        },
+        "message": {name: message[name] for name, _ in fields},
+    }
 
 
 def ContractDeployOnce(contract_name: str):
@@ -27,30 +70,6 @@ def ContractDeployOnce(contract_name: str):
     return Decorator
 
 
-def get_web3_provider(endpoint):
-
-    if endpoint not in PROVIDER_CACHE or not PROVIDER_CACHE[endpoint].is_connected():
-        PROVIDER_CACHE[endpoint] = Web3(Web3.HTTPProvider(
-            endpoint, request_kwargs={'verify': False}))
-        # PROVIDER_CACHE[endpoint].eth.set_gas_price_strategy(medium_gas_price_strategy)
-    return PROVIDER_CACHE[endpoint]
-
-
-def get_abi(filename):
-
-    abi_file = open(filename, "r")
-    data = loads(abi_file.read())["abi"]
-    abi_file.close()
-    return data
-
-
-def get_bytecode(filename):
-    bytecode_file = open(filename, "r")
-    data = loads(bytecode_file.read())["bytecode"]
-    bytecode_file.close()
-    return data
-
-
 def get_market_abi():
 
     return get_abi("artifacts/contracts/AssetMarket.sol/AssetMarket.json")
@@ -88,37 +107,69 @@ def get_agreement_erc1155_bytecode():
     return get_bytecode("artifacts/contracts/AssetAgreementERC1155.sol/AssetAgreement.json")
 
 
-def get_Agreement_contract(endpoint: str, address: str, account: str):
-    w3 = get_web3_provider(endpoint)
-    w3.eth.default_account = account
-    return w3.eth.contract(address=address, abi=get_agreement_abi())
+def get_contract_handle(endpoint: str, address: str, artifact: str):
+    """
+    Returns a prepared contract handle from a bounded LRU cache.
+
+    Handles do not carry an account: the sender is passed explicitly when a
+    transaction is sent, so one handle is safe to share between sessions and threads.
+    """
+    key = (endpoint, address, artifact)
+
+    with CONTRACT_CACHE_LOCK:
+        handle = CONTRACT_CACHE.get(key)
+
+        if handle is not None:
+            CONTRACT_CACHE.move_to_end(key)
+            return handle
+
+    handle = get_web3_provider(endpoint).eth.contract(
+        address=address, abi=get_abi(artifact))
+
+    with CONTRACT_CACHE_LOCK:
+        CONTRACT_CACHE[key] = handle
+        CONTRACT_CACHE.move_to_end(key)
+
+        while len(CONTRACT_CACHE) > CONTRACT_CACHE_SIZE:
+            CONTRACT_CACHE.popitem(last=False)
+
+    return handle
 
 
-def get_Agreement_ERC1155_contract(endpoint: str, address: str, account: str):
-    w3 = get_web3_provider(endpoint)
-    w3.eth.default_account = account
-    return w3.eth.contract(address=address, abi=get_agreement_erc1155_abi())
+def get_multicall_abi():
 
+    return get_abi("artifacts/contracts/Multicall.sol/Multicall.json")
 
-def get_AssetFactory_contract(endpoint: str, address: str, account: str):
-    w3 = get_web3_provider(endpoint)
-    w3.eth.default_account = account
-    return w3.eth.contract(address=address, abi=get_factory_abi())
 
+def get_multicall_bytecode():
 
-def get_Market_contract(endpoint: str, address: str, account: str):
+    return get_bytecode("artifacts/contracts/Multicall.sol/Multicall.json")
 
-    w3 = get_web3_provider(endpoint)
-    w3.eth.default_account = account
 
-    return w3.eth.contract(address=address, abi=get_market_abi())
+def get_Agreement_contract(endpoint: str, address: str):
+    return get_contract_handle(endpoint, address, "artifacts/contracts/AssetAgreement.sol/AssetAgreement.json")
+
+
+def get_Agreement_ERC1155_contract(endpoint: str, address: str):
+    return get_contract_handle(endpoint, address, "artifacts/contracts/AssetAgreementERC1155.sol/AssetAgreement.json")
+
+
+def get_AssetFactory_contract(endpoint: str, address: str):
+    return get_contract_handle(endpoint, address, "artifacts/contracts/AssetAgreementFactory.sol/AssetAgreementFactory.json")
+
+
+def get_Market_contract(endpoint: str, address: str):
+    return get_contract_handle(endpoint, address, "artifacts/contracts/AssetMarket.sol/AssetMarket.json")
+
+
+def get_Multicall_contract(endpoint: str, address: str):
+    return get_contract_handle(endpoint, address, "artifacts/contracts/Multicall.sol/Multicall.json")
 
 
 class Contract:
 
     PRIVATE_KEY: str = None
     W3_PROVIDER: Web3 = None
-    NONCE: int = None
 
     def __init__(self, w3_endpoint: str) -> None:
         self.endpoint = w3_endpoint
@@ -127,50 +178,98 @@ class Contract:
     def set_web3_provider(endpoint: str):
         Contract.W3_PROVIDER = get_web3_provider(endpoint)
 
-        if Contract.PRIVATE_KEY is not None:
-            Contract.W3_PROVIDER.eth.default_account = Contract.W3_PROVIDER.eth.account.from_key(
-                Contract.PRIVATE_KEY)
-
     @staticmethod
-    def send_contract_call(call, value: float = None):
+    def send_contract_call(call, value: float = None, sender: str = None, gas: int = None):
+        """
+        Submits a transaction without waiting for it to be mined.
 
-        if Contract.PRIVATE_KEY is not None:
+        Transactions signed with PRIVATE_KEY take their nonce from the shared
+        nonce manager, so several transactions of the same account can be
+        submitted before the first receipt arrives, from any thread or
+        process. Unlocked node accounts are left to the node, which assigns
+        their nonces itself.
+
+        Returns:
+            the transaction hash
+        """
+        w3 = call.w3
+
+        if Contract.PRIVATE_KEY is None:
+            txn = {"from": sender if sender is not None else w3.eth.accounts[0]}
+
+            if value is not None:
+                txn["value"] = Web3.to_wei(value, "ether")
+
+            if gas is not None:
+                txn["gas"] = gas
 
-            txn = call.buildTransaction() if value is None else call.buildTransaction({
-                "value": Web3.to_wei(value, "ether")})
+            return call.transact(txn)
 
-            account_address = Contract.W3_PROVIDER.eth.account.from_key(
-                Contract.PRIVATE_KEY).address
+        sender = w3.eth.account.from_key(Contract.PRIVATE_KEY).address
+        nonces = get_nonce_manager(w3, str(w3.provider.endpoint_uri))
 
-            if Contract.NONCE is None:
-                Contract.NONCE = Contract.W3_PROVIDER.eth.get_transaction_count(
-                    account_address)
-            else:
-                Contract.NONCE += 1
+        def sign(nonce: int):
+            txn = {"from": sender, "nonce": nonce}
 
-            txn["nonce"] = Contract.NONCE
+            if value is not None:
+                txn["value"] = Web3.to_wei(value, "ether")
 
-            signed_txn = Contract.W3_PROVIDER.eth.account.sign_transaction(
-                txn, Contract.PRIVATE_KEY)
-            return Contract.W3_PROVIDER.eth.send_raw_transaction(signed_txn.rawTransaction)
-        else:
+            if gas is not None:
+                txn["gas"] = gas
 
-            return call.transact({'value': Web3.to_wei(value, "ether")}) if value is not None else call.transact()
+            return w3.eth.account.sign_transaction(call.build_transaction(txn), Contract.PRIVATE_KEY).raw_transaction
+
+        return nonces.submit(sender, sign, w3.eth.send_raw_transaction)
+
+    def wait_for_receipt(self, tx_hash, timeout: float = 600):
+        return get_receipt_tracker(self.endpoint).wait(tx_hash, timeout)
+
+    @staticmethod
+    def wait_for_receipts(endpoint: str, tx_hashes: list, timeout: float = 600):
+        """
+        Waits for several submitted transactions at once.
+
+        Returns:
+            the receipts, in the order of tx_hashes
+        """
+        return get_receipt_tracker(endpoint).wait_all(tx_hashes, timeout)
 
     @staticmethod
     def set_private_key(key: str):
         Contract.PRIVATE_KEY = key
 
+    def sign_message_hash(self, account: str, message: bytes):
+        """
+        EIP-191 signature of a 32 byte message hash, as checked on chain with
+        ECDSA.toEthSignedMessageHash
+        """
+        if Contract.PRIVATE_KEY is not None:
+            return self.w3.eth.account.sign_message(encode_defunct(primitive=message), Contract.PRIVATE_KEY).signature
+
+        # eth_sign applies the same "\x19Ethereum Signed Message:\n32" prefix
+        return self.w3.eth.sign(account, message)
+
+    def sign_typed_data(self, account: str, typed_data: dict):
+        """EIP-712 signature of full typed data (types, primaryType, domain, message)"""
+        if Contract.PRIVATE_KEY is not None:
+            return self.w3.eth.account.sign_typed_data(
+                Contract.PRIVATE_KEY, full_message=typed_data).signature
+
+        response = self.w3.provider.make_request(
+            "eth_signTypedData_v4", [account, dumps(typed_data)])
+
+        if "error" in response:
+            raise ValueError(response["error"])
+
+        return HexBytes(response["result"])
+
     def get_wallet_address(self, default=None):
 
         if Contract.PRIVATE_KEY is None:
 
             return self.w3.eth.accounts[0] if default is None else default
 
-        account = self.w3.eth.account.from_key(Contract.PRIVATE_KEY)
-        self.w3.eth.default_account = account.address
-
-        return account.address
+        return self.w3.eth.account.from_key(Contract.PRIVATE_KEY).address
 
 
 class AssetFactory(Contract):
@@ -178,35 +277,58 @@ class AssetFactory(Contract):
     def __init__(self, http_endpoint: str, factory_address: str, owner_address: str = None) -> None:
         super().__init__(http_endpoint)
         self.owner_address = self.get_wallet_address(default=owner_address)
+        self.account = self.owner_address
         self.factory_contract = get_AssetFactory_contract(
-            http_endpoint, factory_address, self.get_wallet_address(default=owner_address))
+            http_endpoint, factory_address)
 
-    def deploy_asset_agreement(self, name: str, symbol: str, market_address: str = None) -> str:
+    def deploy_asset_agreement(self, name: str, symbol: str, market_address: str = None, wait: bool = True):
+        """
+        Creates the caller's agreement as a minimal proxy clone, already
+        approving the market, in a single transaction.
+
+        Returns:
+            (agreement address, gas used), or the transaction hash if wait is False
+        """
 
         tx_hash = Contract.send_contract_call(self.factory_contract.functions.createNewAssetAgreement(name, symbol,
-                                                                                                      market_address))
-        tx_receipt = self.w3.eth.wait_for_transaction_receipt(
-            tx_hash, timeout=600)
+                                                                                                      market_address), sender=self.account)
 
-        data = self.factory_contract.events.NewContract().process_receipt(tx_receipt)
+        if not wait:
+            return tx_hash
 
-        contract_address = data[0]["args"]["contractAddress"]
+        tx_receipt = self.wait_for_receipt(tx_hash)
 
-        return contract_address, tx_receipt.gasUsed
+        return self.agreement_address_from_receipt(tx_receipt), tx_receipt.gasUsed
+
+    def agreement_address_from_receipt(self, tx_receipt) -> str:
+
+        data = self.factory_contract.events.NewContract().process_receipt(tx_receipt)
+
+        return data[0]["args"]["contractAddress"]
 
     @staticmethod
     @ContractDeployOnce("factory")
     def deploy(http_endpoint: str, owner_address: str, market_address: str):
-        w3 = Web3(Web3.HTTPProvider(http_endpoint))
-        w3.eth.default_account = owner_address
+        """
+        Deploys the factory. Its constructor also deploys the implementation
+        agreement every agreement is cloned from, owned by the factory: the
+        deployment costs about one full agreement more, and the market must
+        already be deployed (see NFTApp). A factory address recorded in
+        contracts.json by an older build has no implementation and must be
+        removed so that it is redeployed.
+
+        Returns:
+            (factory address, gas used)
+        """
+        w3 = get_web3_provider(http_endpoint)
 
         w3_contract = w3.eth.contract(
             abi=get_factory_abi(), bytecode=get_factory_bytecode())
 
         tx_hash = Contract.send_contract_call(
-            w3_contract.constructor(market_address))
+            w3_contract.constructor(market_address), sender=owner_address)
 
-        tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+        tx_receipt = get_receipt_tracker(http_endpoint).wait(tx_hash)
 
         return tx_receipt.contractAddress, tx_receipt.gasUsed
 
@@ -217,81 +339,292 @@ class AssetMarket(Contract):
         super().__init__(http_endpoint)
         self.address = market_address
         self.buyer = self.get_wallet_address(default=buyer_address)
+        self.account = self.buyer
         self.market_contract = get_Market_contract(
-            http_endpoint, market_address, self.buyer)
+            http_endpoint, market_address)
 
     @staticmethod
     @ContractDeployOnce("market")
     def deploy(http_endpoint: str, wallet_address: str = None):
         w3 = get_web3_provider(http_endpoint)
-        w3.eth.default_account = wallet_address
 
         w3_contract = w3.eth.contract(
             abi=get_market_abi(), bytecode=get_market_bytecode())
 
-        tx_hash = Contract.send_contract_call(w3_contract.constructor())
+        tx_hash = Contract.send_contract_call(
+            w3_contract.constructor(), sender=wallet_address)
 
-        tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+        tx_receipt = get_receipt_tracker(http_endpoint).wait(tx_hash)
 
         return tx_receipt.contractAddress, tx_receipt.gasUsed
 
     def get_asset_sale_record(self, agreement_address: str, hash: bytes):
         return self.market_contract.functions.getAssetSaleRecord(agreement_address, hash).call()
 
-    def update_hash(self, agreement_address: str, tokenID: int, hash: bytes):
+    def find_sale_record(self, hash: bytes):
+        """
+        Looks a hash up in every agreement at once
+
+        Returns:
+            (agreement address, holder address, Token ID)
+        """
+        return self.market_contract.functions.findSaleRecord(hash).call()
+
+    def find_purchase_receipt(self, agreement_address: str, tokenID: int, buyer_address: str):
+        """Receipt of the latest purchase of an asset by a buyer, from the Purchase events, or None"""
+        logs = self.market_contract.events.Purchase().get_logs(
+            from_block=0, argument_filters={"agreement": agreement_address})
+
+        for log in reversed(logs):
+            if log.args.to == buyer_address and log.args.tokenId == tokenID:
+                return self.w3.eth.get_transaction_receipt(log.transactionHash)
+
+        return None
+
+    def update_hash(self, agreement_address: str, tokenID: int, hash: bytes, wait: bool = True):
         tx_hash = Contract.send_contract_call(self.market_contract.functions.updateHash(
-            agreement_address, tokenID, hash))
-        return self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+            agreement_address, tokenID, hash), sender=self.account)
+        if not wait:
+            return tx_hash
+        return self.wait_for_receipt(tx_hash)
+
+    def update_hash_batch(self, agreement_addresses: 'list[str]', tokenIDs: 'list[int]', hashes: 'list[bytes]', wait: bool = True):
+        """Writes the hashes of several assets, possibly across agreements, in one transaction"""
+        tx_hash = Contract.send_contract_call(self.market_contract.functions.updateHashBatch(
+            agreement_addresses, tokenIDs, hashes), sender=self.account)
+        if not wait:
+            return tx_hash
+        return self.wait_for_receipt(tx_hash)
+
+    def commit_sale_root(self, epoch: int, root: bytes, wait: bool = True):
+        """Commits the Merkle root of an epoch's sale hashes, see commitments.py"""
+        tx_hash = Contract.send_contract_call(self.market_contract.functions.commitSaleRoot(
+            epoch, root), sender=self.account)
+        if not wait:
+            return tx_hash
+        return self.wait_for_receipt(tx_hash)
+
+    def get_sale_root(self, epoch: int) -> bytes:
+        return self.market_contract.functions.getSaleRoot(epoch).call()
+
+    def verify_sale_hash(self, epoch: int, agreement_address: str, tokenID: int, hash: bytes, proof: 'list[bytes]') -> bool:
+        return self.market_contract.functions.verifySaleHash(epoch, agreement_address, tokenID, hash, proof).call()
 
     def update_market_royalty(self, royalty: float):
 
         v = Web3.to_wei(royalty, "ether")
 
         tx_hash = Contract.send_contract_call(self.market_contract.functions.updateMarketRoyalty(
-            v))
-        return self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+            v), sender=self.account)
+        return self.wait_for_receipt(tx_hash)
 
     def withdraw_royalty(self, address: str):
 
         tx_hash = Contract.send_contract_call(self.market_contract.functions.withdrawRoyalty(
-            address))
+            address), sender=self.account)
+
+        return self.wait_for_receipt(tx_hash)
+
+    def balance_of(self, address: str) -> int:
+        """Escrowed sale proceeds of an account, in wei"""
+        return self.market_contract.functions.balanceOf(address).call()
+
+    def withdraw(self, wait: bool = True):
+        """Pays out this instance's account escrowed sale proceeds"""
+        tx_hash = Contract.send_contract_call(
+            self.market_contract.functions.withdraw(), sender=self.account)
+        if not wait:
+            return tx_hash
+        return self.wait_for_receipt(tx_hash)
 
-        return self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+    def withdraw_batch(self, addresses: 'list[str]', wait: bool = True):
+        """Pays out the escrowed sale proceeds of several accounts, each to itself, in one transaction"""
+        tx_hash = Contract.send_contract_call(
+            self.market_contract.functions.withdrawBatch(addresses), sender=self.account)
+        if not wait:
+            return tx_hash
+        return self.wait_for_receipt(tx_hash)
 
     def update_sale_status(self, agreement: str, tokenID: int, status: bool):
         tx_hash = Contract.send_contract_call(self.market_contract.functions.updateSaleStatus(
-            agreement,  tokenID, status))
+            agreement,  tokenID, status), sender=self.account)
 
-        return self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+        return self.wait_for_receipt(tx_hash)
 
     def update_price(self, agreement: str, tokenID: int, price: float):
         v = Web3.to_wei(price, "ether")
         tx_hash = Contract.send_contract_call(self.market_contract.functions.updatePrice(
-            agreement, tokenID, v))
-        return self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+            agreement, tokenID, v), sender=self.account)
+        return self.wait_for_receipt(tx_hash)
 
-    def purchase(self, agreement_address: str, tokenID: int, price: float):
+    def purchase(self, agreement_address: str, tokenID: int, price: float, wait: bool = True):
         tx_hash = Contract.send_contract_call(self.market_contract.functions.purchase(
-            agreement_address, tokenID), price)
-        return self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+            agreement_address, tokenID), price, sender=self.account)
+        if not wait:
+            return tx_hash
+        return self.wait_for_receipt(tx_hash)
+
+    def sign_sale_hash(self, agreement_address: str, tokenID: int, hash: bytes, buyer_address: str):
+        """
+        Authorizes a buyer to record the hash of a sale with purchaseWithHash.
+        Must be signed by the market owner (this instance's account).
+        """
+        message = Web3.solidity_keccak(
+            ["address", "uint256", "address", "uint256", "bytes32", "address"],
+            [self.address, self.w3.eth.chain_id, agreement_address, tokenID, hash, buyer_address])
+
+        return self.sign_message_hash(self.account, message)
+
+    def sign_voucher_sale_hash(self, agreement_address: str, voucher_id: int, hash: bytes, buyer_address: str):
+        """
+        Authorizes a buyer to record the hash of a lazy mint sale with
+        purchaseVoucher. Must be signed by the market owner.
+        """
+        message = Web3.solidity_keccak(
+            ["address", "uint256", "address", "string",
+                "uint256", "bytes32", "address"],
+            [self.address, self.w3.eth.chain_id, agreement_address, "voucher", voucher_id, hash, buyer_address])
+
+        return self.sign_message_hash(self.account, message)
+
+    def purchase_voucher(self, agreement_address: str, voucher: dict, signature: bytes, hash: bytes, hash_signature: bytes,
+                         wait: bool = True):
+        """
+        Mints the asset of a lazy mint voucher to the buyer, pays the owner and
+        records the hash in one transaction, see AssetAgreement.sign_voucher
+        """
+        tx_hash = Contract.send_contract_call(self.market_contract.functions.purchaseVoucher(
+            agreement_address, AssetAgreement.voucher_tuple(voucher), signature, hash, hash_signature),
+            Web3.from_wei(voucher["price"], "ether"), sender=self.account)
+        if not wait:
+            return tx_hash
+        return self.wait_for_receipt(tx_hash)
+
+    def purchase_with_hash(self, agreement_address: str, tokenID: int, hash: bytes, signature: bytes, price: float, wait: bool = True):
+        """Buys an asset and records its hash in one transaction, see sign_sale_hash"""
+        tx_hash = Contract.send_contract_call(self.market_contract.functions.purchaseWithHash(
+            agreement_address, tokenID, hash, signature), price, sender=self.account)
+        if not wait:
+            return tx_hash
+        return self.wait_for_receipt(tx_hash)
+
+    def listing_typed_data(self, listing: dict):
+        """EIP-712 typed data of a listing, as verified by AssetMarket.hashListing"""
+        return typed_data("Listing", LISTING_FIELDS, listing, "AssetMarket", self.w3.eth.chain_id, self.address)
+
+    def sign_listing(self, agreement_address: str, tokenID: int, price: float, nonce: int, deadline: int):
+        """
+        Signs a sale order for an asset held by this instance's account. No
+        transaction is sent, the listing is verified by the market at purchase.
+
+        Returns:
+            (listing dict with the price in wei, signature)
+        """
+        listing = {
+            "seller": self.account,
+            "agreement": agreement_address,
+            "tokenId": tokenID,
+            "price": Web3.to_wei(price, "ether"),
+            "nonce": nonce,
+            "deadline": deadline,
+        }
+
+        return listing, self.sign_typed_data(self.account, self.listing_typed_data(listing))
+
+    @staticmethod
+    def listing_tuple(listing: dict):
+        return tuple(listing[name] for name, _ in LISTING_FIELDS)
+
+    def is_listing_nonce_used(self, seller_address: str, nonce: int) -> bool:
+        return self.market_contract.functions.isListingNonceUsed(seller_address, nonce).call()
+
+    def cancel_listing(self, nonce: int, wait: bool = True):
+        """Cancels a listing of this instance's account on chain"""
+        tx_hash = Contract.send_contract_call(
+            self.market_contract.functions.cancelListing(nonce), sender=self.account)
+        if not wait:
+            return tx_hash
+        return self.wait_for_receipt(tx_hash)
+
+    def purchase_listing(self, listing: dict, signature: bytes, hash: bytes, hash_signature: bytes, wait: bool = True):
+        """
+        Buys an asset from a signed listing and records its hash in one
+        transaction, see sign_listing and sign_sale_hash
+        """
+        tx_hash = Contract.send_contract_call(self.market_contract.functions.purchaseListing(
+            self.listing_tuple(listing), signature, hash, hash_signature),
+            Web3.from_wei(listing["price"], "ether"), sender=self.account)
+        if not wait:
+            return tx_hash
+        return self.wait_for_receipt(tx_hash)
+
+    def purchase_listing_batch(self, listings: 'list[dict]', signatures: 'list[bytes]', hashes: 'list[bytes]' = None,
+                               hash_signatures: 'list[bytes]' = None, wait: bool = True):
+        """
+        Buys several signed listings in one transaction. With hashes, the hash
+        of every sale is recorded by the same transaction, see sign_sale_hash.
+        """
+        total_price = sum(listing["price"] for listing in listings)
+
+        tx_hash = Contract.send_contract_call(self.market_contract.functions.purchaseListingBatch(
+            [self.listing_tuple(listing) for listing in listings], signatures, hashes or [], hash_signatures or []),
+            Web3.from_wei(total_price, "ether"), sender=self.account)
+        if not wait:
+            return tx_hash
+        return self.wait_for_receipt(tx_hash)
+
+    def purchase_batch(self, agreement_addresses: 'list[str]', tokenIDs: 'list[int]', total_price: float,
+                       hashes: 'list[bytes]' = None, hash_signatures: 'list[bytes]' = None, wait: bool = True):
+        """
+        Buys several assets in one transaction. total_price (ETH) must cover
+        the sum of their prices, the contract refunds the excess. With hashes,
+        the hash of every sale is recorded by the same transaction, see
+        sign_sale_hash.
+        """
+        tx_hash = Contract.send_contract_call(self.market_contract.functions.purchaseBatch(
+            agreement_addresses, tokenIDs, hashes or [], hash_signatures or []), total_price, sender=self.account)
+        if not wait:
+            return tx_hash
+        return self.wait_for_receipt(tx_hash)
 
 
 class AssetAgreement(Contract):
 
     def __init__(self, http_endpoint: str, agreement_address: str, owner_address: str = None) -> None:
         super().__init__(http_endpoint)
+        self.account = self.get_wallet_address(default=owner_address)
         self.agreement_contract = get_Agreement_contract(
-            http_endpoint, agreement_address, self.get_wallet_address(default=owner_address))
+            http_endpoint, agreement_address)
 
     def owner_of(self, tokenID: int):
         return self.agreement_contract.functions.ownerOf(tokenID).call()
 
+    def tokens_of_owner(self, address: str) -> 'list[int]':
+        """Token IDs held by a wallet in this agreement"""
+        return self.agreement_contract.functions.tokensOfOwner(address).call()
+
+    def tokens_of_owner_in(self, address: str, start: int, stop: int) -> 'list[int]':
+        """Token IDs in [start, stop) held by a wallet, for agreements too large for one tokensOfOwner call"""
+        return self.agreement_contract.functions.tokensOfOwnerIn(address, start, stop).call()
+
     def get_next_token_id(self):
         return self.agreement_contract.functions.getNextTokenId().call()
 
     def fetch_asset_metadata(self, tokenID: int):
         return self.agreement_contract.functions.fetchAssetMetaData(tokenID).call()
 
+    def fetch_assets_metadata(self, tokenIDs: 'list[int]'):
+        """
+        Returns (price, hash, forSale, resaleAllowed, owner) of every token in one call
+        """
+        return self.agreement_contract.functions.fetchAssetsMetaData(tokenIDs).call()
+
+    def sale_info(self, tokenID: int):
+        """
+        Returns (price in wei, forSale, holder, original owner, owner royalty) in one call
+        """
+        return self.agreement_contract.functions.saleInfo(tokenID).call()
+
     def get_owner(self):
         return self.agreement_contract.functions.getOwner().call()
 
@@ -303,9 +636,9 @@ class AssetAgreement(Contract):
         v = Web3.to_wei(royalty, "ether")
 
         tx_hash = Contract.send_contract_call(self.agreement_contract.functions.updateOwnerRoyalty(
-            v))
+            v), sender=self.account)
 
-        return self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+        return self.wait_for_receipt(tx_hash)
 
     def get_market_address(self):
 
@@ -324,8 +657,8 @@ class AssetAgreement(Contract):
     def update_market_address(self, address: str):
 
         tx_hash = Contract.send_contract_call(self.agreement_contract.functions.updateMarketAddress(
-            address))
-        return self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+            address), sender=self.account)
+        return self.wait_for_receipt(tx_hash)
 
     def is_for_sale(self, tokenID: int):
 
@@ -338,30 +671,195 @@ class AssetAgreement(Contract):
     def update_sale_status(self, tokenID: int, status: bool):
 
         tx_hash = Contract.send_contract_call(self.agreement_contract.functions.updateSaleStatus(
-            tokenID, status))
+            tokenID, status), sender=self.account)
 
-        return self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+        return self.wait_for_receipt(tx_hash)
 
     def update_allow_resale_status(self, tokenID: int, status: bool):
         tx_hash = Contract.send_contract_call(self.agreement_contract.functions.updateAllowResaleStatus(
-            tokenID, status))
+            tokenID, status), sender=self.account)
 
-        return self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+        return self.wait_for_receipt(tx_hash)
 
     def mint(self, prices: 'list[float]', resaleAllowed: 'list[bool]'):
         v = list(map(lambda r: Web3.to_wei(r, "ether"), prices))
         tx_hash = Contract.send_contract_call(self.agreement_contract.functions.mint(
-            v, resaleAllowed))
+            v, resaleAllowed), sender=self.account)
 
-        return self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+        return self.wait_for_receipt(tx_hash)
 
-    def set_approval_for_all(self, operator: str, approved: bool):
+    def set_approval_for_all(self, operator: str, approved: bool, gas: int = None, wait: bool = True):
         tx_hash = Contract.send_contract_call(self.agreement_contract.functions.setApprovalForAll(
-            operator, approved))
-        return self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+            operator, approved), sender=self.account, gas=gas)
+        if not wait:
+            return tx_hash
+        return self.wait_for_receipt(tx_hash)
+
+    @staticmethod
+    def voucher_tuple(voucher: dict):
+        return tuple(voucher[name] for name, _ in VOUCHER_FIELDS)
+
+    def sign_voucher(self, voucher_id: int, asset_digest: bytes, price: float, resale_allowed: bool):
+        """
+        Signs a lazy mint voucher with the owner's account. No transaction is
+        sent, the asset is minted to its buyer by AssetMarket.purchaseVoucher.
+
+        Returns:
+            (voucher dict with the price in wei, signature)
+        """
+        voucher = {
+            "voucherId": voucher_id,
+            "assetDigest": asset_digest,
+            "price": Web3.to_wei(price, "ether"),
+            "resaleAllowed": resale_allowed,
+        }
+
+        data = typed_data("Voucher", VOUCHER_FIELDS, dict(voucher, assetDigest="0x" + asset_digest.hex()),
+                          "AssetAgreement", self.w3.eth.chain_id, self.agreement_contract.address)
+
+        return voucher, self.sign_typed_data(self.account, data)
+
+    def voucher_status(self, voucher_id: int):
+        """Returns (redeemed or cancelled, Token ID minted for it)"""
+        return self.agreement_contract.functions.voucherStatus(voucher_id).call()
+
+    def cancel_voucher(self, voucher_id: int):
+        tx_hash = Contract.send_contract_call(self.agreement_contract.functions.cancelVoucher(
+            voucher_id), sender=self.account)
+        return self.wait_for_receipt(tx_hash)
+
+    def voucher_token_from_receipt(self, tx_receipt) -> int:
+        """Token ID minted by a purchaseVoucher transaction"""
+        data = self.agreement_contract.events.VoucherRedeemed().process_receipt(tx_receipt)
+
+        return data[0]["args"]["tokenId"]
+
+    def find_voucher_redemption(self, voucher_id: int):
+        """
+        Returns:
+            (Token ID, buyer, receipt) of the purchase that redeemed a voucher,
+            None if it was never redeemed (open or cancelled)
+        """
+        logs = self.agreement_contract.events.VoucherRedeemed().get_logs(
+            from_block=0, argument_filters={"voucherId": voucher_id})
+
+        if not logs:
+            return None
+
+        args = logs[-1]["args"]
+
+        return args["tokenId"], args["to"], self.w3.eth.get_transaction_receipt(logs[-1]["transactionHash"])
+
+    def minted_tokens_from_receipt(self, tx_receipt) -> 'list[int]':
+        """Token IDs minted by a transaction, read from its Transfer events"""
+        data = self.agreement_contract.events.Transfer().process_receipt(tx_receipt, errors=DISCARD)
+
+        # a mint is a transfer from the zero address
+        return [event["args"]["tokenId"] for event in data
+                if event["address"] == self.agreement_contract.address and int(event["args"]["from"], 16) == 0]
+
+    def is_approved_for_all(self, holder: str, operator: str) -> bool:
+        return self.agreement_contract.functions.isApprovedForAll(holder, operator).call()
 
     def token_uri(self, tokenID: int):
 
         uri = self.agreement_contract.functions.tokenURI(tokenID).call()
 
         return uri
+
+
+class Multicall(Contract):
+
+    def __init__(self, http_endpoint: str, multicall_address: str) -> None:
+        super().__init__(http_endpoint)
+        self.multicall_contract = get_Multicall_contract(
+            http_endpoint, multicall_address)
+
+    @staticmethod
+    @ContractDeployOnce("multicall")
+    def deploy(http_endpoint: str, wallet_address: str = None):
+        w3 = get_web3_provider(http_endpoint)
+
+        w3_contract = w3.eth.contract(
+            abi=get_multicall_abi(), bytecode=get_multicall_bytecode())
+
+        tx_hash = Contract.send_contract_call(
+            w3_contract.constructor(), sender=wallet_address)
+
+        tx_receipt = get_receipt_tracker(http_endpoint).wait(tx_hash)
+
+        return tx_receipt.contractAddress, tx_receipt.gasUsed
+
+    def try_aggregate(self, calls: 'list[tuple]', require_success: bool = False):
+        """
+        Runs several view calls, possibly on different contracts, in a single eth_call.
+
+        Args:
+            calls: (contract handle, function name, args) tuples
+
+        Returns:
+            list with the decoded result of every call, None for calls that reverted
+        """
+        if not calls:
+            return []
+
+        encoded = [(handle.address, handle.encode_abi(name, args=list(args)))
+                   for handle, name, args in calls]
+
+        results = self.multicall_contract.functions.tryAggregate(
+            require_success, encoded).call()
+
+        decoded = []
+
+        for (handle, name, args), (success, data) in zip(calls, results):
+
+            if not success:
+                decoded.append(None)
+                continue
+
+            output_types = get_abi_output_types(
+                handle.get_function_by_name(name).abi)
+            values = self.w3.codec.decode(output_types, data)
+            decoded.append(values[0] if len(values) == 1 else values)
+
+        return decoded
+
+    def fetch_holdings(self, address: str, agreements: 'list[str]'):
+        """
+        Fetches the Token IDs a wallet holds in several agreements in one round trip.
+
+        Returns:
+            dict mapping every agreement address where the wallet holds
+            assets to their Token IDs. Agreements whose call reverted are left out.
+        """
+        calls = [(get_Agreement_contract(self.endpoint, agreement), "tokensOfOwner", (address,))
+                 for agreement in agreements]
+
+        return {agreement: list(token_ids) for agreement, token_ids in zip(agreements, self.try_aggregate(calls))
+                if token_ids}
+
+    def fetch_assets_metadata(self, assets: 'dict[str, list[int]]'):
+        """
+        Fetches the metadata of assets spread over several agreements in one round trip.
+
+        Args:
+            assets: maps an agreement address to the Token IDs to fetch
+
+        Returns:
+            dict mapping (agreement address, Token ID) to (price, hash, forSale, resaleAllowed, owner).
+            Assets of an agreement whose call reverted are left out.
+        """
+        calls = [(get_Agreement_contract(self.endpoint, agreement), "fetchAssetsMetaData", (token_ids,))
+                 for agreement, token_ids in assets.items()]
+
+        metadata = dict()
+
+        for (agreement, token_ids), result in zip(assets.items(), self.try_aggregate(calls)):
+
+            if result is None:
+                continue
+
+            for token_id, asset in zip(token_ids, result):
+                metadata[(agreement, token_id)] = asset
+
+        return metadata
@@ -1,6 +1,10 @@
 import streamlit as st
 from upload import Upload
-from contract import AssetAgreement, AssetMarket
+from contract import AssetAgreement, AssetMarket, Multicall
+from async_contract import get_sync_client
+from ledger import fees_by_operation, record_fee, APPROVE, CANCEL_VOUCHER, WITHDRAW
+from listings import create_listing, cancel_asset_listing, get_active_listings
+from vouchers import get_open_vouchers, cancel_voucher
 from PIL import Image
 from constants import LOCAL_ENDPOINT
 from web3 import Web3
@@ -10,8 +14,9 @@ from user_utils import get_user_display_options, get_user_from_display
 
 class Dashboard:
 
-    def __init__(self, market_address: str) -> None:
+    def __init__(self, market_address: str, multicall_address: str) -> None:
         self.market_address = market_address
+        self.multicall_address = multicall_address
 
     def render(self):
         st.write("## Dashboard")
@@ -29,56 +34,129 @@ class Dashboard:
         user = get_user_from_display(selected_display, user_data_dict)
 
         res = con.execute(
-            "SELECT users.wallet FROM users WHERE users.uname = ?", [user])
+            "SELECT users.id, users.wallet FROM users WHERE users.uname = ?", [user])
 
         if (d := res.fetchone()) is None:
             con.close()
             return
 
-        selected_user_wallet, = d
+        selected_user_id, selected_user_wallet = d
+
+        market = AssetMarket(
+            LOCAL_ENDPOINT, self.market_address, selected_user_wallet)
+        earnings = market.balance_of(selected_user_wallet)
+
+        # sale proceeds and royalties are escrowed by the market until withdrawn
+        c1, c2 = st.columns([3, 1])
+        c1.write("Earnings to withdraw: %f ETH" % Web3.from_wei(earnings, "ether"))
+
+        if c2.button("Withdraw", disabled=earnings == 0):
+            receipt = market.withdraw()
+            record_fee(receipt, WITHDRAW, selected_user_id)
+            st.rerun()
+
+        fees = fees_by_operation(selected_user_id)
+
+        if fees:
+            st.write("Gas fees paid: %.9f ETH over %d transactions" % (
+                sum(fee for _, _, _, fee in fees), sum(count for _, count, _, _ in fees)))
+
+            with st.expander("Fees by operation"):
+                for operation, count, gas, fee in fees:
+                    st.write("%s: %d transaction(s), %s gas, %.9f ETH" %
+                             (operation, count, f"{gas:,}", fee))
 
         res = con.execute(
-            "SELECT users.uname, users.agreement, assets.filepath, assets.token_id FROM users LEFT JOIN assets ON users.id = assets.owner_id")
-        images = res.fetchall()
+            "SELECT users.agreement, assets.token_id, users.uname, users.wallet, assets.filepath FROM users INNER JOIN assets ON users.id = assets.owner_id")
+        assets = {(agreement, token_id): (user_name, user_wallet, filepath)
+                  for agreement, token_id, user_name, user_wallet, filepath in res.fetchall()}
+
+        # tokensOfOwner scans the whole supply of an agreement: one concurrent
+        # call per agreement keeps each scan within the node's call gas cap,
+        # then one eth_call for the metadata of what the user holds
+        holdings = get_sync_client(LOCAL_ENDPOINT).fetch_holdings(
+            selected_user_wallet, sorted({agreement for agreement, _ in assets}))
+        multicall = Multicall(LOCAL_ENDPOINT, self.multicall_address)
+        metadata = multicall.fetch_assets_metadata(holdings)
 
-        for i, (user_name, user_agreement, asset_filepath, asset_token_id) in enumerate(images):
+        listings = get_active_listings()
 
-            if user_agreement is None:
+        for i, (user_agreement, asset_token_id) in enumerate(sorted(metadata)):
+
+            if (user_agreement, asset_token_id) not in assets:
                 continue
 
-            agreement = AssetAgreement(
-                LOCAL_ENDPOINT, user_agreement, selected_user_wallet)
+            user_name, user_wallet, asset_filepath = assets[(
+                user_agreement, asset_token_id)]
 
-            price, assetHash, forSale, resaleAllowed = agreement.fetch_asset_metadata(
-                asset_token_id)
+            price, assetHash, forSale, resaleAllowed, asset_owner = metadata[(
+                user_agreement, asset_token_id)]
 
-            if selected_user_wallet != agreement.owner_of(asset_token_id):
-                continue
+            listing = listings.get((user_agreement, asset_token_id))
+
+            # a listing of a previous holder does not count
+            if listing is not None and listing[1]["seller"] != asset_owner:
+                listing = None
+
+            if listing is not None:
+                price = listing[1]["price"]
 
             pil_img = Image.open(asset_filepath)
 
             pil_img = pil_img.resize((pil_img.width//4, pil_img.height//4))
 
-            st.image(pil_img, "Original Owner: %s. Price (%f ETH). Resale: %r. For Sale: %r" % (
-                user_name, Web3.from_wei(price, "ether"), resaleAllowed, forSale))
+            st.image(pil_img, "Original Owner: %s. Price (%f ETH). Resale: %r. Listed: %r" % (
+                user_name, Web3.from_wei(price, "ether"), resaleAllowed, listing is not None))
+
+            # listings are signed off chain: listing, repricing and delisting cost no gas,
+            # unless a queued purchase already holds the listing being replaced
+            can_list = asset_owner == user_wallet or resaleAllowed
+            c1, c2, c3 = st.columns(3)
+            new_price = c1.number_input("Price (ETH)", min_value=0.0, step=0.01, value=float(Web3.from_wei(price, "ether")),
+                                        disabled=not can_list, key="price-%d" % i)
+            list_asset = c2.button("Update listing" if listing else "List",
+                                   disabled=not can_list, key="list-%d" % i)
+            delist_asset = c3.button(
+                "Delist", disabled=listing is None, key="delist-%d" % i)
+
+            if list_asset:
+                agreement = AssetAgreement(
+                    LOCAL_ENDPOINT, user_agreement, selected_user_wallet)
+
+                # resellers approve the market once, the original owner always is
+                if not agreement.is_approved_for_all(selected_user_wallet, self.market_address):
+                    receipt = agreement.set_approval_for_all(
+                        self.market_address, True)
+                    record_fee(receipt, APPROVE, selected_user_id, user_agreement)
 
-            sale_status = st.button(
-                "Toggle Sale Status", disabled=not resaleAllowed, key=i)
+                create_listing(LOCAL_ENDPOINT, self.market_address, selected_user_wallet,
+                               user_agreement, asset_token_id, new_price)
+                st.rerun()
 
-            if sale_status:
+            if delist_asset:
+                cancel_asset_listing(LOCAL_ENDPOINT, self.market_address,
+                                     user_agreement, asset_token_id)
+                st.rerun()
 
-                new_sale_status = not forSale
-                market = AssetMarket(
-                    LOCAL_ENDPOINT, self.market_address, selected_user_wallet)
+        # published but not minted yet, withdrawing one cancels its voucher on chain
+        for voucher in get_open_vouchers(selected_user_id):
+            pil_img = Image.open(voucher["filepath"])
 
-                market.update_sale_status(
-                    user_agreement, asset_token_id, new_sale_status)
-                agreement = AssetAgreement(
-                    LOCAL_ENDPOINT, user_agreement, selected_user_wallet)
-                agreement.set_approval_for_all(self.market_address, True)
+            pil_img = pil_img.resize((pil_img.width//4, pil_img.height//4))
 
-                with st.expander("Log"):
-                    st.write("Updated For Sale status of Token %d to %r" %
-                             (asset_token_id, new_sale_status))
+            st.image(pil_img, "Not minted yet. Price (%f ETH). Resale: %r" % (
+                Web3.from_wei(voucher["voucher"]["price"], "ether"), voucher["voucher"]["resaleAllowed"]))
+
+            if st.button("Withdraw", key="voucher-%d" % voucher["id"]):
+                try:
+                    receipt = cancel_voucher(
+                        LOCAL_ENDPOINT, voucher["id"], selected_user_wallet)
+                except RuntimeError as e:
+                    st.error(str(e))
+                else:
+                    if receipt is not None:
+                        record_fee(receipt, CANCEL_VOUCHER,
+                                   selected_user_id, voucher["agreement"])
+                    st.rerun()
 
         con.close()
@@ -1,5 +1,45 @@
 import sqlite3
 
+JOBS_DB_PATH = "src/db/jobs.db"
+JOBS_SCHEMA_PATH = "src/db/jobs.sql"
+NONCES_DB_PATH = "src/db/nonces.db"
+NONCES_SCHEMA_PATH = "src/db/nonces.sql"
+DEMO_DB_PATH = "src/db/demo.db"
+INDEX_SCHEMA_PATH = "src/db/index.sql"
+
 
 def get_demo_db() -> sqlite3.Connection:
-    return sqlite3.connect("src/db/demo.db")
+    return sqlite3.connect(DEMO_DB_PATH)
+
+
+def get_jobs_db() -> sqlite3.Connection:
+    con = sqlite3.connect(JOBS_DB_PATH, timeout=30)
+    # the queue is shared by the web tier and the workers
+    con.execute("PRAGMA journal_mode=WAL")
+
+    with open(JOBS_SCHEMA_PATH, "r") as f:
+        con.executescript(f.read())
+
+    return con
+
+
+def get_nonces_db() -> sqlite3.Connection:
+    # autocommit mode, allocations run in explicit BEGIN IMMEDIATE transactions
+    con = sqlite3.connect(NONCES_DB_PATH, timeout=30, isolation_level=None)
+    con.execute("PRAGMA journal_mode=WAL")
+
+    with open(NONCES_SCHEMA_PATH, "r") as f:
+        con.executescript(f.read())
+
+    return con
+
+
+def get_index_db() -> sqlite3.Connection:
+    # the chain index lives next to users and assets so that pages can join them
+    con = sqlite3.connect(DEMO_DB_PATH, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+
+    with open(INDEX_SCHEMA_PATH, "r") as f:
+        con.executescript(f.read())
+
+    return con
@@ -0,0 +1,64 @@
+-- chain index maintained by src/indexer.py
+
+-- last indexed blocks with their hashes, used to detect reorgs
+CREATE TABLE IF NOT EXISTS indexed_blocks (
+    number INT PRIMARY KEY,
+    hash VARCHAR(66) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS agreements (
+    address VARCHAR(42) PRIMARY KEY,
+    owner VARCHAR(42) NOT NULL,
+    block_number INT NOT NULL,
+    tx_hash VARCHAR(66) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS transfers (
+    agreement VARCHAR(42) NOT NULL,
+    token_id INT NOT NULL,
+    from_address VARCHAR(42) NOT NULL,
+    to_address VARCHAR(42) NOT NULL,
+    block_number INT NOT NULL,
+    log_index INT NOT NULL,
+    tx_hash VARCHAR(66) NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+
+CREATE INDEX IF NOT EXISTS transfers_token ON transfers(agreement, token_id, block_number, log_index);
+
+CREATE TABLE IF NOT EXISTS approvals (
+    agreement VARCHAR(42) NOT NULL,
+    owner VARCHAR(42) NOT NULL,
+    operator VARCHAR(42) NOT NULL,
+    token_id INT, -- NULL for ApprovalForAll
+    approved BOOLEAN NOT NULL,
+    block_number INT NOT NULL,
+    log_index INT NOT NULL,
+    tx_hash VARCHAR(66) NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+
+CREATE TABLE IF NOT EXISTS trades (
+    agreement VARCHAR(42) NOT NULL,
+    token_id INT NOT NULL,
+    seller VARCHAR(42) NOT NULL,
+    buyer VARCHAR(42) NOT NULL,
+    price VARCHAR(78) NOT NULL, -- wei, does not fit an INT
+    block_number INT NOT NULL,
+    log_index INT NOT NULL,
+    tx_hash VARCHAR(66) NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+
+CREATE INDEX IF NOT EXISTS trades_token ON trades(agreement, token_id, block_number);
+
+-- current holder of every token, derived from transfers
+CREATE TABLE IF NOT EXISTS token_owners (
+    agreement VARCHAR(42) NOT NULL,
+    token_id INT NOT NULL,
+    owner VARCHAR(42) NOT NULL,
+    block_number INT NOT NULL,
+    PRIMARY KEY (agreement, token_id)
+);
+
+CREATE INDEX IF NOT EXISTS token_owners_owner ON token_owners(owner);
@@ -0,0 +1,26 @@
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind VARCHAR(64) NOT NULL,
+    idempotency_key VARCHAR(255) NOT NULL,
+    subject VARCHAR(255),
+    payload TEXT NOT NULL,
+    state VARCHAR(16) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    progress INT NOT NULL DEFAULT 0,
+    message TEXT,
+    result TEXT,
+    error TEXT,
+    available_at REAL NOT NULL,
+    locked_until REAL,
+    worker VARCHAR(255),
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+-- a job can only be in flight once per idempotency key, finished jobs do not block new ones
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_key ON jobs(idempotency_key) WHERE state IN ('pending', 'running');
+
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs(state, available_at);
+
+CREATE INDEX IF NOT EXISTS jobs_subject ON jobs(subject, id);
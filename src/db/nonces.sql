@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS nonces (
+    endpoint VARCHAR(255) NOT NULL,
+    account VARCHAR(42) NOT NULL,
+    next_nonce INT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (endpoint, account)
+);
@@ -11,4 +11,100 @@ CREATE TABLE assets (
     filepath VARCHAR(255) NOT NULL,
     token_id INT NOT NULL,
     FOREIGN KEY(owner_id) REFERENCES users(id)
-)
\ No newline at end of file
+);
+
+-- every watermarked hash written through AssetMarket.updateHash, for local traceability lookups
+CREATE TABLE sale_hashes (
+    hash VARCHAR(64) PRIMARY KEY, -- SHA-256 of the original asset followed by the seller and buyer IDs
+    asset_digest VARCHAR(64) NOT NULL, -- SHA-256 of the original asset
+    agreement VARCHAR(255) NOT NULL,
+    token_id INT NOT NULL,
+    seller_id INT NOT NULL,
+    buyer_id INT NOT NULL,
+    block_number INT,
+    tx_hash VARCHAR(66),
+    verified BOOLEAN NOT NULL DEFAULT 0, -- whether the chain currently records this hash
+    FOREIGN KEY(seller_id) REFERENCES users(id),
+    FOREIGN KEY(buyer_id) REFERENCES users(id)
+);
+
+CREATE INDEX sale_hashes_asset ON sale_hashes(asset_digest, block_number);
+
+-- sale hashes recorded off chain, committed as one Merkle root per epoch (see commitments.py)
+CREATE TABLE sale_leaves (
+    hash VARCHAR(64) PRIMARY KEY REFERENCES sale_hashes(hash),
+    agreement VARCHAR(255) NOT NULL,
+    token_id INT NOT NULL,
+    leaf VARCHAR(64) NOT NULL, -- AssetMarket.saleLeaf(agreement, token_id, hash)
+    epoch INT, -- NULL until assigned to an epoch, before its root is submitted
+    proof TEXT, -- JSON list of the sibling hashes up to the epoch root, NULL until committed
+    created_at REAL NOT NULL
+);
+
+CREATE INDEX sale_leaves_epoch ON sale_leaves(epoch);
+
+-- Merkle roots committed with AssetMarket.commitSaleRoot
+CREATE TABLE sale_roots (
+    epoch INTEGER PRIMARY KEY,
+    root VARCHAR(64) NOT NULL,
+    leaf_count INT NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'pending', -- pending (leaves assigned, root not mined yet), committed
+    block_number INT, -- NULL when a previous commit was found on chain instead of sent
+    tx_hash VARCHAR(66),
+    created_at REAL NOT NULL
+);
+
+-- gas and fees of every transaction sent by the app, taken from the receipts
+CREATE TABLE fee_ledger (
+    tx_hash VARCHAR(66) PRIMARY KEY,
+    operation VARCHAR(32) NOT NULL, -- deploy, approve, mint, updateHash, purchase
+    user_id INT, -- user on whose behalf the transaction was sent
+    sender VARCHAR(42) NOT NULL,
+    agreement VARCHAR(255),
+    token_id INT,
+    gas_used INT NOT NULL,
+    gas_price INT NOT NULL, -- effective gas price (wei)
+    fee_wei INT NOT NULL,
+    block_number INT NOT NULL,
+    created_at REAL NOT NULL,
+    FOREIGN KEY(user_id) REFERENCES users(id)
+);
+
+CREATE INDEX fee_ledger_user ON fee_ledger(user_id);
+
+CREATE INDEX fee_ledger_asset ON fee_ledger(agreement, token_id);
+
+-- sale orders signed off chain (EIP-712) by asset holders, verified by AssetMarket at purchase
+CREATE TABLE listings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    seller VARCHAR(42) NOT NULL, -- holder's wallet, signer of the listing
+    agreement VARCHAR(255) NOT NULL,
+    token_id INT NOT NULL,
+    price VARCHAR(78) NOT NULL, -- wei, as text: it does not fit a SQLite integer
+    nonce VARCHAR(78) NOT NULL,
+    deadline INT NOT NULL,
+    signature VARCHAR(132) NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'active', -- active, replaced, cancelled, filled
+    created_at REAL NOT NULL
+);
+
+CREATE INDEX listings_asset ON listings(agreement, token_id, status);
+
+-- lazy mint vouchers signed off chain (EIP-712) by agreement owners, minted to the buyer at purchase
+CREATE TABLE vouchers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    voucher_id VARCHAR(78) NOT NULL, -- IAssetAgreement.Voucher.voucherId
+    owner_id INT NOT NULL,
+    agreement VARCHAR(255) NOT NULL,
+    filepath VARCHAR(255) NOT NULL,
+    asset_digest VARCHAR(64) NOT NULL, -- SHA-256 of the original asset
+    price VARCHAR(78) NOT NULL, -- wei, as text
+    resale_allowed BOOLEAN NOT NULL,
+    signature VARCHAR(132) NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'open', -- open, redeemed, cancelled
+    token_id INT, -- set once redeemed
+    created_at REAL NOT NULL,
+    FOREIGN KEY(owner_id) REFERENCES users(id)
+);
+
+CREATE INDEX vouchers_status ON vouchers(status);
@@ -1,17 +1,26 @@
 import streamlit as st
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, mkdtemp
 from os.path import basename
-from Crypto.Hash import SHA256
 from contract import AssetMarket
+from indexer import get_trade_history
+from traceability import compute_asset_digest, compute_sale_hash, find_sale_hashes
+from commitments import get_sale_proof
+from web3 import Web3
 from constants import LOCAL_ENDPOINT
 from db import get_demo_db
 from user_utils import get_user_display_options, get_user_from_display
 import time
+from concurrent.futures import Future
+
+ANY_USER = "Any"
 
 
 class WatermarkWrapper:
     """
     Wrapper class to switch between SSL and LSB watermarking implementations.
+
+    SSL jobs are dispatched to the shared multi-replica worker pool instead of
+    building a model and running the encode in the calling thread.
     """
     
     def __init__(self, method: str = "lsb"):
@@ -22,35 +31,62 @@ class WatermarkWrapper:
             method: Watermarking method to use. Options: "lsb" or "ssl". Default: "lsb"
         """
         self.method = method.lower()
+        self._pool = None
+        self._ids = None
         
         if self.method == "ssl":
-            from ssl_watermarking.main_multibit import Watermark
+            from ssl_watermarking.pool import get_watermark_pool
+            self._pool = get_watermark_pool()
+            self._watermark = None
         elif self.method == "lsb":
             from lsb_watermarking.main_multibit import Watermark
+            # private working directory so that concurrent jobs do not share input/output folders
+            self._watermark = Watermark(work_dir=mkdtemp(prefix="lsb_wm_"))
         else:
             raise ValueError(f"Unknown watermarking method: {method}. Must be 'lsb' or 'ssl'")
-        
-        self._watermark = Watermark()
     
     def extract_watermark(self, img_filepath: str):
         """Extract watermark from image."""
+        if self._pool is not None:
+            return self._pool.submit_decode(img_filepath).result()
         return self._watermark.extract_watermark(img_filepath)
     
     def set_watermark(self, owner_id: int, buyer_id: int):
         """Set watermark with owner and buyer IDs."""
+        if self._pool is not None:
+            self._ids = (owner_id, buyer_id)
+            return
         return self._watermark.set_watermark(owner_id, buyer_id)
     
+    def submit_watermark_image(self, img_filepath: str, owner_id: int, buyer_id: int):
+        """Watermark an image asynchronously. Returns a Future resolving to the image path."""
+        if self._pool is not None:
+            return self._pool.submit_encode(img_filepath, owner_id, buyer_id)
+        future = Future()
+        self._watermark.set_watermark(owner_id, buyer_id)
+        self._watermark.watermark_image(img_filepath)
+        future.set_result(img_filepath)
+        return future
+    
     def watermark_image(self, img_filepath: str):
         """Watermark an image."""
+        if self._pool is not None:
+            return self._pool.submit_encode(img_filepath, *self._ids).result()
         return self._watermark.watermark_image(img_filepath)
     
     def watermark(self):
         """Watermark batch images."""
-        return self._watermark.watermark()
+        return self._require_local().watermark()
     
     def decode_watermark(self):
         """Decode watermark from batch images."""
-        return self._watermark.decode_watermark()
+        return self._require_local().decode_watermark()
+
+    def _require_local(self):
+        if self._watermark is None:
+            from ssl_watermarking.main_multibit import Watermark
+            self._watermark = Watermark()
+        return self._watermark
 
 
 class ExtractWatermark:
@@ -130,7 +166,9 @@ class ExtractWatermark:
         The proof of ownership and the history of ownership can be view on the 
         blockchain using tokenID and the owner ID. In case token ID is not 
         available, we can find the ownership records using the original asset 
-        and the IDs.
+        and the IDs. Owner, seller and buyer are optional: every sale of the
+        asset is looked up locally and only the final match is verified on chain,
+        in a single lookup whichever owner's agreement recorded it.
         """)
         con = get_demo_db()
         with st.form("recovery"):
@@ -141,16 +179,15 @@ class ExtractWatermark:
                 con.close()
                 return
 
-            original_owner_display = st.selectbox("Original Owner", options=display_options)
-            original_owner = get_user_from_display(original_owner_display, user_data_dict)
+            any_options = [ANY_USER] + display_options
+
+            original_owner_display = st.selectbox("Original Owner", options=any_options)
             
             asset = st.file_uploader("Upload Original Asset")
             
-            owner_display = st.selectbox("Seller", options=display_options)
-            owner = get_user_from_display(owner_display, user_data_dict)
+            owner_display = st.selectbox("Seller", options=any_options)
             
-            buyer_display = st.selectbox("Buyer", options=display_options)
-            buyer = get_user_from_display(buyer_display, user_data_dict)
+            buyer_display = st.selectbox("Buyer", options=any_options)
 
             upload = st.form_submit_button("Upload")
 
@@ -158,44 +195,123 @@ class ExtractWatermark:
                 con.close()
                 return
 
-            res = con.execute("SELECT a.agreement, b.id, b.wallet, c.id FROM users AS a INNER JOIN users AS b INNER JOIN users as c ON a.uname = ? AND b.uname = ? AND c.uname = ?", [
-                              original_owner, owner, buyer])
+            def lookup_user(display: str):
+                if display == ANY_USER:
+                    return None
+                res = con.execute("SELECT id, wallet, agreement FROM users WHERE uname = ?", [
+                                  get_user_from_display(display, user_data_dict)])
+                return res.fetchone()
 
-            owner_agreement, seller_id, seller_wallet, buyer_id = res.fetchone()
+            original_owner, seller, buyer = map(
+                lookup_user, [original_owner_display, owner_display, buyer_display])
 
             timing_log = []
-            
-            # Step 1: Compute hash of image
+            asset_data = asset.getvalue()
+
+            # Step 1: Compute digest of the original asset
             start_time = time.time()
-            cipher = SHA256.new(asset.getvalue())
-            cipher.update(bytes([seller_id, buyer_id]))
-            img_hash = cipher.digest()
-            img_hash_hex = cipher.hexdigest()
+            asset_digest = compute_asset_digest(asset_data)
             hash_time = time.time() - start_time
-            timing_log.append(f"1. Compute hash of image: {hash_time:.3f}s")
+            timing_log.append(f"1. Compute digest of asset: {hash_time:.3f}s")
+
+            # Step 2: Look up the recorded sales locally
+            start_time = time.time()
+            candidates = find_sale_hashes(asset_digest, None if seller is None else seller[0],
+                                          None if buyer is None else buyer[0])
+
+            if original_owner is not None:
+                candidates = [c for c in candidates if c[1] == original_owner[2]]
+
+            if not candidates and None not in (seller, buyer):
+                # not recorded locally (e.g. sold before the index existed), try the chosen IDs on chain.
+                # The market registry finds the agreement, the original owner is not needed
+                img_hash = compute_sale_hash(asset_data, seller[0], buyer[0])
+                candidates = [(img_hash, None if original_owner is None else original_owner[2],
+                               None, seller[0], buyer[0], None, False)]
+
+            lookup_time = time.time() - start_time
+            timing_log.append(
+                f"2. Local lookup ({len(candidates)} candidate(s)): {lookup_time:.3f}s")
 
-            # Step 2: Find sale record
+            if not candidates:
+                st.write("Sale Record does not exist for this asset")
+                with st.expander("Log"):
+                    for log_entry in timing_log:
+                        st.write(log_entry)
+                    st.write(f"Asset digest: {asset_digest}")
+                con.close()
+                return
+
+            img_hash, owner_agreement, token_id, seller_id, buyer_id, block_number, _ = candidates[0]
+
+            res = con.execute("SELECT a.uname, a.wallet, b.uname, b.wallet FROM users AS a INNER JOIN users AS b ON a.id = ? AND b.id = ?", [
+                              seller_id, buyer_id])
+            seller_name, seller_wallet, buyer_name, buyer_wallet = res.fetchone()
+
+            # Step 3: Verify the final match on chain
             start_time = time.time()
             market = AssetMarket(
                 LOCAL_ENDPOINT, self.market_address, seller_wallet)
             try:
-                record = market.get_asset_sale_record(
-                    owner_agreement, img_hash)
+                # hashes of the Merkle mode are proven against their epoch root
+                sale_proof = get_sale_proof(img_hash)
+
+                if sale_proof is None:
+                    # one lookup in the market-wide registry, whichever agreement holds the hash
+                    agreement, holder, recorded_token_id = market.find_sale_record(
+                        img_hash)
+
+                    if owner_agreement is not None and agreement != owner_agreement:
+                        raise ValueError(
+                            "the hash was recorded for another owner's asset")
+
+                    owner_agreement = agreement
+                    record = (holder, recorded_token_id)
+                    verification = "sale record"
+                else:
+                    epoch, proof = sale_proof
+
+                    if epoch is None:
+                        raise ValueError(
+                            "the hash is waiting for the next Merkle root commitment")
+
+                    if not market.verify_sale_hash(epoch, owner_agreement, token_id, img_hash, proof):
+                        raise ValueError(
+                            "the hash is not part of the Merkle root of epoch %d" % epoch)
+
+                    record = (buyer_wallet, token_id)
+                    verification = "Merkle proof (epoch %d, %d siblings)" % (epoch, len(proof))
+
                 record_time = time.time() - start_time
-                timing_log.append(f"2. Find sale record with hash: {record_time:.3f}s")
-                total_time = hash_time + record_time
+                timing_log.append(f"3. Verify {verification} on chain: {record_time:.3f}s")
+                total_time = hash_time + lookup_time + record_time
+                st.write("Seller: %s, Buyer: %s" % (seller_name, buyer_name))
                 st.write("Owner Address: %s, Buyer Address: %s, Token ID: %d" %
                         (seller_wallet, record[0], record[1]))
                 st.success(f"✅ Completed in {total_time:.3f}s")
+
+                trades = get_trade_history(owner_agreement, record[1])
+
+                if trades:
+                    st.write("**Trade history (local index):**")
+                    for trade_seller, trade_buyer, trade_price, trade_block, trade_tx in trades:
+                        st.write("Block %d: %s → %s for %s ETH (tx %s)" % (
+                            trade_block, trade_seller, trade_buyer, Web3.from_wei(trade_price, "ether"), trade_tx))
             except Exception as e:
                 record_time = time.time() - start_time
-                timing_log.append(f"2. Find sale record (failed): {record_time:.3f}s")
+                timing_log.append(f"3. Verify sale record on chain (failed): {record_time:.3f}s")
                 st.write(f"Sale Record does not exist: {str(e)}")
 
+            if len(candidates) > 1:
+                st.write("Other recorded sales of this asset:")
+                for _, _, token_id, other_seller, other_buyer, other_block, other_verified in candidates[1:]:
+                    st.write("Token %d, seller ID %d, buyer ID %d, block %s%s" % (
+                        token_id, other_seller, other_buyer, other_block, "" if other_verified else " (not on chain)"))
+
             with st.expander("Log"):
                 for log_entry in timing_log:
                     st.write(log_entry)
-                st.write(f"Hash: {img_hash_hex}")
+                st.write(f"Hash: {img_hash.hex()}")
         con.close()
 
     def render(self):
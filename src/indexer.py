@@ -0,0 +1,248 @@
+"""
+Incremental chain indexer: follows the factory, agreement and market events
+with eth_getLogs and materializes agreements, transfers, approvals, trades and
+current token owners into the local database.
+
+Usage (from the repository root, once the app deployed the contracts):
+    python src/indexer.py [--batch_size N] [--poll_interval S]
+"""
+import argparse
+import sqlite3
+import time
+from json import loads
+from web3 import Web3
+from web3.exceptions import BlockNotFound
+from db import get_index_db
+from constants import LOCAL_ENDPOINT
+from contract import get_agreement_abi, get_factory_abi, get_market_abi
+
+NEW_CONTRACT = Web3.keccak(text="NewContract(address)")
+TRANSFER = Web3.keccak(text="Transfer(address,address,uint256)")
+APPROVAL = Web3.keccak(text="Approval(address,address,uint256)")
+APPROVAL_FOR_ALL = Web3.keccak(text="ApprovalForAll(address,address,bool)")
+PURCHASE = Web3.keccak(text="Purchase(address,address,address,uint256,uint256)")
+
+# tables rolled back on a reorg, all keyed by block_number
+EVENT_TABLES = ["agreements", "transfers", "approvals", "trades"]
+
+
+class ChainIndexer:
+
+    def __init__(self, endpoint: str, factory_address: str, market_address: str,
+                 batch_size: int = 2000, keep_blocks: int = 128) -> None:
+        """
+        Args:
+            batch_size: Maximum number of blocks requested per eth_getLogs range
+            keep_blocks: Number of indexed block hashes kept for reorg detection
+        """
+        self.w3 = Web3(Web3.HTTPProvider(endpoint))
+        self.factory_address = factory_address
+        self.market_address = market_address
+        self.batch_size = batch_size
+        self.keep_blocks = keep_blocks
+
+        self.factory = self.w3.eth.contract(abi=get_factory_abi())
+        self.agreement = self.w3.eth.contract(abi=get_agreement_abi())
+        self.market = self.w3.eth.contract(abi=get_market_abi())
+
+    def checkpoint(self, con: sqlite3.Connection):
+        res = con.execute("SELECT MAX(number) FROM indexed_blocks")
+        number, = res.fetchone()
+        return -1 if number is None else number
+
+    def find_fork(self, con: sqlite3.Connection):
+        """
+        Returns the last indexed block that is still on the canonical chain,
+        or None when the indexed head is canonical.
+        """
+        res = con.execute(
+            "SELECT number, hash FROM indexed_blocks ORDER BY number DESC")
+        rows = res.fetchall()
+
+        for i, (number, block_hash) in enumerate(rows):
+            try:
+                block = self.w3.eth.get_block(number)
+            except BlockNotFound:
+                # the chain is shorter than the index
+                continue
+
+            if block.hash.to_0x_hex() == block_hash:
+                return None if i == 0 else number
+
+        # forked deeper than the kept history (or a restarted node): index again
+        return -1 if rows else None
+
+    def rollback(self, con: sqlite3.Connection, fork: int):
+        """Removes everything indexed after block `fork` and rebuilds the affected owners"""
+        res = con.execute(
+            "SELECT DISTINCT agreement, token_id FROM transfers WHERE block_number > ?", [fork])
+        affected = res.fetchall()
+
+        for table in EVENT_TABLES:
+            con.execute("DELETE FROM %s WHERE block_number > ?" % table, [fork])
+
+        con.execute("DELETE FROM indexed_blocks WHERE number > ?", [fork])
+
+        for agreement, token_id in affected:
+            self.refresh_owner(con, agreement, token_id)
+
+    def refresh_owner(self, con: sqlite3.Connection, agreement: str, token_id: int):
+        res = con.execute("SELECT to_address, block_number FROM transfers WHERE agreement = ? AND token_id = ? ORDER BY block_number DESC, log_index DESC LIMIT 1", [
+            agreement, token_id])
+        row = res.fetchone()
+
+        if row is None:
+            con.execute("DELETE FROM token_owners WHERE agreement = ? AND token_id = ?", [
+                agreement, token_id])
+        else:
+            owner, block_number = row
+            con.execute("INSERT OR REPLACE INTO token_owners (agreement, token_id, owner, block_number) VALUES (?, ?, ?, ?)", [
+                agreement, token_id, owner, block_number])
+
+    def get_logs(self, addresses: list, topics: list, from_block: int, to_block: int):
+        if not addresses:
+            return []
+
+        return self.w3.eth.get_logs({"fromBlock": from_block, "toBlock": to_block,
+                                     "address": addresses, "topics": [topics]})
+
+    def index_range(self, con: sqlite3.Connection, from_block: int, to_block: int):
+
+        # agreements first, their own events in the same range are then picked up
+        for log in self.get_logs([self.factory_address], [NEW_CONTRACT], from_block, to_block):
+            event = self.factory.events.NewContract().process_log(log)
+            address = event["args"]["contractAddress"]
+            owner = self.w3.eth.contract(address=address, abi=get_agreement_abi(
+            )).functions.getOwner().call(block_identifier=log["blockNumber"])
+
+            con.execute("INSERT OR REPLACE INTO agreements (address, owner, block_number, tx_hash) VALUES (?, ?, ?, ?)", [
+                address, owner, log["blockNumber"], log["transactionHash"].to_0x_hex()])
+
+        res = con.execute("SELECT address FROM agreements")
+        agreements = [address for address, in res.fetchall()]
+
+        for log in self.get_logs(agreements, [TRANSFER, APPROVAL, APPROVAL_FOR_ALL], from_block, to_block):
+            topic = log["topics"][0]
+            location = [log["blockNumber"], log["logIndex"],
+                        log["transactionHash"].to_0x_hex()]
+
+            if topic == TRANSFER:
+                args = self.agreement.events.Transfer().process_log(log)["args"]
+                con.execute("INSERT OR REPLACE INTO transfers (agreement, token_id, from_address, to_address, block_number, log_index, tx_hash) VALUES (?, ?, ?, ?, ?, ?, ?)", [
+                    log["address"], args["tokenId"], args["from"], args["to"]] + location)
+                self.refresh_owner(con, log["address"], args["tokenId"])
+            elif topic == APPROVAL:
+                args = self.agreement.events.Approval().process_log(log)["args"]
+                con.execute("INSERT OR REPLACE INTO approvals (agreement, owner, operator, token_id, approved, block_number, log_index, tx_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+                    log["address"], args["owner"], args["approved"], args["tokenId"], True] + location)
+            else:
+                args = self.agreement.events.ApprovalForAll().process_log(log)["args"]
+                con.execute("INSERT OR REPLACE INTO approvals (agreement, owner, operator, token_id, approved, block_number, log_index, tx_hash) VALUES (?, ?, ?, NULL, ?, ?, ?, ?)", [
+                    log["address"], args["owner"], args["operator"], args["approved"]] + location)
+
+        for log in self.get_logs([self.market_address], [PURCHASE], from_block, to_block):
+            args = self.market.events.Purchase().process_log(log)["args"]
+            con.execute("INSERT OR REPLACE INTO trades (agreement, token_id, seller, buyer, price, block_number, log_index, tx_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+                args["agreement"], args["tokenId"], args["from"], args["to"], str(args["price"]),
+                log["blockNumber"], log["logIndex"], log["transactionHash"].to_0x_hex()])
+
+        block = self.w3.eth.get_block(to_block)
+        con.execute("INSERT OR REPLACE INTO indexed_blocks (number, hash) VALUES (?, ?)", [
+            to_block, block.hash.to_0x_hex()])
+        con.execute("DELETE FROM indexed_blocks WHERE number NOT IN (SELECT number FROM indexed_blocks ORDER BY number DESC LIMIT ?)", [
+            self.keep_blocks])
+
+    def step(self):
+        """
+        Indexes the next range of blocks. Returns True if the index is caught up
+        with the chain head.
+        """
+        con = get_index_db()
+
+        try:
+            fork = self.find_fork(con)
+
+            if fork is not None:
+                print("Reorg detected, rolling back to block %d" % fork)
+                self.rollback(con, fork)
+                con.commit()
+
+            head = self.w3.eth.block_number
+            from_block = self.checkpoint(con) + 1
+
+            if from_block > head:
+                return True
+
+            to_block = min(head, from_block + self.batch_size - 1)
+
+            # the whole range lands in one transaction: pages never see half a block
+            self.index_range(con, from_block, to_block)
+            con.commit()
+
+            return to_block == head
+        except BaseException:
+            con.rollback()
+            raise
+        finally:
+            con.close()
+
+    def run_forever(self, poll_interval: float = 1):
+
+        while True:
+            try:
+                if self.step():
+                    time.sleep(poll_interval)
+            except Exception as e:
+                print("Indexer error:", e)
+                time.sleep(poll_interval)
+
+
+def get_indexed_owners():
+    """
+    Returns the indexed holder of every token, keyed by (agreement, Token ID),
+    and the last indexed block (-1 if nothing is indexed yet).
+    """
+    con = get_index_db()
+    res = con.execute("SELECT agreement, token_id, owner FROM token_owners")
+    owners = {(agreement, token_id): owner for agreement,
+              token_id, owner in res.fetchall()}
+    res = con.execute("SELECT MAX(number) FROM indexed_blocks")
+    checkpoint, = res.fetchone()
+    con.close()
+    return owners, -1 if checkpoint is None else checkpoint
+
+
+def get_trade_history(agreement: str, token_id: int):
+    """Returns the indexed trades of a token, oldest first"""
+    con = get_index_db()
+    res = con.execute("SELECT seller, buyer, price, block_number, tx_hash FROM trades WHERE agreement = ? AND token_id = ? ORDER BY block_number, log_index", [
+        agreement, token_id])
+    trades = res.fetchall()
+    con.close()
+    return [(seller, buyer, int(price), block_number, tx_hash) for seller, buyer, price, block_number, tx_hash in trades]
+
+
+def load_deployed_addresses(poll_interval: float = 1):
+    """Waits for the app to deploy the market and the factory (contracts.json)"""
+
+    while True:
+        try:
+            with open("contracts.json", "r") as f:
+                contract_data = loads(f.read())
+            return contract_data["factory"][0], contract_data["market"][0]
+        except (OSError, ValueError, KeyError):
+            time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch_size", type=int, default=2000,
+                        help="Maximum number of blocks per eth_getLogs request (Default: 2000)")
+    parser.add_argument("--poll_interval", type=float, default=1)
+    params = parser.parse_args()
+
+    factory_address, market_address = load_deployed_addresses()
+
+    indexer = ChainIndexer(LOCAL_ENDPOINT, factory_address,
+                           market_address, batch_size=params.batch_size)
+    indexer.run_forever(params.poll_interval)
@@ -0,0 +1,162 @@
+"""
+Durable SQLite-backed job queue shared by the Streamlit app and the workers
+"""
+import sqlite3
+import time
+from json import dumps, loads
+from db import get_jobs_db
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueue:
+
+    def __init__(self, lease_seconds: float = 900, retry_delay: float = 5) -> None:
+        """
+        Args:
+            lease_seconds: How long a claimed job stays locked before another worker may reclaim it
+            retry_delay: Base delay (seconds) before a failed attempt is retried, doubled every attempt
+        """
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+
+    def enqueue(self, kind: str, payload: dict, idempotency_key: str, subject: str = None, max_attempts: int = 3) -> int:
+        """
+        Adds a job to the queue and returns its ID. If a job with the same
+        idempotency key is still pending or running, its ID is returned instead.
+        """
+        con = get_jobs_db()
+        now = time.time()
+
+        try:
+            cur = con.execute("INSERT INTO jobs (kind, idempotency_key, subject, payload, max_attempts, available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+                kind, idempotency_key, subject, dumps(payload), max_attempts, now, now, now])
+            con.commit()
+            job_id = cur.lastrowid
+        except sqlite3.IntegrityError:
+            res = con.execute("SELECT id FROM jobs WHERE idempotency_key = ? AND state IN (?, ?)", [
+                idempotency_key, PENDING, RUNNING])
+            job_id, = res.fetchone()
+
+        con.close()
+        return job_id
+
+    def claim(self, worker: str, kinds: 'list[str]' = None):
+        """
+        Atomically claims the next available job, including running jobs whose
+        lease expired (crashed worker) and that have attempts left. Returns
+        (id, kind, payload, attempts) or None.
+        """
+        con = get_jobs_db()
+        now = time.time()
+
+        # a job that keeps crashing its worker is not retried forever
+        con.execute("UPDATE jobs SET state = ?, error = ?, locked_until = NULL, updated_at = ? WHERE state = ? AND locked_until < ? AND attempts >= max_attempts", [
+            FAILED, "Worker lease expired on the last attempt", now, RUNNING, now])
+
+        kind_filter = ""
+        params = [PENDING, now, RUNNING, now]
+
+        if kinds is not None:
+            kind_filter = "AND kind IN (%s)" % ", ".join("?" * len(kinds))
+            params += kinds
+
+        res = con.execute("""
+            UPDATE jobs SET state = ?, attempts = attempts + 1, worker = ?, locked_until = ?, updated_at = ?
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE ((state = ? AND available_at <= ?) OR (state = ? AND locked_until < ? AND attempts < max_attempts)) %s
+                ORDER BY id LIMIT 1
+            )
+            RETURNING id, kind, payload, attempts""" % kind_filter,
+            [RUNNING, worker, now + self.lease_seconds, now] + params)
+
+        row = res.fetchone()
+        con.commit()
+        con.close()
+
+        if row is None:
+            return None
+
+        job_id, kind, payload, attempts = row
+        return job_id, kind, loads(payload), attempts
+
+    def report_progress(self, job_id: int, progress: int, message: str):
+        con = get_jobs_db()
+        con.execute("UPDATE jobs SET progress = ?, message = ?, locked_until = ?, updated_at = ? WHERE id = ?", [
+            progress, message, time.time() + self.lease_seconds, time.time(), job_id])
+        con.commit()
+        con.close()
+
+    def complete(self, job_id: int, result: dict):
+        con = get_jobs_db()
+        con.execute("UPDATE jobs SET state = ?, progress = 100, result = ?, error = NULL, locked_until = NULL, updated_at = ? WHERE id = ?", [
+            DONE, dumps(result), time.time(), job_id])
+        con.commit()
+        con.close()
+
+    def fail(self, job_id: int, error: str):
+        """
+        Records a failed attempt. The job is rescheduled with exponential
+        backoff until it runs out of attempts, then marked as failed.
+        """
+        con = get_jobs_db()
+        now = time.time()
+
+        res = con.execute(
+            "SELECT attempts, max_attempts FROM jobs WHERE id = ?", [job_id])
+        attempts, max_attempts = res.fetchone()
+
+        if attempts < max_attempts:
+            con.execute("UPDATE jobs SET state = ?, error = ?, available_at = ?, locked_until = NULL, updated_at = ? WHERE id = ?", [
+                PENDING, error, now + self.retry_delay * 2 ** (attempts - 1), now, job_id])
+        else:
+            con.execute("UPDATE jobs SET state = ?, error = ?, locked_until = NULL, updated_at = ? WHERE id = ?", [
+                FAILED, error, now, job_id])
+
+        con.commit()
+        con.close()
+
+    def get(self, job_id: int):
+        con = get_jobs_db()
+        con.row_factory = sqlite3.Row
+        res = con.execute("SELECT * FROM jobs WHERE id = ?", [job_id])
+        row = res.fetchone()
+        con.close()
+        return None if row is None else self._to_dict(row)
+
+    def list_by_subject(self, subject: str, limit: int = 10):
+        con = get_jobs_db()
+        con.row_factory = sqlite3.Row
+        res = con.execute(
+            "SELECT * FROM jobs WHERE subject = ? ORDER BY id DESC LIMIT ?", [subject, limit])
+        rows = res.fetchall()
+        con.close()
+        return [self._to_dict(row) for row in rows]
+
+    def list_active(self, kinds: 'list[str]' = None):
+        """Returns the pending and running jobs, optionally only those of some kinds"""
+        con = get_jobs_db()
+        con.row_factory = sqlite3.Row
+        kind_filter = ""
+        params = [PENDING, RUNNING]
+
+        if kinds is not None:
+            kind_filter = "AND kind IN (%s)" % ", ".join("?" * len(kinds))
+            params += kinds
+
+        res = con.execute(
+            "SELECT * FROM jobs WHERE state IN (?, ?) %s ORDER BY id" % kind_filter, params)
+        rows = res.fetchall()
+        con.close()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row):
+        job = dict(row)
+        job["payload"] = loads(job["payload"])
+        job["result"] = None if job["result"] is None else loads(job["result"])
+        return job
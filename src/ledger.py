@@ -0,0 +1,73 @@
+"""
+Fee accounting: gas and fees of every transaction, read straight from the
+receipts (gasUsed * effectiveGasPrice) and recorded in the fee_ledger table.
+"""
+import time
+from decimal import Decimal
+from web3 import Web3
+from db import get_demo_db
+
+DEPLOY = "deploy"
+APPROVE = "approve"
+MINT = "mint"
+UPDATE_HASH = "updateHash"
+PURCHASE = "purchase"
+UPDATE_HASH_BATCH = "updateHashBatch"
+PURCHASE_BATCH = "purchaseBatch"
+WITHDRAW = "withdraw"
+COMMIT_SALE_ROOT = "commitSaleRoot"
+CANCEL_VOUCHER = "cancelVoucher"
+
+
+def receipt_fee(receipt):
+    """Returns (gas used, fee in wei) of a mined transaction"""
+    return receipt.gasUsed, receipt.gasUsed * receipt.effectiveGasPrice
+
+
+def to_eth(fee_wei: int) -> Decimal:
+    return Web3.from_wei(fee_wei or 0, "ether")
+
+
+def record_fee(receipt, operation: str, user_id: int = None, agreement: str = None, token_id: int = None):
+    """
+    Records the cost of a mined transaction.
+
+    Returns:
+        (gas used, fee in ETH)
+    """
+    gas_used, fee_wei = receipt_fee(receipt)
+
+    con = get_demo_db()
+    con.execute("INSERT OR REPLACE INTO fee_ledger (tx_hash, operation, user_id, sender, agreement, token_id, gas_used, gas_price, fee_wei, block_number, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        receipt.transactionHash.to_0x_hex(), operation, user_id, receipt["from"], agreement, token_id,
+        gas_used, receipt.effectiveGasPrice, fee_wei, receipt.blockNumber, time.time()])
+    con.commit()
+    con.close()
+
+    return gas_used, to_eth(fee_wei)
+
+
+def _aggregate(group_by: str, where: str = "", params: list = None):
+    con = get_demo_db()
+    res = con.execute("SELECT %s, COUNT(*), SUM(gas_used), SUM(fee_wei) FROM fee_ledger %s GROUP BY %s ORDER BY SUM(fee_wei) DESC" % (
+        group_by, where, group_by), params or [])
+    rows = res.fetchall()
+    con.close()
+    return [(*key, count, gas, to_eth(fee)) for *key, count, gas, fee in rows]
+
+
+def fees_by_user():
+    """Returns (user_id, transactions, gas, fee ETH) rows"""
+    return _aggregate("user_id")
+
+
+def fees_by_asset():
+    """Returns (agreement, token_id, transactions, gas, fee ETH) rows"""
+    return _aggregate("agreement, token_id", "WHERE token_id IS NOT NULL")
+
+
+def fees_by_operation(user_id: int = None):
+    """Returns (operation, transactions, gas, fee ETH) rows, optionally for a single user"""
+    if user_id is None:
+        return _aggregate("operation")
+    return _aggregate("operation", "WHERE user_id = ?", [user_id])
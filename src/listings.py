@@ -0,0 +1,170 @@
+"""
+Off-chain sale listings: EIP-712 orders signed by asset holders and kept in
+the local database. Listing, repricing and delisting send no transaction, the
+market verifies the signed order when the asset is bought.
+
+A replaced or delisted order stays valid on chain until its deadline, as long
+as its signature is known. Signatures never leave this database and workers
+only settle active listings, but a purchase or checkout job already holding
+the order is past that check: such orders are revoked on chain with
+AssetMarket.cancelListing.
+"""
+import secrets
+import time
+from db import get_demo_db
+from contract import AssetMarket
+from jobs import JobQueue
+
+ACTIVE = "active"
+REPLACED = "replaced"
+CANCELLED = "cancelled"
+FILLED = "filled"
+
+# listings expire after 30 days
+LISTING_TTL = 30 * 24 * 3600
+
+
+def create_listing(endpoint: str, market_address: str, seller: str, agreement: str, token_id: int, price: float,
+                   ttl: int = LISTING_TTL) -> int:
+    """
+    Signs a listing with the seller's account and makes it the asset's active
+    listing. Returns its ID.
+    """
+    market = AssetMarket(endpoint, market_address, seller)
+
+    listing, signature = market.sign_listing(
+        agreement, token_id, price, secrets.randbits(64), int(time.time()) + ttl)
+
+    retire_asset_listings(endpoint, market_address, agreement, token_id, REPLACED)
+
+    con = get_demo_db()
+    cur = con.execute("INSERT INTO listings (seller, agreement, token_id, price, nonce, deadline, signature, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        listing["seller"], agreement, token_id, str(listing["price"]), str(listing["nonce"]),
+        listing["deadline"], signature.hex(), ACTIVE, time.time()])
+    con.commit()
+    con.close()
+
+    return cur.lastrowid
+
+
+def set_listing_status(listing_id: int, status: str):
+    con = get_demo_db()
+    con.execute("UPDATE listings SET status = ? WHERE id = ?",
+                [status, listing_id])
+    con.commit()
+    con.close()
+
+
+def cancel_asset_listing(endpoint: str, market_address: str, agreement: str, token_id: int):
+    """Delists an asset, on chain only if a queued purchase holds its listing"""
+    retire_asset_listings(endpoint, market_address,
+                          agreement, token_id, CANCELLED)
+
+
+def queued_listing_ids(queue: JobQueue = None) -> 'set[int]':
+    """IDs of the listings referenced by pending or running purchase and checkout jobs"""
+    listing_ids = set()
+
+    for job in (queue or JobQueue()).list_active(["purchase", "checkout"]):
+        items = job["payload"].get("items", [job["payload"]])
+        listing_ids.update(item["listing_id"] for item in items
+                           if item.get("listing_id") is not None)
+
+    return listing_ids
+
+
+def retire_asset_listings(endpoint: str, market_address: str, agreement: str, token_id: int, status: str):
+    """
+    Moves the active listing of an asset to status (REPLACED or CANCELLED) and
+    revokes it on chain if a queued job may still submit it
+    """
+    con = get_demo_db()
+    res = con.execute("SELECT id, seller, nonce FROM listings WHERE agreement = ? AND token_id = ? AND status = ?", [
+        agreement, token_id, ACTIVE])
+    rows = res.fetchall()
+    con.execute("UPDATE listings SET status = ? WHERE agreement = ? AND token_id = ? AND status = ?", [
+        status, agreement, token_id, ACTIVE])
+    con.commit()
+    con.close()
+
+    queued = queued_listing_ids() if rows else set()
+
+    for listing_id, seller, nonce in rows:
+        if listing_id not in queued:
+            continue
+
+        market = AssetMarket(endpoint, market_address, seller)
+
+        if market.is_listing_nonce_used(seller, int(nonce)):
+            continue
+
+        receipt = market.cancel_listing(int(nonce))
+
+        if receipt.status != 1:
+            raise RuntimeError("cancelListing transaction %s reverted" %
+                               receipt.transactionHash.to_0x_hex())
+
+
+def require_active_listing(listing_id: int):
+    """Raises unless a listing is active and unexpired, i.e. may still be settled"""
+    con = get_demo_db()
+    res = con.execute(
+        "SELECT status, deadline FROM listings WHERE id = ?", [listing_id])
+    row = res.fetchone()
+    con.close()
+
+    if row is None:
+        raise KeyError("Unknown listing %d" % listing_id)
+
+    status, deadline = row
+
+    if status != ACTIVE:
+        raise RuntimeError("Listing %d is %s" % (listing_id, status))
+
+    if deadline <= time.time():
+        raise RuntimeError("Listing %d expired" % listing_id)
+
+
+def _to_listing(row):
+    listing_id, seller, agreement, token_id, price, nonce, deadline, signature = row
+
+    listing = {"seller": seller, "agreement": agreement, "tokenId": token_id,
+               "price": int(price), "nonce": int(nonce), "deadline": deadline}
+
+    return listing_id, listing, bytes.fromhex(signature)
+
+
+LISTING_COLUMNS = "id, seller, agreement, token_id, price, nonce, deadline, signature"
+
+
+def get_listing(listing_id: int):
+    """
+    Returns:
+        (listing ID, listing dict as passed to AssetMarket.purchase_listing, signature)
+    """
+    con = get_demo_db()
+    res = con.execute("SELECT %s FROM listings WHERE id = ?" %
+                      LISTING_COLUMNS, [listing_id])
+    row = res.fetchone()
+    con.close()
+
+    if row is None:
+        raise KeyError("Unknown listing %d" % listing_id)
+
+    return _to_listing(row)
+
+
+def get_active_listings():
+    """
+    Returns every active, unexpired listing, keyed by (agreement, Token ID)
+
+    Returns:
+        {(agreement, token_id): (listing ID, listing dict, signature)}
+    """
+    con = get_demo_db()
+    res = con.execute("SELECT %s FROM listings WHERE status = ? AND deadline > ?" % LISTING_COLUMNS, [
+        ACTIVE, int(time.time())])
+    rows = res.fetchall()
+    con.close()
+
+    return {(row[2], row[3]): _to_listing(row) for row in rows}
@@ -20,10 +20,15 @@ class Watermark:
     LSB Watermarking class với interface tương tự SSL watermarking
     """
 
-    def __init__(self) -> None:
+    def __init__(self, work_dir: str = None) -> None:
+        """
+        Args:
+            work_dir: Private directory for the input/output images. Defaults to src/lsb_watermarking.
+        """
         self.base_dir = join(os.getcwd(), 'src')
-        self.data_dir = join(self.base_dir, "lsb_watermarking", "input")
-        self.output_dir = join(self.base_dir, "lsb_watermarking", "output", "imgs")
+        work_dir = join(self.base_dir, "lsb_watermarking") if work_dir is None else work_dir
+        self.data_dir = join(work_dir, "input")
+        self.output_dir = join(work_dir, "output", "imgs")
         self.save_images = True
         self.decode_only = False
         self.verbose = 1
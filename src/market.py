@@ -1,14 +1,16 @@
 import streamlit as st
 from PIL import Image
-from contract import AssetMarket, AssetAgreement, get_web3_provider
+from contract import get_web3_provider
 from constants import LOCAL_ENDPOINT
-from extract_watermark import WatermarkWrapper
-from tempfile import NamedTemporaryFile
-from Crypto.Hash import SHA256
 from web3 import Web3
 from db import get_demo_db
+from jobs import JobQueue, PENDING, RUNNING, FAILED
 from user_utils import get_user_display_options, get_user_from_display
-import time
+from listings import get_active_listings
+from vouchers import get_open_vouchers
+from commitments import ONCHAIN
+from indexer import get_indexed_owners
+from os.path import basename, exists
 
 
 class Market:
@@ -17,135 +19,161 @@ class Market:
         self.market_address = market_address
         self.manager_address = get_web3_provider(
             LOCAL_ENDPOINT).eth.accounts[0]
+        self.jobs = JobQueue()
+
+    def on_image_buy(self, agreement_address: str, token_id: int, listing_id: int, buyer_id: int):
+        """
+        Enqueues the purchase of a signed listing. Watermarking and settlement
+        run on the job workers (worker.py), this page only polls the job progress.
+        """
+        job_id = self.jobs.enqueue("purchase", {
+            "market_address": self.market_address,
+            "manager_address": self.manager_address,
+            "agreement_address": agreement_address,
+            "token_id": token_id,
+            "listing_id": listing_id,
+            "buyer_id": buyer_id,
+            "watermark_method": st.session_state.get("watermark_method", "lsb"),
+            "hash_mode": st.session_state.get("hash_mode", ONCHAIN),
+        }, idempotency_key="purchase:%d:%d" % (listing_id, buyer_id),
+            subject="buyer:%d" % buyer_id)
+
+        st.info(f"Purchase of Token {token_id} queued (job #{job_id})")
+
+    def on_voucher_buy(self, voucher_id: int, buyer_id: int):
+        """Enqueues the purchase of a lazily minted asset, minted to the buyer when it settles"""
+        job_id = self.jobs.enqueue("voucher", {
+            "market_address": self.market_address,
+            "manager_address": self.manager_address,
+            "voucher_id": voucher_id,
+            "buyer_id": buyer_id,
+            "watermark_method": st.session_state.get("watermark_method", "lsb"),
+        }, idempotency_key="voucher:%d:%d" % (voucher_id, buyer_id),
+            subject="buyer:%d" % buyer_id)
+
+        st.info(f"Purchase of voucher #{voucher_id} queued (job #{job_id})")
+
+    def get_cart(self, buyer_id: int) -> 'list[tuple[str, int, int]]':
+        """(agreement, Token ID, listing ID) of every asset the buyer added to their cart"""
+        return st.session_state.setdefault("cart:%d" % buyer_id, [])
+
+    def on_add_to_cart(self, agreement_address: str, token_id: int, listing_id: int, buyer_id: int):
+        cart = self.get_cart(buyer_id)
+
+        if (agreement_address, token_id, listing_id) not in cart:
+            cart.append((agreement_address, token_id, listing_id))
+
+    def on_checkout(self, buyer_id: int):
+        """
+        Enqueues the whole cart as a single checkout job, settled with one
+        batched hash update and one batched purchase.
+        """
+        cart = sorted(self.get_cart(buyer_id))
+
+        job_id = self.jobs.enqueue("checkout", {
+            "market_address": self.market_address,
+            "manager_address": self.manager_address,
+            "items": [{"agreement_address": agreement_address, "token_id": token_id, "listing_id": listing_id}
+                      for agreement_address, token_id, listing_id in cart],
+            "buyer_id": buyer_id,
+            "watermark_method": st.session_state.get("watermark_method", "lsb"),
+            "hash_mode": st.session_state.get("hash_mode", ONCHAIN),
+        }, idempotency_key="checkout:%d:%s" % (buyer_id, ",".join(str(listing_id) for _, _, listing_id in cart)),
+            subject="buyer:%d" % buyer_id)
+
+        self.get_cart(buyer_id).clear()
+
+        st.info(f"Checkout of {len(cart)} assets queued (job #{job_id})")
+
+    def render_cart(self, buyer_id: int):
+        cart = self.get_cart(buyer_id)
+
+        if not cart:
+            return
 
-    def on_image_buy(self, agreement_address: str, token_id: int, buyer_id: int):
+        st.write("### Cart")
 
-        overall_start = time.time()
-        con = get_demo_db()
-        timing_log = []
+        for agreement_address, token_id, _ in cart:
+            st.write(f"- Token {token_id} ({agreement_address})")
 
-        progress_text = st.empty()
-        progress_bar = st.progress(0, text="Initializing purchase...")
+        c1, c2 = st.columns(2)
 
-        # Step 1: Get agreement and seller info
-        progress_bar.progress(10, text="Step 1/5: Fetching agreement and seller information...")
-        start_time = time.time()
-        agreement = AssetAgreement(
-            LOCAL_ENDPOINT, agreement_address, self.manager_address)
+        if c1.button("Checkout (%d assets)" % len(cart), key="checkout-%d" % buyer_id):
+            self.on_checkout(buyer_id)
+
+        if c2.button("Empty cart", key="empty-cart-%d" % buyer_id):
+            cart.clear()
+            st.rerun()
+
+    def render_purchase_job(self, job: dict):
+        if job["kind"] == "checkout":
+            token_ids = [item["token_id"] for item in job["payload"]["items"]]
+            tokens = "Tokens %s" % ", ".join(str(t) for t in token_ids)
+        elif job["kind"] == "voucher":
+            # the Token ID is only known once the voucher is redeemed
+            if job["result"]:
+                tokens = "Token %d" % job["result"]["token_id"]
+            else:
+                tokens = "voucher #%d" % job["payload"]["voucher_id"]
+        else:
+            tokens = "Token %d" % job["payload"]["token_id"]
+
+        if job["state"] in (PENDING, RUNNING):
+            text = job["message"] or "Waiting for a worker..."
+            if job["attempts"] > 1:
+                text += " (attempt %d/%d)" % (job["attempts"], job["max_attempts"])
+            st.progress(job["progress"], text=f"Job #{job['id']} ({tokens}): {text}")
+            return
 
-        asset_price = agreement.price_of(token_id)
-        seller_address = agreement.owner_of(token_id)
+        if job["state"] == FAILED:
+            st.error(f"❌ Purchase of {tokens} failed (job #{job['id']})")
+            with st.expander("Error"):
+                st.code(job["error"])
+            return
 
-        res = con.execute(
-            "SELECT id FROM users WHERE wallet = ?", [seller_address])
-        seller_id, = res.fetchone()
-        step1_time = time.time() - start_time
-        timing_log.append(f"1. Get agreement and seller info: {step1_time:.3f}s")
+        result = job["result"]
 
-        # Step 2: Load image and compute hash
-        progress_bar.progress(30, text="Step 2/5: Loading image and computing hash...")
-        start_time = time.time()
-        wm_image = NamedTemporaryFile(
-            "wb", suffix=".png", delete=False)
+        st.success(f"✅ Purchase of {tokens} completed successfully in {result['total_time']:.3f}s")
 
-        res = con.execute(
-            "SELECT assets.filepath FROM users LEFT JOIN assets ON users.id = assets.owner_id WHERE users.agreement = ? AND assets.token_id = ?", [agreement_address, token_id])
-
-        img_location, = res.fetchone()
-
-        with open(img_location, "rb") as f:
-            data = f.read()
-            wm_image.write(data)
-            cipher = SHA256.new(data)
-            cipher.update(bytes([seller_id, buyer_id]))
-            img_hash = cipher.digest()
-            img_hash_hex = cipher.hexdigest()
-        step2_time = time.time() - start_time
-        timing_log.append(f"2. Load image and compute hash: {step2_time:.3f}s")
-
-        wm_file_name = wm_image.name
-        wm_image.close()
-
-        # Step 3: Watermark the image
-        progress_bar.progress(50, text="Step 3/5: Applying watermark to the image...")
-        start_time = time.time()
-        watermark_method = st.session_state.get("watermark_method", "lsb")
-        wm = WatermarkWrapper(watermark_method)
-
-        wm.set_watermark(seller_id, buyer_id)
-        wm.watermark_image(wm_file_name)
-        step3_time = time.time() - start_time
-        timing_log.append(f"3. Watermark image ({watermark_method.upper()}): {step3_time:.3f}s")
-
-        # Step 4: Update hash on smart contract
-        progress_bar.progress(70, text="Step 4/5: Updating hash on smart contract...")
-        start_time = time.time()
-        asset_market_manager = AssetMarket(
-            LOCAL_ENDPOINT, self.market_address, self.manager_address)
-
-        update_hash_receipt = asset_market_manager.update_hash(
-            agreement_address, token_id, img_hash)
-        step4_time = time.time() - start_time
-        update_hash_gas = update_hash_receipt.gasUsed
-        # Get gas price and calculate fee
-        update_hash_tx = asset_market_manager.w3.eth.get_transaction(update_hash_receipt.transactionHash)
-        update_hash_gas_price = update_hash_tx.get('gasPrice') or update_hash_receipt.get('effectiveGasPrice', 0)
-        update_hash_fee_wei = update_hash_gas * update_hash_gas_price
-        update_hash_fee_eth = Web3.from_wei(update_hash_fee_wei, 'ether')
-        timing_log.append(f"4. Update hash on smart contract: {step4_time:.3f}s (Gas: {update_hash_gas:,} gas, Fee: {update_hash_fee_eth:.9f} ETH)")
-
-        # Step 5: Get buyer wallet and transfer asset
-        progress_bar.progress(90, text="Step 5/5: Transferring asset to buyer...")
-        start_time = time.time()
-        res = con.execute("SELECT wallet FROM users WHERE id = ?", [buyer_id])
-        buyer_wallet_address, = res.fetchone()
-
-        asset_market = AssetMarket(
-            LOCAL_ENDPOINT, self.market_address, buyer_wallet_address)
-        purchase_receipt = asset_market.purchase(
-            agreement_address, token_id, asset_price)
-        step5_time = time.time() - start_time
-        purchase_gas = purchase_receipt.gasUsed
-        # Get gas price and calculate fee
-        purchase_tx = asset_market.w3.eth.get_transaction(purchase_receipt.transactionHash)
-        purchase_gas_price = purchase_tx.get('gasPrice') or purchase_receipt.get('effectiveGasPrice', 0)
-        purchase_fee_wei = purchase_gas * purchase_gas_price
-        purchase_fee_eth = Web3.from_wei(purchase_fee_wei, 'ether')
-        timing_log.append(f"5. Transfer asset to buyer: {step5_time:.3f}s (Gas: {purchase_gas:,} gas, Fee: {purchase_fee_eth:.9f} ETH)")
-
-        # Calculate total gas and total fee
-        total_gas = update_hash_gas + purchase_gas
-        total_fee_eth = update_hash_fee_eth + purchase_fee_eth
-
-        total_time = time.time() - overall_start
-        timing_log.append(f"**Total time: {total_time:.3f}s**")
-        timing_log.append(f"**Total gas used: {total_gas:,} gas**")
-        timing_log.append(f"**Total gas fee: {total_fee_eth:.9f} ETH**")
-
-        # Display success message with total time prominently
-        progress_text.write("Purchase completed.")
-        st.success(f"✅ Purchase completed successfully in {total_time:.3f}s")
+        # a checkout settles several items, a single purchase is one item
+        items = result.get("items") or [{
+            "token_id": result["token_id"], "seller_id": result["seller_id"],
+            "img_hash": result["img_hash"], "watermarked_file": result["watermarked_file"]}]
 
         # Display summary information
         st.write("**Purchase Summary:**")
-        st.write(f"- Watermark text: {seller_id}, {buyer_id}")
-        st.write(f"- Image Hash: {img_hash_hex}")
-        st.write(f"- Price: {asset_price} ETH, Token ID: {token_id}")
-        st.write(f"- Watermarking method: {watermark_method.upper()}")
-        st.write(f"- **Total Gas Used: {total_gas:,} gas**")
-        st.write(f"- **Total Gas Fee: {total_fee_eth:.9f} ETH**")
+        for item in items:
+            st.write(f"- Token ID: {item['token_id']}, Watermark text: {item['seller_id']}, {result['buyer_id']}, Image Hash: {item['img_hash']}")
+        st.write(f"- Price: {result['price']} ETH")
+        st.write(f"- Watermarking method: {result['watermark_method'].upper()}")
+        st.write(f"- **Total Gas Used: {result['total_gas']:,} gas**")
+        st.write(f"- **Total Gas Fee: {result['total_fee_eth']} ETH**")
 
         # Detailed timing log in expander
         with st.expander("📊 Detailed Runtime Log"):
             st.write("**Step-by-step timing:**")
-            for log_entry in timing_log:
+            for log_entry in result["timing_log"]:
                 st.write(log_entry)
 
-        with open(wm_file_name, "rb") as f:
-            st.download_button("Verify Signature and Download Asset",
-                               f, file_name=wm_file_name)
+        for item in items:
+            wm_file_name = item["watermarked_file"]
 
-        con.close()
+            if exists(wm_file_name):
+                with open(wm_file_name, "rb") as f:
+                    st.download_button("Verify Signature and Download Asset (Token %d)" % item["token_id"],
+                                       f, file_name=basename(wm_file_name), key="download-%d-%d" % (job["id"], item["token_id"]))
+
+    @st.fragment(run_every=2)
+    def render_purchase_jobs(self, buyer_id: int):
+        jobs = self.jobs.list_by_subject("buyer:%d" % buyer_id, limit=5)
+
+        if not jobs:
+            return
+
+        st.write("### Purchases")
+
+        for job in jobs:
+            self.render_purchase_job(job)
 
     def render(self):
         st.write("## Trade")
@@ -173,46 +201,80 @@ class Market:
 
         buyer_id, = d
 
+        self.render_purchase_jobs(buyer_id)
+        self.render_cart(buyer_id)
+
         res = con.execute(
             "SELECT * FROM users INNER JOIN assets ON users.id = assets.owner_id")
 
         data = res.fetchall()
 
+        res = con.execute("SELECT wallet, uname FROM users")
+        user_names = dict(res.fetchall())
+
+        # listings are signed off chain and stored locally, rendering them
+        # needs no chain read. Listings of sellers the index shows no longer
+        # holding the asset are hidden, the market would reject them.
+        listings = get_active_listings()
+        owners, _ = get_indexed_owners()
+
         i = 0
 
         for (_, owner_name, owner_wallet, owner_agreement, _, _, asset_filepath, asset_token_id) in data:
 
             c = [c1, c2][i % 2]
 
-            agreement = AssetAgreement(
-                LOCAL_ENDPOINT, owner_agreement, owner_wallet)
-
-            seller_address = agreement.owner_of(asset_token_id)
-
-            res = con.execute(
-                "SELECT uname FROM users WHERE wallet = ?", [seller_address])
-            data = res.fetchone()
-
-            seller_name, = data
+            if (owner_agreement, asset_token_id) not in listings:
+                continue
 
-            price, _, forSale, resaleAllowed = agreement.fetch_asset_metadata(
-                asset_token_id)
+            listing_id, listing, _ = listings[(owner_agreement, asset_token_id)]
+            seller_address = listing["seller"]
 
-            if not forSale:
+            if owners.get((owner_agreement, asset_token_id), seller_address) != seller_address:
                 continue
 
+            seller_name = user_names.get(seller_address, seller_address)
+
             pil_img = Image.open(asset_filepath)
 
             pil_img = pil_img.resize((pil_img.width//4, pil_img.height//4))
 
-            c.image(pil_img, "Original Owner: %s. Seller: %s. Price (%f ETH). Resale: %r" % (
-                owner_name, seller_name, Web3.from_wei(price, "ether"), resaleAllowed))
+            c.image(pil_img, "Original Owner: %s. Seller: %s. Price (%f ETH)" % (
+                owner_name, seller_name, Web3.from_wei(listing["price"], "ether")))
 
             buy = c.button("Buy", key=asset_filepath)
+            add = c.button("Add to cart", key="cart-" + asset_filepath,
+                           disabled=(owner_agreement, asset_token_id, listing_id) in self.get_cart(buyer_id))
+
+            i += 1
+
+            if buy:
+                self.on_image_buy(owner_agreement, asset_token_id, listing_id, buyer_id)
+
+            if add:
+                self.on_add_to_cart(owner_agreement, asset_token_id, listing_id, buyer_id)
+                st.rerun()
+
+        # lazily minted assets, their vouchers are redeemed by the purchase
+        res = con.execute("SELECT id, uname FROM users")
+        user_ids = dict(res.fetchall())
+
+        for voucher in get_open_vouchers():
+
+            c = [c1, c2][i % 2]
+
+            pil_img = Image.open(voucher["filepath"])
+
+            pil_img = pil_img.resize((pil_img.width//4, pil_img.height//4))
+
+            c.image(pil_img, "Original Owner: %s. Not minted yet. Price (%f ETH)" % (
+                user_ids.get(voucher["owner_id"]), Web3.from_wei(voucher["voucher"]["price"], "ether")))
+
+            buy = c.button("Buy", key="voucher-%d" % voucher["id"])
 
             i += 1
 
             if buy:
-                self.on_image_buy(owner_agreement, asset_token_id, buyer_id)
+                self.on_voucher_buy(voucher["id"], buyer_id)
 
         con.close()
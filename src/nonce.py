@@ -0,0 +1,116 @@
+"""
+Per-account nonce allocation shared by every thread and process that signs
+for the same accounts.
+
+The next nonce of each (endpoint, account) lives in SQLite (src/db/nonces.db).
+A nonce is reserved inside a BEGIN IMMEDIATE transaction that stays open until
+the signed transaction has been handed to the node, so the Streamlit app and
+the job workers never use the same nonce twice and their transactions reach
+the node in nonce order.
+
+Submissions are serialized, not pipelined: with Hardhat's automining every
+transaction is mined in a block of its own as soon as it arrives. What callers
+gain is that they do not wait for a receipt before the next submission (see
+receipts.py).
+"""
+import threading
+import time
+from db import get_nonces_db
+from web3 import Web3
+from web3.exceptions import Web3RPCError
+
+
+class NonceManager:
+
+    def __init__(self, w3: Web3, endpoint: str, stale_after: float = 60) -> None:
+        """
+        Args:
+            stale_after: Seconds after which a stored nonce ahead of the node's
+            pending count is considered lost (dropped transactions, restarted node)
+            and is resynchronized with the node
+        """
+        self.w3 = w3
+        self.endpoint = endpoint
+        self.stale_after = stale_after
+
+    def submit(self, account: str, sign, send):
+        """
+        Signs and sends one transaction of an account with its next nonce.
+
+        The nonce database stays write locked from the allocation until the
+        node answered, across threads and processes. If signing fails, or the
+        node rejects the transaction (any error but "already known"), the
+        allocation is rolled back and the nonce is handed out again. Other
+        errors, like a timeout, leave it unknown whether the node has the
+        transaction: the nonce stays used until stale_after resynchronizes
+        the account.
+
+        Args:
+            sign: function of the nonce returning the signed raw transaction
+            send: function submitting the raw transaction, returning its hash
+        """
+        con = get_nonces_db()
+
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            pending = self.w3.eth.get_transaction_count(account, "pending")
+
+            res = con.execute("SELECT next_nonce, updated_at FROM nonces WHERE endpoint = ? AND account = ?", [
+                self.endpoint, account])
+            row = res.fetchone()
+
+            nonce = pending
+
+            if row is not None:
+                stored, updated_at = row
+                if stored > pending and now - updated_at < self.stale_after:
+                    nonce = stored
+
+            con.execute("INSERT INTO nonces (endpoint, account, next_nonce, updated_at) VALUES (?, ?, ?, ?) ON CONFLICT (endpoint, account) DO UPDATE SET next_nonce = excluded.next_nonce, updated_at = excluded.updated_at", [
+                self.endpoint, account, nonce + 1, now])
+
+            # nothing is sent if signing fails, the rollback frees the nonce
+            raw_transaction = sign(nonce)
+
+            try:
+                tx_hash = send(raw_transaction)
+            except Web3RPCError as e:
+                # the node answered: the nonce is free unless it already holds this very transaction
+                if "already known" in str(e).lower():
+                    con.execute("COMMIT")
+                raise
+            except Exception:
+                # the transaction may have reached the node
+                con.execute("COMMIT")
+                raise
+
+            con.execute("COMMIT")
+            return tx_hash
+        except BaseException:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            raise
+        finally:
+            con.close()
+
+    def resync(self, account: str):
+        """Forgets the local state of an account and restarts from the node's pending count"""
+
+        con = get_nonces_db()
+        con.execute("DELETE FROM nonces WHERE endpoint = ? AND account = ?", [
+            self.endpoint, account])
+        con.close()
+
+
+NONCE_MANAGERS: 'dict[str, NonceManager]' = dict()
+NONCE_MANAGERS_LOCK = threading.Lock()
+
+
+def get_nonce_manager(w3: Web3, endpoint: str) -> NonceManager:
+
+    with NONCE_MANAGERS_LOCK:
+        if endpoint not in NONCE_MANAGERS:
+            NONCE_MANAGERS[endpoint] = NonceManager(w3, endpoint)
+
+    return NONCE_MANAGERS[endpoint]
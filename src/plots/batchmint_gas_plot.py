@@ -2,7 +2,14 @@ from contract_local import AssetMarket, AssetFactory, AssetAgreement
 from web3 import Web3
 from json import dumps
 from Crypto.Random import get_random_bytes
+from gas_report import record_gas_report, print_gas_comparison
+import argparse
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--label", default="after",
+                        help="Name of this run in gas_report.json, e.g. before/after a contract change (Default: after)")
+    params = parser.parse_args()
+
     LOCAL_ETH_ENDPOINT = "http://127.0.0.1:8545/"
 
     w3 = Web3(Web3.HTTPProvider(LOCAL_ETH_ENDPOINT))
@@ -27,6 +34,18 @@ if __name__ == "__main__":
     b = a - m
     print("y = %dx + %d" % (m, b))
 
+    batch_data = {"mint(1)": a, "mint(2)": a + m}
+
+    for n in (10, 50, 100):
+        batch_data["mint(%d)" % n] = agreement.mint(
+            [0.01] * n, [True] * n).gasUsed
+
+    batch_data["per asset"] = m
+    batch_data["base"] = b
+
+    report = record_gas_report("batchmint", params.label, batch_data)
+    print_gas_comparison(report, "batchmint")
+
     import matplotlib.pyplot as plt
     import numpy as np
 
@@ -34,7 +53,7 @@ if __name__ == "__main__":
     plt.rc("font", size=14)
 
     x = np.linspace(1, 101, 105)
-    y = 14031 * x + 127299
+    y = m * x + b
 
     plt.plot(x, y, label="y = %dx + %d" % (m, b))
 
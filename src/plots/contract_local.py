@@ -258,6 +258,22 @@ class AssetAgreement(Contract):
         self.agreement_contract = get_Agreement_contract(
             http_endpoint, agreement_address, self.get_wallet_address(default=owner_address))
 
+    @staticmethod
+    def deploy(http_endpoint: str, owner_address: str, market_address: str):
+        """Deploys a full agreement, without the factory's clone"""
+        w3 = Web3(Web3.HTTPProvider(http_endpoint))
+        w3.eth.default_account = owner_address
+
+        w3_contract = w3.eth.contract(
+            abi=get_agreement_abi(), bytecode=get_agreement_bytecode())
+
+        tx_hash = Contract.send_contract_call(
+            w3_contract.constructor("ASSET", "ASSET", owner_address, market_address))
+
+        tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
+
+        return tx_receipt.contractAddress, tx_receipt.gasUsed
+
     def get_owner(self):
         return self.agreement_contract.functions.getOwner().call()
 
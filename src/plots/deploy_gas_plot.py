@@ -3,7 +3,14 @@ from contract_local import AssetMarket, AssetFactory, AssetAgreement
 from web3 import Web3
 from json import dumps
 from Crypto.Random import get_random_bytes
+from gas_report import record_gas_report, print_gas_comparison
+import argparse
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--label", default="after",
+                        help="Name of this run in gas_report.json, e.g. before/after a contract change (Default: after)")
+    params = parser.parse_args()
+
     LOCAL_ETH_ENDPOINT = "http://127.0.0.1:8545/"
 
     w3 = Web3(Web3.HTTPProvider(LOCAL_ETH_ENDPOINT))
@@ -22,6 +29,28 @@ if __name__ == "__main__":
     agreement = AssetAgreement(LOCAL_ETH_ENDPOINT, agreement_address, account)
     market = AssetMarket(LOCAL_ETH_ENDPOINT, market_address, account)
 
+    # onboarding cost of a data owner: a full agreement deployment followed by
+    # the market approval, against one clone of the factory's implementation
+    full_address, full_deploy_gas = AssetAgreement.deploy(
+        LOCAL_ETH_ENDPOINT, account, market_address)
+    full_approval_gas = AssetAgreement(LOCAL_ETH_ENDPOINT, full_address, account).set_approval_for_all(
+        market_address, True).gasUsed
+    full_gas = full_deploy_gas + full_approval_gas
+
+    print(dumps({"full_deploy": full_deploy_gas, "full_approval": full_approval_gas,
+                 "clone": agreement_gas, "saved": full_gas - agreement_gas,
+                 "saved_percent": 100 * (full_gas - agreement_gas) / full_gas}, indent=2))
+
+    # the factory deployment includes its implementation agreement, the
+    # one-off cost the clones are paid for with
+    report = record_gas_report("deploy", params.label, {
+        "AssetMarket": market_gas,
+        "AssetAgreementFactory": factory_gas,
+        "AssetAgreementFactory::createNewAssetAgreement": agreement_gas,
+        "AssetAgreement + setApprovalForAll": full_gas,
+    })
+    print_gas_comparison(report, "deploy")
+
     plt.bar(["Market Contract", "Factory Contract", "Agreement Contract"], [
             market_gas, factory_gas, agreement_gas])
     plt.tight_layout()
@@ -29,3 +58,12 @@ if __name__ == "__main__":
     plt.ylabel("Gas Consumption")
     plt.ticklabel_format(axis="y", useMathText=True, scilimits=(0, 0))
     plt.savefig("deploy_gas.png")
+
+    plt.figure()
+    plt.bar(["Full Agreement + Approval", "Clone Agreement"],
+            [full_gas, agreement_gas])
+    plt.tight_layout()
+    plt.subplots_adjust(bottom=0.1, left=0.15)
+    plt.ylabel("Gas Consumption")
+    plt.ticklabel_format(axis="y", useMathText=True, scilimits=(0, 0))
+    plt.savefig("agreement_deploy_gas.png")
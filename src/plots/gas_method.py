@@ -2,7 +2,14 @@ from contract_local import AssetMarket, AssetFactory, AssetAgreement
 from web3 import Web3
 from json import dumps
 from Crypto.Random import get_random_bytes
+from gas_report import record_gas_report, print_gas_comparison
+import argparse
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--label", default="after",
+                        help="Name of this run in gas_report.json, e.g. before/after a contract change (Default: after)")
+    params = parser.parse_args()
+
     LOCAL_ETH_ENDPOINT = "http://127.0.0.1:8545/"
 
     w3 = Web3(Web3.HTTPProvider(LOCAL_ETH_ENDPOINT))
@@ -47,7 +54,22 @@ if __name__ == "__main__":
     market_data["AssetMarket::withdrawRoyalty"] = market.withdraw_royalty(
         account).gasUsed
 
-    approval_gas = agreement.set_approval_for_all(market_address, True).gasUsed
+    report = record_gas_report(
+        "methods", params.label, {**agreement_data, **market_data})
+    print_gas_comparison(report, "methods")
+
+    # per-purchase cost of settlePurchase behind noReEntrancy, on fresh
+    # tokens so that every sale starts from the same storage state
+    purchase_count = 5
+    agreement.mint([0.01] * purchase_count, [True] * purchase_count)
+
+    purchase_data = {"AssetMarket::purchase #%d" % token_id: market.purchase(agreement_address, token_id, 0.01).gasUsed
+                     for token_id in range(1, purchase_count + 1)}
+    purchase_data["AssetMarket::purchase (mean)"] = sum(
+        purchase_data.values()) // purchase_count
+
+    report = record_gas_report("purchase", params.label, purchase_data)
+    print_gas_comparison(report, "purchase")
 
     import matplotlib.pyplot as plt
     from json import loads
@@ -71,7 +93,7 @@ if __name__ == "__main__":
     fig = plt.figure(figsize=(10, 8))
     plt.rc("font", size=16)
     plt.bar(["Market Contract", "Factory Contract", "Agreement Contract"], [
-            market_gas, factory_gas, agreement_gas + approval_gas])
+            market_gas, factory_gas, agreement_gas])
     plt.tight_layout(pad=2.3)
     # plt.xlabel("Contract Name", labelpad=10)
     plt.ylabel("Gas Consumption")
@@ -0,0 +1,120 @@
+import argparse
+import os
+import sys
+from hashlib import sha256
+from json import loads, dumps
+
+GAS_REPORT_PATH = "gas_report.json"
+# report key holding the digest of the contract sources each label was measured on
+SOURCES_KEY = "contracts"
+
+
+def contracts_digest(directory: str = "contracts") -> str:
+    """SHA-256 over the Solidity sources a run was measured on"""
+    digest = sha256()
+
+    for root, _, files in sorted(os.walk(directory)):
+        for name in sorted(files):
+            if name.endswith(".sol"):
+                path = os.path.join(root, name)
+                digest.update(path.encode())
+
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+
+    return digest.hexdigest()
+
+
+def record_gas_report(section: str, label: str, data: dict, path: str = GAS_REPORT_PATH):
+    """
+    Stores the gas measurements of one run under report[section][label], so
+    that runs against different contract versions (e.g. "before" and "after")
+    can be compared. The digest of the contract sources is kept with the label.
+    """
+    try:
+        with open(path, "r") as f:
+            report = loads(f.read())
+    except (OSError, ValueError):
+        report = dict()
+
+    report.setdefault(section, dict())[label] = data
+    report.setdefault(SOURCES_KEY, dict())[label] = contracts_digest()
+
+    with open(path, "w") as f:
+        f.write(dumps(report, indent=2))
+
+    return report
+
+
+def format_gas_comparison(report: dict, section: str, before: str = "before", after: str = "after") -> str:
+    """
+    Returns the gas difference of every measurement recorded under both
+    labels as a Markdown table, empty if either run is missing
+    """
+    runs = report.get(section, dict())
+
+    if before not in runs or after not in runs:
+        return ""
+
+    lines = ["| %s | %s | %s | change |" % (section, before, after),
+             "| --- | ---: | ---: | ---: |"]
+
+    for name, old in runs[before].items():
+        if name not in runs[after]:
+            continue
+
+        new = runs[after][name]
+        change = 100 * (new - old) / old if old else 0
+        lines.append("| %s | %d | %d | %.1f%% |" % (name, old, new, change))
+
+    return "\n".join(lines)
+
+
+def print_gas_comparison(report: dict, section: str, before: str = "before", after: str = "after"):
+    """Prints the gas difference of every measurement recorded under both labels"""
+    table = format_gas_comparison(report, section, before, after)
+
+    if table:
+        print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Writes the before/after comparison of every section of a gas report as Markdown")
+    parser.add_argument("--report", default=GAS_REPORT_PATH,
+                        help="Measurements recorded by gas_method.py, batchmint_gas_plot.py and deploy_gas_plot.py (Default: %s)" % GAS_REPORT_PATH)
+    parser.add_argument("--output", default=None,
+                        help="Markdown file to write, e.g. to check the comparison in (Default: print it)")
+    parser.add_argument("--before", default="before")
+    parser.add_argument("--after", default="after")
+    params = parser.parse_args()
+
+    with open(params.report, "r") as f:
+        report = loads(f.read())
+
+    sources = report.get(SOURCES_KEY, dict())
+    before_digest, after_digest = sources.get(params.before), sources.get(params.after)
+
+    # a comparison is only evidence if each side ran on its own contracts
+    if before_digest is None or after_digest is None:
+        sys.exit("%s has no run labelled %s and %s" % (params.report, params.before, params.after))
+
+    if before_digest == after_digest:
+        sys.exit("%s and %s were measured on the same contracts (%s)" % (params.before, params.after, before_digest))
+
+    tables = [format_gas_comparison(report, section, params.before, params.after)
+              for section in report if section != SOURCES_KEY]
+    tables = [table for table in tables if table]
+
+    if not tables:
+        sys.exit("No measurement was recorded under both %s and %s" % (params.before, params.after))
+
+    markdown = "Measured on contracts %s (%s) and %s (%s)\n\n" % (
+        before_digest[:12], params.before, after_digest[:12], params.after)
+    markdown += "\n\n".join(tables) + "\n"
+
+    if params.output is None:
+        print(markdown)
+    else:
+        with open(params.output, "w") as f:
+            f.write(markdown)
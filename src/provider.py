@@ -1,16 +1,180 @@
-import streamlit as st
+import threading
+from concurrent.futures import Future
 from web3 import Web3
+from web3.datastructures import AttributeDict
+from web3.exceptions import ContractLogicError, Web3RPCError
+from eth_utils.abi import get_abi_output_types
+from hexbytes import HexBytes
 
 
-def get_web3_provider(w3_endpoint):
+PROVIDERS: 'dict[str, Web3]' = dict()
+PROVIDERS_LOCK = threading.Lock()
 
-    if "W3_PROVIDER" not in st.session_state:
-        st.session_state["W3_PROVIDER"] = Web3(Web3.HTTPProvider(w3_endpoint))
 
-    provider: Web3 = st.session_state["W3_PROVIDER"]
+def get_web3_provider(endpoint: str) -> Web3:
+    """
+    Returns the process-wide Web3 instance of an endpoint. Connectivity is
+    checked once, when it is created: the HTTP provider opens a connection
+    per request, so a node that restarts later is reached again without
+    rebuilding it.
+    """
 
-    if not provider.is_connected():
-        provider = Web3(Web3.HTTPProvider(w3_endpoint))
-        st.session_state["W3_PROVIDER"] = provider
+    with PROVIDERS_LOCK:
+        if endpoint not in PROVIDERS:
+            w3 = Web3(Web3.HTTPProvider(
+                endpoint, request_kwargs={'verify': False}))
 
-    return provider
+            if not w3.is_connected():
+                raise ConnectionError("No Ethereum node at %s" % endpoint)
+
+            PROVIDERS[endpoint] = w3
+
+    return PROVIDERS[endpoint]
+
+
+BATCH_PROVIDERS: 'dict[str, Web3]' = dict()
+BATCH_PROVIDERS_LOCK = threading.Lock()
+
+
+def get_batch_provider(endpoint: str) -> Web3:
+    """Web3 instance shared by every batch sent to an endpoint"""
+
+    with BATCH_PROVIDERS_LOCK:
+        if endpoint not in BATCH_PROVIDERS:
+            BATCH_PROVIDERS[endpoint] = Web3(Web3.HTTPProvider(endpoint))
+
+    return BATCH_PROVIDERS[endpoint]
+
+
+# fields of JSON-RPC receipts and logs, by how they are decoded
+QUANTITY_FIELDS = {"blockNumber", "cumulativeGasUsed", "effectiveGasPrice", "gasUsed", "status",
+                   "transactionIndex", "type", "logIndex", "blobGasUsed", "blobGasPrice"}
+BYTES_FIELDS = {"blockHash", "transactionHash", "logsBloom", "data", "root"}
+ADDRESS_FIELDS = {"from", "to", "contractAddress", "address"}
+
+
+def format_rpc_object(raw: dict) -> AttributeDict:
+    """Decodes a raw receipt (or log) the way web3 returns it: ints, HexBytes and checksum addresses"""
+    formatted = dict()
+
+    for key, value in raw.items():
+        if value is None:
+            formatted[key] = None
+        elif key in QUANTITY_FIELDS:
+            formatted[key] = int(value, 16)
+        elif key in BYTES_FIELDS:
+            formatted[key] = HexBytes(value)
+        elif key in ADDRESS_FIELDS:
+            formatted[key] = Web3.to_checksum_address(value)
+        elif key == "topics":
+            formatted[key] = [HexBytes(topic) for topic in value]
+        elif key == "logs":
+            formatted[key] = [format_rpc_object(log) for log in value]
+        else:
+            formatted[key] = value
+
+    return AttributeDict(formatted)
+
+
+def rpc_error(error: dict) -> Exception:
+    """Exception for the error object of one JSON-RPC response"""
+    message = error.get("message", "")
+
+    if "revert" in message.lower():
+        return ContractLogicError(message, data=error.get("data"))
+
+    return Web3RPCError(message, rpc_response={"error": error})
+
+
+def _block_param(block):
+    return block if isinstance(block, str) else hex(block)
+
+
+class RPCBatch:
+    """
+    Queues read-only calls and sends them as a single JSON-RPC batch, in one
+    HTTP round trip.
+
+    Every queued call returns a Future that resolves once the batch is flushed.
+    Each response item is mapped to its own Future: a reverted call or a
+    missing receipt only affects its own result, never the rest of the batch.
+
+        with RPCBatch(LOCAL_ENDPOINT) as batch:
+            balances = [batch.get_balance(wallet) for wallet in wallets]
+
+        balances = [b.result() for b in balances]
+    """
+
+    def __init__(self, endpoint: str) -> None:
+        self.endpoint = endpoint
+        self.w3 = get_batch_provider(endpoint)
+        self._pending: 'list[tuple]' = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def request(self, method: str, params: list, format: callable = lambda result: result) -> Future:
+        """
+        Queues a raw JSON-RPC request.
+
+        Args:
+            format: decodes the raw result of the request
+        """
+        future = Future()
+        self._pending.append((method, params, format, future))
+        return future
+
+    def get_balance(self, address: str, block="latest") -> Future:
+        """Resolves to the balance in wei"""
+        return self.request("eth_getBalance", [address, _block_param(block)], lambda result: int(result, 16))
+
+    def get_transaction_receipt(self, tx_hash) -> Future:
+        """Resolves to the receipt, or None while the transaction is pending"""
+        return self.request("eth_getTransactionReceipt", [HexBytes(tx_hash).to_0x_hex()],
+                            lambda result: None if result is None else format_rpc_object(result))
+
+    def call(self, handle, name: str, args: tuple = (), block="latest") -> Future:
+        """Resolves to the decoded return value of a contract view, fails with ContractLogicError if it reverts"""
+        fn_abi = handle.get_function_by_name(name).abi
+        output_types = get_abi_output_types(fn_abi)
+
+        def decode(result):
+            values = [Web3.to_checksum_address(value) if type == "address" else value
+                      for type, value in zip(output_types, self.w3.codec.decode(output_types, HexBytes(result)))]
+            return values[0] if len(values) == 1 else values
+
+        return self.request("eth_call", [{"to": handle.address, "data": handle.encode_abi(name, args=list(args))},
+                                         _block_param(block)], decode)
+
+    def flush(self):
+        """Sends every queued call in one batch and resolves their futures"""
+        pending, self._pending = self._pending, []
+
+        if not pending:
+            return
+
+        try:
+            responses = self.w3.provider.make_batch_request(
+                [(method, params) for method, params, _, _ in pending])
+        except Exception as e:
+            for *_, future in pending:
+                future.set_exception(e)
+            return
+
+        # a node rejecting the whole batch answers with a single error object
+        if not isinstance(responses, list):
+            responses = [responses] * len(pending)
+
+        for (_, _, format, future), response in zip(pending, responses):
+            if "error" in response:
+                future.set_exception(rpc_error(response["error"]))
+                continue
+
+            try:
+                future.set_result(format(response.get("result")))
+            except Exception as e:
+                future.set_exception(e)
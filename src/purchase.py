@@ -0,0 +1,603 @@
+"""
+Purchase completion: watermarking, hashing and the on-chain settlement of a sale.
+
+Runs outside of Streamlit (see worker.py) so that a sale survives browser
+refreshes and long SSL encodes do not tie up the web tier.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import NamedTemporaryFile
+from web3 import Web3
+from web3.exceptions import ContractLogicError
+from contract import AssetMarket, AssetAgreement
+from constants import LOCAL_ENDPOINT
+from extract_watermark import WatermarkWrapper
+from db import get_demo_db
+from ledger import record_fee, PURCHASE, PURCHASE_BATCH
+from traceability import compute_asset_digest, compute_sale_hash, confirm_sale_hash, record_sale_hash
+from listings import get_listing, require_active_listing, set_listing_status, FILLED
+from vouchers import get_voucher, redeem_voucher, CANCELLED
+from commitments import queue_sale_hash, ONCHAIN, MERKLE
+import time
+
+
+def find_settled_purchase(asset_market: AssetMarket, agreement_address: str, token_id: int, img_hash: bytes,
+                          buyer_address: str, hash_mode: str = ONCHAIN):
+    """
+    Returns the receipt of the buyer's purchase of an asset if an earlier
+    attempt of the job already settled it, otherwise None. A retry must not
+    resubmit such a sale: the transaction would revert and the job would end
+    up failed although the asset was paid for and transferred.
+    """
+    holder = AssetAgreement(LOCAL_ENDPOINT, agreement_address).owner_of(token_id)
+
+    if holder != buyer_address:
+        return None
+
+    if hash_mode != MERKLE:
+        # recorded in the same transaction as the transfer
+        try:
+            agreement, _, recorded_token_id = asset_market.find_sale_record(
+                img_hash)
+        except ContractLogicError:
+            return None
+
+        if (agreement, recorded_token_id) != (agreement_address, token_id):
+            return None
+
+    return asset_market.find_purchase_receipt(agreement_address, token_id, buyer_address)
+
+
+def complete_purchase(market_address: str, manager_address: str, agreement_address: str, token_id: int, buyer_id: int,
+                      watermark_method: str = "lsb", report=lambda progress, message: None, listing_id: int = None,
+                      hash_mode: str = ONCHAIN):
+    """
+    Watermarks the asset for the buyer, records its hash and transfers it.
+
+    Args:
+        report: callback receiving (progress percentage, message) after each step
+        listing_id: signed listing to buy from (see listings.py), otherwise the
+        asset is bought at its on-chain price
+        hash_mode: ONCHAIN writes the hash in the purchase transaction, MERKLE
+        queues it for the next epoch commitment (see commitments.py)
+
+    Returns:
+        dict summarizing the purchase (hash, gas, fees, timings, watermarked file path)
+    """
+    overall_start = time.time()
+    con = get_demo_db()
+    timing_log = []
+
+    # Step 1: Get agreement and seller info
+    report(10, "Step 1/5: Fetching agreement and seller information...")
+    start_time = time.time()
+    if listing_id is not None:
+        _, listing, listing_signature = get_listing(listing_id)
+        price_wei, seller_address = listing["price"], listing["seller"]
+    else:
+        agreement = AssetAgreement(
+            LOCAL_ENDPOINT, agreement_address, manager_address)
+        price_wei, _, seller_address, _, _ = agreement.sale_info(token_id)
+
+    asset_price = Web3.from_wei(price_wei, "ether")
+
+    res = con.execute(
+        "SELECT id FROM users WHERE wallet = ?", [seller_address])
+    seller_id, = res.fetchone()
+    step1_time = time.time() - start_time
+    timing_log.append(f"1. Get agreement and seller info: {step1_time:.3f}s")
+
+    # Step 2: Load image and compute hash
+    report(30, "Step 2/5: Loading image and computing hash...")
+    start_time = time.time()
+    wm_image = NamedTemporaryFile(
+        "wb", suffix=".png", delete=False)
+
+    res = con.execute(
+        "SELECT assets.filepath FROM users LEFT JOIN assets ON users.id = assets.owner_id WHERE users.agreement = ? AND assets.token_id = ?", [agreement_address, token_id])
+
+    img_location, = res.fetchone()
+
+    with open(img_location, "rb") as f:
+        data = f.read()
+        wm_image.write(data)
+        img_hash = compute_sale_hash(data, seller_id, buyer_id)
+        img_hash_hex = img_hash.hex()
+        asset_digest = compute_asset_digest(data)
+    step2_time = time.time() - start_time
+    timing_log.append(f"2. Load image and compute hash: {step2_time:.3f}s")
+
+    wm_file_name = wm_image.name
+    wm_image.close()
+
+    # Step 3: Watermark the image
+    report(50, "Step 3/5: Applying watermark to the image...")
+    start_time = time.time()
+    wm = WatermarkWrapper(watermark_method)
+
+    wm.set_watermark(seller_id, buyer_id)
+    wm.watermark_image(wm_file_name)
+    step3_time = time.time() - start_time
+    timing_log.append(
+        f"3. Watermark image ({watermark_method.upper()}): {step3_time:.3f}s")
+
+    # Step 4: Authorize the hash and submit the purchase that records it
+    report(70, "Step 4/5: Authorizing hash and submitting purchase...")
+    start_time = time.time()
+    asset_market_manager = AssetMarket(
+        LOCAL_ENDPOINT, market_address, manager_address)
+
+    res = con.execute("SELECT wallet FROM users WHERE id = ?", [buyer_id])
+    buyer_wallet_address, = res.fetchone()
+
+    asset_market = AssetMarket(
+        LOCAL_ENDPOINT, market_address, buyer_wallet_address)
+
+    # recorded before submission, reconcile() settles it if this job dies midway
+    record_sale_hash(img_hash, asset_digest, agreement_address,
+                     token_id, seller_id, buyer_id)
+
+    settled_receipt = find_settled_purchase(
+        asset_market, agreement_address, token_id, img_hash, buyer_wallet_address, hash_mode)
+
+    if listing_id is not None and settled_receipt is None:
+        # replaced, delisted or expired since the job was queued
+        require_active_listing(listing_id)
+
+        if asset_market.is_listing_nonce_used(listing["seller"], listing["nonce"]):
+            raise RuntimeError(
+                "Listing %d was filled or cancelled on chain" % listing_id)
+
+    if settled_receipt is not None:
+        # settled by a previous attempt of this job, only the bookkeeping is left
+        purchase_tx = settled_receipt.transactionHash
+    elif hash_mode == MERKLE:
+        # the hash is committed with its epoch root, the purchase only transfers
+        if listing_id is not None:
+            purchase_tx = asset_market.purchase_listing_batch(
+                [listing], [listing_signature], wait=False)
+        else:
+            purchase_tx = asset_market.purchase(
+                agreement_address, token_id, asset_price, wait=False)
+    else:
+        signature = asset_market_manager.sign_sale_hash(
+            agreement_address, token_id, img_hash, buyer_wallet_address)
+
+        if listing_id is not None:
+            purchase_tx = asset_market.purchase_listing(
+                listing, listing_signature, img_hash, signature, wait=False)
+        else:
+            purchase_tx = asset_market.purchase_with_hash(
+                agreement_address, token_id, img_hash, signature, asset_price, wait=False)
+    step4_time = time.time() - start_time
+    timing_log.append(
+        f"4. Sign hash and submit purchase: {step4_time:.3f}s")
+
+    # Step 5: Wait for the purchase, the hash is recorded by the same transaction
+    report(90, "Step 5/5: Waiting for the transaction to be mined...")
+    start_time = time.time()
+    purchase_receipt = asset_market.wait_for_receipt(purchase_tx)
+
+    if purchase_receipt.status != 1:
+        raise RuntimeError("purchase transaction %s reverted" %
+                           purchase_receipt.transactionHash.to_0x_hex())
+
+    if listing_id is not None:
+        set_listing_status(listing_id, FILLED)
+
+    if hash_mode == MERKLE:
+        queue_sale_hash(img_hash, agreement_address, token_id)
+    else:
+        confirm_sale_hash(img_hash, purchase_receipt.blockNumber,
+                          purchase_receipt.transactionHash.to_0x_hex())
+
+    step5_time = time.time() - start_time
+
+    purchase_gas, purchase_fee_eth = record_fee(
+        purchase_receipt, PURCHASE, buyer_id, agreement_address, token_id)
+    timing_log.append(
+        f"5. Confirm purchase: {step5_time:.3f}s (block {purchase_receipt.blockNumber})")
+    recorded = "Queue hash for the next Merkle root" if hash_mode == MERKLE else "Record hash"
+    timing_log.append(
+        f"   - {recorded} and transfer asset to buyer: Gas: {purchase_gas:,} gas, Fee: {purchase_fee_eth:.9f} ETH")
+
+    total_gas = purchase_gas
+    total_fee_eth = purchase_fee_eth
+
+    total_time = time.time() - overall_start
+    timing_log.append(f"**Total time: {total_time:.3f}s**")
+    timing_log.append(f"**Total gas used: {total_gas:,} gas**")
+    timing_log.append(f"**Total gas fee: {total_fee_eth:.9f} ETH**")
+
+    con.close()
+
+    return {
+        "seller_id": seller_id,
+        "buyer_id": buyer_id,
+        "token_id": token_id,
+        "price": float(asset_price),
+        "img_hash": img_hash_hex,
+        "watermark_method": watermark_method,
+        "watermarked_file": wm_file_name,
+        "total_time": total_time,
+        "total_gas": total_gas,
+        "total_fee_eth": str(total_fee_eth),
+        "timing_log": timing_log,
+    }
+
+
+def complete_voucher_purchase(market_address: str, manager_address: str, voucher_row_id: int, buyer_id: int,
+                              watermark_method: str = "lsb", report=lambda progress, message: None):
+    """
+    Buys a lazily minted asset: watermarks it for the buyer, then one
+    purchaseVoucher transaction mints it to the buyer, pays the owner and
+    records the hash.
+
+    Returns:
+        dict summarizing the purchase, like complete_purchase
+    """
+    overall_start = time.time()
+    con = get_demo_db()
+    timing_log = []
+
+    # Step 1: Load the voucher
+    report(10, "Step 1/5: Loading the voucher...")
+    start_time = time.time()
+    voucher = get_voucher(voucher_row_id)
+
+    # a redeemed voucher may be this job's own purchase, checked on chain below
+    if voucher["status"] == CANCELLED:
+        raise RuntimeError("Voucher %d was withdrawn" % voucher_row_id)
+
+    agreement_address = voucher["agreement"]
+    seller_id = voucher["owner_id"]
+    asset_price = Web3.from_wei(voucher["voucher"]["price"], "ether")
+    step1_time = time.time() - start_time
+    timing_log.append(f"1. Load voucher: {step1_time:.3f}s")
+
+    # Step 2: Load image and compute hash
+    report(30, "Step 2/5: Loading image and computing hash...")
+    start_time = time.time()
+
+    with open(voucher["filepath"], "rb") as f:
+        data = f.read()
+
+    with NamedTemporaryFile("wb", suffix=".png", delete=False) as wm_image:
+        wm_image.write(data)
+
+    wm_file_name = wm_image.name
+    img_hash = compute_sale_hash(data, seller_id, buyer_id)
+    asset_digest = compute_asset_digest(data)
+    step2_time = time.time() - start_time
+    timing_log.append(f"2. Load image and compute hash: {step2_time:.3f}s")
+
+    # Step 3: Watermark the image
+    report(50, "Step 3/5: Applying watermark to the image...")
+    start_time = time.time()
+    watermark_assets(watermark_method, [(wm_file_name, seller_id, buyer_id)])
+    step3_time = time.time() - start_time
+    timing_log.append(
+        f"3. Watermark image ({watermark_method.upper()}): {step3_time:.3f}s")
+
+    # Step 4: Authorize the hash and submit the purchase that mints the asset
+    report(70, "Step 4/5: Authorizing hash and submitting purchase...")
+    start_time = time.time()
+    asset_market_manager = AssetMarket(
+        LOCAL_ENDPOINT, market_address, manager_address)
+
+    res = con.execute("SELECT wallet FROM users WHERE id = ?", [buyer_id])
+    buyer_wallet_address, = res.fetchone()
+
+    asset_market = AssetMarket(
+        LOCAL_ENDPOINT, market_address, buyer_wallet_address)
+
+    agreement = AssetAgreement(
+        LOCAL_ENDPOINT, agreement_address, manager_address)
+    voucher_id = voucher["voucher"]["voucherId"]
+    closed, _ = agreement.voucher_status(voucher_id)
+
+    if closed:
+        # a previous attempt may have been mined before the job died, a
+        # resubmission would revert with "Voucher redeemed or cancelled"
+        redemption = agreement.find_voucher_redemption(voucher_id)
+
+        if redemption is None:
+            raise RuntimeError(
+                "Voucher %d was cancelled on chain" % voucher_row_id)
+
+        _, redeemed_to, settled_receipt = redemption
+
+        if redeemed_to != buyer_wallet_address:
+            raise RuntimeError(
+                "Voucher %d was bought by another buyer" % voucher_row_id)
+
+        purchase_tx = settled_receipt.transactionHash
+    else:
+        signature = asset_market_manager.sign_voucher_sale_hash(
+            agreement_address, voucher_id, img_hash, buyer_wallet_address)
+        purchase_tx = asset_market.purchase_voucher(
+            agreement_address, voucher["voucher"], voucher["signature"], img_hash, signature, wait=False)
+    step4_time = time.time() - start_time
+    timing_log.append(
+        f"4. Sign hash and submit purchase: {step4_time:.3f}s")
+
+    # Step 5: Wait for the purchase, then record the minted token
+    report(90, "Step 5/5: Waiting for the transaction to be mined...")
+    start_time = time.time()
+    purchase_receipt = asset_market.wait_for_receipt(purchase_tx)
+
+    if purchase_receipt.status != 1:
+        raise RuntimeError("purchaseVoucher transaction %s reverted" %
+                           purchase_receipt.transactionHash.to_0x_hex())
+
+    token_id = agreement.voucher_token_from_receipt(purchase_receipt)
+    redeem_voucher(voucher_row_id, token_id)
+
+    # the Token ID only exists once minted, so the hash is recorded afterwards
+    record_sale_hash(img_hash, asset_digest, agreement_address,
+                     token_id, seller_id, buyer_id)
+    confirm_sale_hash(img_hash, purchase_receipt.blockNumber,
+                      purchase_receipt.transactionHash.to_0x_hex())
+
+    step5_time = time.time() - start_time
+
+    purchase_gas, purchase_fee_eth = record_fee(
+        purchase_receipt, PURCHASE, buyer_id, agreement_address, token_id)
+    timing_log.append(
+        f"5. Confirm purchase: {step5_time:.3f}s (block {purchase_receipt.blockNumber})")
+    timing_log.append(
+        f"   - Mint to buyer and record hash: Gas: {purchase_gas:,} gas, Fee: {purchase_fee_eth:.9f} ETH")
+
+    total_time = time.time() - overall_start
+    timing_log.append(f"**Total time: {total_time:.3f}s**")
+    timing_log.append(f"**Total gas used: {purchase_gas:,} gas**")
+    timing_log.append(f"**Total gas fee: {purchase_fee_eth:.9f} ETH**")
+
+    con.close()
+
+    return {
+        "seller_id": seller_id,
+        "buyer_id": buyer_id,
+        "token_id": token_id,
+        "price": float(asset_price),
+        "img_hash": img_hash.hex(),
+        "watermark_method": watermark_method,
+        "watermarked_file": wm_file_name,
+        "total_time": total_time,
+        "total_gas": purchase_gas,
+        "total_fee_eth": str(purchase_fee_eth),
+        "timing_log": timing_log,
+    }
+
+
+def _watermark_one(watermark_method: str, img_filepath: str, seller_id: int, buyer_id: int):
+    # one wrapper per thread: LSB wrappers own a private working directory
+    wm = WatermarkWrapper(watermark_method)
+    wm.set_watermark(seller_id, buyer_id)
+    wm.watermark_image(img_filepath)
+    return img_filepath
+
+
+def watermark_assets(watermark_method: str, images: 'list[tuple[str, int, int]]', max_workers: int = 4):
+    """
+    Watermarks several images in parallel.
+
+    Args:
+        images: (image path, seller ID, buyer ID) of every image, watermarked in place
+    """
+    if watermark_method == "ssl":
+        # the SSL pool already spreads encodes over its replicas
+        wm = WatermarkWrapper(watermark_method)
+        futures = [wm.submit_watermark_image(*image) for image in images]
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = [executor.submit(_watermark_one, watermark_method, *image)
+                   for image in images]
+        executor.shutdown(wait=False)
+
+    return [f.result() for f in futures]
+
+
+def complete_checkout(market_address: str, manager_address: str, items: 'list[dict]', buyer_id: int,
+                      watermark_method: str = "lsb", report=lambda progress, message: None,
+                      hash_mode: str = ONCHAIN):
+    """
+    Checks out a cart: watermarks every asset for the buyer in parallel, then
+    settles all of them and records their hashes with one purchaseListingBatch
+    (or purchaseBatch, for assets bought at their on-chain price) transaction.
+
+    Args:
+        items: {"agreement_address", "token_id"} of every asset in the cart,
+        with a "listing_id" either for all of them or for none
+        report: callback receiving (progress percentage, message) after each step
+        hash_mode: ONCHAIN records the hashes in the purchase transaction,
+        MERKLE queues them for the next epoch commitment instead
+
+    Returns:
+        dict summarizing the checkout (per item hash and watermarked file, gas, fees, timings)
+    """
+    overall_start = time.time()
+    con = get_demo_db()
+    timing_log = []
+
+    # Step 1: Get agreement and seller info of every item
+    report(10, "Step 1/5: Fetching agreement and seller information...")
+    start_time = time.time()
+    total_price_wei = 0
+    sales = []
+
+    listed = [item.get("listing_id") is not None for item in items]
+
+    if any(listed) and not all(listed):
+        raise ValueError("Cannot check out listed and unlisted assets together")
+
+    for item in items:
+        agreement_address, token_id = item["agreement_address"], item["token_id"]
+
+        if all(listed):
+            _, listing, listing_signature = get_listing(item["listing_id"])
+            price_wei, seller_address = listing["price"], listing["seller"]
+        else:
+            listing = listing_signature = None
+            agreement = AssetAgreement(
+                LOCAL_ENDPOINT, agreement_address, manager_address)
+            price_wei, _, seller_address, _, _ = agreement.sale_info(token_id)
+
+        # summed in wei, float ETH prices would not add up to the exact total
+        total_price_wei += price_wei
+
+        res = con.execute(
+            "SELECT id FROM users WHERE wallet = ?", [seller_address])
+        seller_id, = res.fetchone()
+
+        res = con.execute(
+            "SELECT assets.filepath FROM users LEFT JOIN assets ON users.id = assets.owner_id WHERE users.agreement = ? AND assets.token_id = ?", [agreement_address, token_id])
+        img_location, = res.fetchone()
+
+        sales.append({"agreement_address": agreement_address, "token_id": token_id,
+                      "seller_id": seller_id, "img_location": img_location,
+                      "listing_id": item.get("listing_id"), "listing": listing,
+                      "listing_signature": listing_signature})
+
+    step1_time = time.time() - start_time
+    timing_log.append(
+        f"1. Get agreement and seller info ({len(sales)} assets): {step1_time:.3f}s")
+
+    # Step 2: Load the images and compute their hashes
+    report(25, "Step 2/5: Loading images and computing hashes...")
+    start_time = time.time()
+
+    for sale in sales:
+        with open(sale["img_location"], "rb") as f:
+            data = f.read()
+
+        with NamedTemporaryFile("wb", suffix=".png", delete=False) as wm_image:
+            wm_image.write(data)
+
+        sale["watermarked_file"] = wm_image.name
+        sale["img_hash"] = compute_sale_hash(data, sale["seller_id"], buyer_id)
+        sale["asset_digest"] = compute_asset_digest(data)
+
+    step2_time = time.time() - start_time
+    timing_log.append(f"2. Load images and compute hashes: {step2_time:.3f}s")
+
+    # Step 3: Watermark every image in parallel
+    report(40, "Step 3/5: Applying watermarks to %d images..." % len(sales))
+    start_time = time.time()
+    watermark_assets(watermark_method, [
+        (sale["watermarked_file"], sale["seller_id"], buyer_id) for sale in sales])
+    step3_time = time.time() - start_time
+    timing_log.append(
+        f"3. Watermark images ({watermark_method.upper()}): {step3_time:.3f}s")
+
+    # Step 4: Authorize every hash and submit the batched purchase that records them
+    report(70, "Step 4/5: Authorizing hashes and submitting batched purchase...")
+    start_time = time.time()
+    asset_market_manager = AssetMarket(
+        LOCAL_ENDPOINT, market_address, manager_address)
+
+    res = con.execute("SELECT wallet FROM users WHERE id = ?", [buyer_id])
+    buyer_wallet_address, = res.fetchone()
+
+    asset_market = AssetMarket(
+        LOCAL_ENDPOINT, market_address, buyer_wallet_address)
+
+    for sale in sales:
+        record_sale_hash(sale["img_hash"], sale["asset_digest"], sale["agreement_address"],
+                         sale["token_id"], sale["seller_id"], buyer_id)
+
+    agreement_addresses = [sale["agreement_address"] for sale in sales]
+    token_ids = [sale["token_id"] for sale in sales]
+
+    # the batch is atomic, a previous attempt settled either every item or none
+    settled_receipts = [find_settled_purchase(asset_market, sale["agreement_address"], sale["token_id"],
+                                              sale["img_hash"], buyer_wallet_address, hash_mode) for sale in sales]
+
+    if all(receipt is not None for receipt in settled_receipts):
+        purchase_tx = settled_receipts[0].transactionHash
+    elif any(receipt is not None for receipt in settled_receipts):
+        raise RuntimeError("Checkout was partially settled outside of its batch")
+    else:
+        for sale in sales:
+            if sale["listing_id"] is None:
+                continue
+
+            # replaced, delisted or expired since the job was queued
+            require_active_listing(sale["listing_id"])
+
+            if asset_market.is_listing_nonce_used(sale["listing"]["seller"], sale["listing"]["nonce"]):
+                raise RuntimeError(
+                    "Listing %d was filled or cancelled on chain" % sale["listing_id"])
+
+        # in MERKLE mode the hashes are committed with their epoch root instead
+        hashes = hash_signatures = None
+
+        if hash_mode != MERKLE:
+            hashes = [sale["img_hash"] for sale in sales]
+            hash_signatures = [asset_market_manager.sign_sale_hash(
+                sale["agreement_address"], sale["token_id"], sale["img_hash"], buyer_wallet_address) for sale in sales]
+
+        if all(listed):
+            purchase_tx = asset_market.purchase_listing_batch(
+                [sale["listing"] for sale in sales], [sale["listing_signature"] for sale in sales],
+                hashes, hash_signatures, wait=False)
+        else:
+            purchase_tx = asset_market.purchase_batch(
+                agreement_addresses, token_ids, Web3.from_wei(total_price_wei, "ether"),
+                hashes, hash_signatures, wait=False)
+    step4_time = time.time() - start_time
+    timing_log.append(
+        f"4. Sign hashes and submit batched purchase: {step4_time:.3f}s")
+
+    # Step 5: Wait for the purchase, the hashes are recorded by the same transaction
+    report(90, "Step 5/5: Waiting for the transaction to be mined...")
+    start_time = time.time()
+    purchase_receipt = asset_market.wait_for_receipt(purchase_tx)
+
+    if purchase_receipt.status != 1:
+        raise RuntimeError("purchase transaction %s reverted" %
+                           purchase_receipt.transactionHash.to_0x_hex())
+
+    for sale in sales:
+        if sale["listing_id"] is not None:
+            set_listing_status(sale["listing_id"], FILLED)
+
+        if hash_mode == MERKLE:
+            queue_sale_hash(sale["img_hash"], sale["agreement_address"], sale["token_id"])
+        else:
+            confirm_sale_hash(sale["img_hash"], purchase_receipt.blockNumber,
+                              purchase_receipt.transactionHash.to_0x_hex())
+
+    step5_time = time.time() - start_time
+
+    # a batch covers several tokens, its fee is recorded once without a token
+    purchase_gas, purchase_fee_eth = record_fee(
+        purchase_receipt, PURCHASE_BATCH, buyer_id)
+
+    timing_log.append(
+        f"5. Confirm purchase: {step5_time:.3f}s (block {purchase_receipt.blockNumber})")
+    recorded = "Queue hashes for the next Merkle root" if hash_mode == MERKLE else "Record hashes"
+    timing_log.append(
+        f"   - {recorded} and transfer assets to buyer: Gas: {purchase_gas:,} gas, Fee: {purchase_fee_eth:.9f} ETH")
+
+    total_gas = purchase_gas
+    total_fee_eth = purchase_fee_eth
+
+    total_time = time.time() - overall_start
+    timing_log.append(f"**Total time: {total_time:.3f}s**")
+    timing_log.append(f"**Total gas used: {total_gas:,} gas**")
+    timing_log.append(f"**Total gas fee: {total_fee_eth:.9f} ETH**")
+
+    con.close()
+
+    return {
+        "buyer_id": buyer_id,
+        "items": [{"agreement_address": sale["agreement_address"], "token_id": sale["token_id"],
+                   "seller_id": sale["seller_id"], "img_hash": sale["img_hash"].hex(),
+                   "watermarked_file": sale["watermarked_file"]} for sale in sales],
+        "price": float(Web3.from_wei(total_price_wei, "ether")),
+        "watermark_method": watermark_method,
+        "total_time": total_time,
+        "total_gas": total_gas,
+        "total_fee_eth": str(total_fee_eth),
+        "timing_log": timing_log,
+    }
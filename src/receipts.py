@@ -0,0 +1,194 @@
+"""
+Shared transaction receipt waiter.
+
+One ReceiptTracker per endpoint follows the chain head through a block filter.
+Whenever new blocks arrive it fetches the head and the receipts of every
+pending transaction in a single JSON-RPC batch, so concurrent waiters cost one
+filter poll per interval and one round trip per new head, instead of one
+receipt poll each.
+"""
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from hexbytes import HexBytes
+from web3 import Web3
+from provider import RPCBatch
+from constants import RECEIPT_CONFIRMATIONS
+
+
+class PendingReceipt:
+
+    def __init__(self, tx_hash: HexBytes, deadline: float) -> None:
+        self.tx_hash = tx_hash
+        self.deadline = deadline
+        self.future = Future()
+        self.receipt = None
+
+
+class ReceiptTracker:
+
+    def __init__(self, endpoint: str, confirmations: int = 0, poll_interval: float = 0.1, sweep_interval: float = 5) -> None:
+        """
+        Args:
+            confirmations: Number of blocks mined on top of a transaction's block before it resolves
+            poll_interval: Seconds between two polls of the block filter
+            sweep_interval: Seconds between two direct receipt checks of every pending
+            transaction, covers blocks missed while the filter was being (re)created
+        """
+        self.endpoint = endpoint
+        self.confirmations = confirmations
+        self.poll_interval = poll_interval
+        self.sweep_interval = sweep_interval
+        self.w3 = Web3(Web3.HTTPProvider(endpoint))
+
+        self._pending: 'dict[HexBytes, list[PendingReceipt]]' = dict()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread = None
+        # last error of the tracker thread, reported once and attached to timeouts
+        self._error: Exception = None
+
+    def track(self, tx_hash, timeout: float = 600) -> Future:
+        """Returns a future resolving to the receipt of a submitted transaction"""
+        entry = PendingReceipt(HexBytes(tx_hash), time.time() + timeout)
+
+        with self._lock:
+            self._pending.setdefault(entry.tx_hash, []).append(entry)
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, daemon=True)
+                self._thread.start()
+
+        # instant-mining nodes have the receipt before the first new block is seen
+        try:
+            self._check([entry.tx_hash])
+        except Exception:
+            # the tracker thread picks it up on its next sweep
+            pass
+
+        return entry.future
+
+    def wait(self, tx_hash, timeout: float = 600):
+        # the tracker thread expires the wait, the grace only guards against a stuck thread
+        return self.track(tx_hash, timeout).result(timeout + self.sweep_interval)
+
+    def wait_all(self, tx_hashes: list, timeout: float = 600):
+        """Waits for several transactions together, returns their receipts in order"""
+        futures = [self.track(tx_hash, timeout) for tx_hash in tx_hashes]
+        deadline = time.time() + timeout + self.sweep_interval
+        return [f.result(max(0, deadline - time.time())) for f in futures]
+
+    def _check(self, tx_hashes: 'list[HexBytes]'):
+        """
+        Fetches the head and the receipts of the given transactions in one
+        batch and resolves what is confirmed. Pending transactions have no
+        receipt yet and simply stay pending.
+        """
+
+        if not tx_hashes:
+            return
+
+        with RPCBatch(self.endpoint) as batch:
+            head = batch.request("eth_blockNumber", [], lambda result: int(result, 16))
+            receipts = [(tx_hash, batch.get_transaction_receipt(tx_hash))
+                        for tx_hash in tx_hashes]
+
+        for tx_hash, future in receipts:
+            try:
+                receipt = future.result()
+            except Exception:
+                continue
+
+            with self._lock:
+                for entry in self._pending.get(tx_hash, []):
+                    entry.receipt = receipt
+
+        self._resolve(head.result())
+
+    def _resolve(self, head: int = None):
+        """Resolves confirmed receipts and expires timed out waits. Without a head only expires."""
+        now = time.time()
+
+        with self._lock:
+            for tx_hash in list(self._pending.keys()):
+                remaining = []
+
+                for entry in self._pending[tx_hash]:
+                    if entry.future.done():
+                        continue
+
+                    if head is not None and entry.receipt is not None and head - entry.receipt.blockNumber >= self.confirmations:
+                        entry.future.set_result(entry.receipt)
+                    elif now > entry.deadline:
+                        message = "Transaction %s not mined after its timeout" % tx_hash.to_0x_hex()
+
+                        if self._error is not None:
+                            message += " (last node error: %s)" % self._error
+
+                        entry.future.set_exception(TimeoutError(message))
+                    else:
+                        remaining.append(entry)
+
+                if remaining:
+                    self._pending[tx_hash] = remaining
+                else:
+                    del self._pending[tx_hash]
+
+    def _pending_hashes(self):
+        with self._lock:
+            return list(self._pending.keys())
+
+    def _run(self):
+        block_filter = None
+        last_sweep = 0
+
+        while True:
+            with self._lock:
+                if not self._pending:
+                    # stop following the chain until something is tracked again
+                    self._thread = None
+                    return
+
+            try:
+                if block_filter is None:
+                    block_filter = self.w3.eth.filter("latest")
+
+                new_blocks = block_filter.get_new_entries()
+                sweep = time.time() - last_sweep > self.sweep_interval
+
+                if not new_blocks and not sweep:
+                    self._resolve()
+                    time.sleep(self.poll_interval)
+                    continue
+
+                # one batch for every pending transaction, a reorg shows up as a changed receipt
+                self._check(self._pending_hashes())
+                self._error = None
+
+                if sweep:
+                    last_sweep = time.time()
+            except Exception as e:
+                # the node dropped the filter (restart) or is unreachable, recreate it on the next round
+                if self._error is None or str(e) != str(self._error):
+                    traceback.print_exc()
+
+                self._error = e
+                block_filter = None
+                # waits still expire while the node is unreachable
+                self._resolve()
+                time.sleep(1)
+
+TRACKERS: 'dict[str, ReceiptTracker]' = dict()
+TRACKERS_LOCK = threading.Lock()
+
+
+def get_receipt_tracker(endpoint: str) -> ReceiptTracker:
+    """Returns the process-wide receipt tracker of an endpoint"""
+
+    with TRACKERS_LOCK:
+        if endpoint not in TRACKERS:
+            TRACKERS[endpoint] = ReceiptTracker(
+                endpoint, confirmations=RECEIPT_CONFIRMATIONS)
+
+    return TRACKERS[endpoint]
@@ -0,0 +1,56 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import argparse
+import os
+
+import torch
+from safetensors.torch import save_file
+
+import utils
+
+
+def convert_backbone(model_path, model_name, output_path):
+    """
+    Convert a pickled backbone checkpoint into a memory-mappable .safetensors file.
+    The saved state dict covers every key of the architecture, so that it can be loaded strictly.
+    """
+    model = utils.build_architecture(model_name)
+    state_dict = utils.load_checkpoint_state_dict(model_path)
+    utils.check_key_coverage(model, state_dict, model_path)
+    model.load_state_dict(state_dict, strict=False)
+    state_dict = {k: v.detach().cpu().contiguous() for k, v in model.state_dict().items()}
+    save_file(state_dict, output_path)
+
+
+def convert_normalization_layer(normlayer_path, output_path):
+    """
+    Convert a pickled normalization layer ({"weight", "bias"}) into a .safetensors file.
+    """
+    checkpoint = torch.load(normlayer_path, map_location="cpu", weights_only=False)
+    state_dict = {k: checkpoint[k].detach().cpu().contiguous() for k in ['weight', 'bias']}
+    save_file(state_dict, output_path)
+
+
+if __name__ == '__main__':
+
+    def get_parser():
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--model_name", type=str, default='resnet50', help="Marking network architecture. (Default: resnet50)")
+        parser.add_argument("--model_path", type=str, default="models/dino_r50_plus.pth", help="Path to the model (Default: /models/dino_r50_plus.pth)")
+        parser.add_argument("--normlayer_path", type=str, default="normlayers/out2048_yfcc_orig.pth", help="Path to the normalization layer (Default: /normlayers/out2048_yfcc_orig.pth)")
+        return parser
+
+    params = get_parser().parse_args()
+
+    for src_path, convert in [
+        (params.model_path, lambda src, dst: convert_backbone(src, params.model_name, dst)),
+        (params.normlayer_path, convert_normalization_layer),
+    ]:
+        dst_path = os.path.splitext(src_path)[0] + '.safetensors'
+        print('>>> Converting %s...' % src_path)
+        convert(src_path, dst_path)
+        print('Saved converted weights to {}'.format(dst_path))
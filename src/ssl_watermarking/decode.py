@@ -11,7 +11,50 @@ from ssl_watermarking import utils_img
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-def decode_0bit(imgs, carrier, angle, model):
+def detect_0bit(ft, carrier, angle):
+    """
+    0-bit watermarking detection statistics for a batch of features.
+
+    Args:
+        ft: Features BxD
+        carrier: Hypercone direction 1xD
+        angle: Angle of the hypercone
+
+    Returns:
+        R, cosine and log10_pvalue as numpy arrays of size B
+    """
+    rho = 1 + np.tan(angle)**2
+    dot_product = (ft @ carrier.T).squeeze(-1) # BxD @ Dx1 -> B
+    norm = torch.norm(ft, dim=-1) # BxD -> B
+    R = (rho * dot_product**2 - norm**2).cpu().numpy()
+    cosines = torch.abs(dot_product/norm).cpu().numpy()
+    log10_pvalues = utils.log10_cosine_pvalues(cosines, ft.shape[-1])
+    return R, cosines, log10_pvalues
+
+
+def extract_features(imgs, model, batch_size=32):
+    """
+    Extract the features of a list of PIL images, batching together the images of the same size.
+
+    Returns:
+        Features NxD in the order of imgs
+    """
+    groups = {}
+    for ii, img in enumerate(imgs):
+        groups.setdefault((img.mode, img.size), []).append(ii)
+    fts = [None] * len(imgs)
+    with torch.no_grad():
+        for indices in groups.values():
+            for start in range(0, len(indices), batch_size):
+                chunk = indices[start:start+batch_size]
+                batch = torch.stack([utils_img.default_transform(imgs[ii]) for ii in chunk]).to(device, non_blocking=True) # BxCxHxW
+                ft = model(batch) # BxCxWxH -> BxD
+                for jj, ii in enumerate(chunk):
+                    fts[ii] = ft[jj]
+    return torch.stack(fts)
+
+
+def decode_0bit(imgs, carrier, angle, model, batch_size=32):
     """
     0-bit watermarking detection.
 
@@ -20,6 +63,7 @@ def decode_0bit(imgs, carrier, angle, model):
         carrier: Hypercone direction 1xD
         angle: Angle of the hypercone
         model: Neural net model to extract the features
+        batch_size: Number of images of the same size forwarded together
 
     Returns:
         List of decoded datum as a dictionary for each image.
@@ -28,20 +72,22 @@ def decode_0bit(imgs, carrier, angle, model):
             - log10_pvalue: log10 of the p-value, i.e. if we were drawing O(1/pvalue) random carriers, 
                 on expectation, one of them would give an R bigger or equal to the one that is observed.
     """
-    rho = 1 + np.tan(angle)**2
-    decoded_data = []
+    if len(imgs) == 0:
+        return []
+    ft = extract_features(imgs, model, batch_size)
+    R, _, log10_pvalues = detect_0bit(ft, carrier, angle)
+    return [{'index': ii, 'R': float(R[ii]), 'log10_pvalue': float(log10_pvalues[ii])} for ii in range(len(imgs))]
 
-    for ii, img in enumerate(imgs):
-        img = utils_img.default_transform(img).unsqueeze(0).to(device, non_blocking=True) # 1xCxHxW
-        ft = model(img) # 1xCxWxH -> 1xD
-        dot_product = (ft @ carrier.T).squeeze() # 1xD @ Dx1 -> 1
-        norm = torch.norm(ft, dim=-1) # 1xD -> 1 
-        R = (rho * dot_product**2 - norm**2).item()
-        cosine = torch.abs(dot_product/norm)
-        log10_pvalue = np.log10(utils.cosine_pvalue(cosine.item(), ft.shape[-1]))
-        decoded_data.append({'index': ii, 'R': R, 'log10_pvalue': log10_pvalue})
-    
-    return decoded_data
+
+def filter_0bit(imgs, carrier, angle, model, batch_size=32):
+    """
+    Cheap pre-filter before multi-bit decoding: returns the indices of the images detected as watermarked (R > 0).
+    """
+    if len(imgs) == 0:
+        return []
+    ft = extract_features(imgs, model, batch_size)
+    R, _, _ = detect_0bit(ft, carrier, angle)
+    return np.nonzero(R > 0)[0].tolist()
 
 
 def decode_multibit(imgs, carrier, model):
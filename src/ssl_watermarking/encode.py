@@ -108,7 +108,7 @@ def watermark_0bit(img_loader, carrier, angle, model, transform, params):
                 if params.verbose>2:
                     rs = rho * dot_product**2 - norm**2 # Bx1-Bx1 -> Bx1
                     cosines = torch.abs(dot_product/norm) # Bx1/Bx1 -> Bx1
-                    log10_pvalues = [np.log10(utils.cosine_pvalue(cosines[ii].item(), ft.shape[-1])) for ii in range(len(batch_imgs))]
+                    log10_pvalues = utils.log10_cosine_pvalues(cosines.detach().squeeze(-1).cpu().numpy(), ft.shape[-1])
                     logs["R_avg"] = torch.mean(rs).item()
                     logs["R_min_max"] = (torch.min(rs).item(), torch.max(rs).item())
                     logs["log10_pvalue_avg"] = np.mean(log10_pvalues)
@@ -85,7 +85,7 @@ def main(params):
             print('>>> Generating carrier into %s' % carrier_path)
         carrier = utils.generate_carriers(1, D, output_fpath=carrier_path)
     carrier = carrier.to(device, non_blocking=True) # direction vector of the hypercone
-    angle = utils.pvalue_angle(dim=D, k=1, proba=params.target_fpr) # angle of the hypercone
+    angle = utils.cached_pvalue_angle(D, params.target_fpr) # angle of the hypercone
 
     # Decode only
     if params.decode_only:
@@ -34,13 +34,34 @@ def set_seed(seed):
     os.environ['PYTHONHASHSEED'] = str(seed)
 
 
+def build_model(model_name, model_path, normlayer_path, verbose=1):
+    """ Build the frozen backbone + normalization layer used to mark and decode images. """
+    if verbose > 0:
+        print('>>> Building backbone and normalization layer...')
+    backbone = utils.build_backbone(
+        path=utils.resolve_weights_path(model_path), name=model_name)
+    normlayer = utils.load_normalization_layer(
+        path=utils.resolve_weights_path(normlayer_path))
+    model = utils.NormLayerWrapper(backbone, normlayer)
+    for p in model.parameters():
+        p.requires_grad = False
+    model.eval()
+    return model
+
+
 class Watermark:
 
-    def __init__(self) -> None:
+    def __init__(self, model=None, work_dir=None) -> None:
+        """
+        Args:
+            model: Prebuilt model (e.g. shared with other replicas). Built from model_path if None.
+            work_dir: Private directory for the input/output images. Defaults to src/ssl_watermarking.
+        """
         self.base_dir = join(os.getcwd(),'src')
-        self.data_dir = join(self.base_dir,"ssl_watermarking", "input")
+        work_dir = join(self.base_dir, "ssl_watermarking") if work_dir is None else work_dir
+        self.data_dir = join(work_dir, "input")
         self.carrier_dir = join(self.base_dir,"ssl_watermarking","carriers")
-        self.output_dir = join(self.base_dir,"ssl_watermarking", "output","imgs")
+        self.output_dir = join(work_dir, "output","imgs")
         self.save_images = True
         self.decode_only = False
         self.verbose = 1
@@ -59,6 +80,7 @@ class Watermark:
         self.optimizer = "Adam,lr=0.01"
         self.scheduler = None
         self.batch_size = 1
+        self.num_workers = 4
         self.lambda_w = 5e4
         self.lambda_i = 1.0
 
@@ -68,6 +90,7 @@ class Watermark:
         # np.random.seed(0)
         self.carrier = None
         self.model = None
+        os.makedirs(join(self.data_dir, "0"), exist_ok=True)
         # If message file, set num_bits to the maximum number of message payload in the file
         if self.msg_path is not None:
             num_bits = utils.get_num_bits(
@@ -80,16 +103,9 @@ class Watermark:
             self.num_bits = num_bits
 
         # Loads backbone and normalization layer
-        if self.verbose > 0:
-            print('>>> Building backbone and normalization layer...')
-        backbone = utils.build_backbone(
-            path=self.model_path, name=self.model_name)
-        normlayer = utils.load_normalization_layer(
-            path=self.normlayer_path)
-        self.model = utils.NormLayerWrapper(backbone, normlayer)
-        for p in self.model.parameters():
-            p.requires_grad = False
-        self.model.eval()
+        if model is None:
+            model = build_model(self.model_name, self.model_path, self.normlayer_path, self.verbose)
+        self.model = model
 
         # Load or generate carrier and angle
         if not os.path.exists(self.carrier_dir):
@@ -134,7 +150,7 @@ class Watermark:
         if self.verbose > 0:
             print('>>> Loading images from %s...' % self.data_dir)
         dataloader = utils_img.get_dataloader(
-            self.data_dir, batch_size=self.batch_size)
+            self.data_dir, batch_size=self.batch_size, num_workers=self.num_workers)
 
         # Generate messages
         if self.verbose > 0:
@@ -0,0 +1,219 @@
+"""
+Multi-replica SSL watermarking worker pool.
+
+The backbone is built once in the parent process and moved to shared memory,
+every worker process wraps it in its own Watermark instance (private input and
+output directories) and runs with a bounded torch intra-op thread budget so
+that replicas do not oversubscribe the cores.
+"""
+import atexit
+import itertools
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from os.path import join
+from tempfile import mkdtemp
+
+import torch
+import torch.multiprocessing as mp
+
+from ssl_watermarking import main_multibit
+
+
+def _worker_loop(worker_id: int, model, num_threads: int, work_dir: str, jobs, results):
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+
+    wm = main_multibit.Watermark(
+        model=model, work_dir=join(work_dir, "worker_%i" % worker_id))
+    # the worker is already a separate process, do not fork dataloader workers from it
+    wm.num_workers = 0
+
+    while True:
+        job = jobs.get()
+
+        if job is None:
+            break
+
+        job_id, kind, args = job
+        # lets the parent fail this job if the process dies while running it
+        results.put((job_id, None, os.getpid()))
+
+        try:
+            if kind == "encode":
+                img_filepath, owner_id, buyer_id = args
+                wm.set_watermark(owner_id, buyer_id)
+                wm.watermark_image(img_filepath)
+                result = img_filepath
+            elif kind == "decode":
+                img_filepath, = args
+                result = wm.extract_watermark(img_filepath)
+            else:
+                raise ValueError("Unknown job kind: %s" % kind)
+            results.put((job_id, True, result))
+        except Exception as e:
+            # exceptions are not always picklable, send their representation instead
+            results.put((job_id, False, repr(e)))
+
+
+class WatermarkPool:
+
+    def __init__(self, num_workers: int = None, threads_per_worker: int = None,
+                 max_pending: int = None, start_method: str = "spawn") -> None:
+        """
+        Args:
+            num_workers: Number of model replicas. Default: one per 8 cores
+            threads_per_worker: torch intra-op threads of each replica. Default: cores / num_workers
+            max_pending: Maximum number of queued jobs before submit blocks. Default: 2 * num_workers
+            start_method: multiprocessing start method ("spawn" or "fork")
+        """
+        cpu_count = os.cpu_count() or 1
+        self.num_workers = num_workers or max(1, cpu_count // 8)
+        self.threads_per_worker = threads_per_worker or max(
+            1, cpu_count // self.num_workers)
+        self.max_pending = max_pending or 2 * self.num_workers
+
+        ctx = mp.get_context(start_method)
+        self._jobs = ctx.Queue(maxsize=self.max_pending)
+        self._results = ctx.Queue()
+        self._futures: 'dict[int, Future]' = dict()
+        self._futures_lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._work_dir = mkdtemp(prefix="ssl_wm_pool_")
+
+        # build the replicas' weights once and share them with every worker
+        wm = main_multibit.Watermark(work_dir=join(self._work_dir, "parent"))
+        self.model = wm.model
+        self.model.share_memory()
+
+        self._ctx = ctx
+        self._closing = False
+        # job each replica process (by pid) is running, failed if it dies (OOM, CUDA error)
+        self._running: 'dict[int, int]' = dict()
+        self._workers = [self._start_worker(i) for i in range(self.num_workers)]
+
+        self._collector = threading.Thread(
+            target=self._collect_results, daemon=True)
+        self._collector.start()
+
+    def _start_worker(self, worker_id: int):
+        w = self._ctx.Process(target=_worker_loop, args=(
+            worker_id, self.model, self.threads_per_worker, self._work_dir, self._jobs, self._results), daemon=True)
+        w.start()
+        return w
+
+    def _fail(self, job_id: int, error: Exception):
+        with self._futures_lock:
+            future = self._futures.pop(job_id, None)
+
+        if future is not None:
+            future.set_exception(error)
+
+    def _check_workers(self):
+        """Reports every replica that died to the collector and starts a replacement"""
+        for worker_id, w in enumerate(self._workers):
+            if w.is_alive() or self._closing:
+                continue
+
+            # queued behind everything the replica sent before it died, so a
+            # job it finished is not failed
+            self._results.put((None, None, (w.pid, w.exitcode)))
+            self._workers[worker_id] = self._start_worker(worker_id)
+
+    def _collect_results(self, poll_interval: float = 1.0):
+
+        while True:
+            # a steady stream of results from the other replicas must not hide a dead one
+            self._check_workers()
+
+            try:
+                item = self._results.get(timeout=poll_interval)
+            except queue.Empty:
+                continue
+
+            if item is None:
+                break
+
+            job_id, ok, result = item
+
+            if job_id is None:
+                pid, exitcode = result
+                running_job_id = self._running.pop(pid, None)
+
+                if running_job_id is not None:
+                    self._fail(running_job_id, RuntimeError(
+                        "SSL watermarking replica %d died (exit code %s)" % (pid, exitcode)))
+                continue
+
+            if ok is None:
+                # a replica started the job, result is its pid
+                self._running[result] = job_id
+                continue
+
+            for pid, running_job_id in list(self._running.items()):
+                if running_job_id == job_id:
+                    del self._running[pid]
+
+            with self._futures_lock:
+                future = self._futures.pop(job_id, None)
+
+            if future is None:
+                continue
+
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(result))
+
+    def _submit(self, kind: str, args: tuple, block: bool = True, timeout: float = None) -> Future:
+        job_id = next(self._job_ids)
+        future = Future()
+
+        with self._futures_lock:
+            self._futures[job_id] = future
+
+        try:
+            # bounded queue: blocks (or raises queue.Full) when every replica is busy and the backlog is full
+            self._jobs.put((job_id, kind, args), block=block, timeout=timeout)
+        except queue.Full:
+            with self._futures_lock:
+                self._futures.pop(job_id, None)
+            raise
+
+        return future
+
+    def submit_encode(self, img_filepath: str, owner_id: int, buyer_id: int, block: bool = True, timeout: float = None) -> Future:
+        """Watermark an image in place. The future resolves to the image path."""
+        return self._submit("encode", (img_filepath, owner_id, buyer_id), block, timeout)
+
+    def submit_decode(self, img_filepath: str, block: bool = True, timeout: float = None) -> Future:
+        """Extract the watermark of an image. The future resolves to (owner_id, buyer_id)."""
+        return self._submit("decode", (img_filepath,), block, timeout)
+
+    def shutdown(self):
+        self._closing = True
+
+        for _ in self._workers:
+            self._jobs.put(None)
+
+        for w in self._workers:
+            w.join()
+
+        self._results.put(None)
+
+
+POOL: WatermarkPool = None
+POOL_LOCK = threading.Lock()
+
+
+def get_watermark_pool(**kwargs) -> WatermarkPool:
+    """Returns the process-wide pool, starting it on first use."""
+    global POOL
+
+    with POOL_LOCK:
+        if POOL is None:
+            POOL = WatermarkPool(**kwargs)
+            atexit.register(POOL.shutdown)
+
+    return POOL
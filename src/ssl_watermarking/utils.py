@@ -5,50 +5,86 @@ import logging
 # LICENSE file in the root directory of this source tree.
 
 import os
+from functools import lru_cache
 import numpy as np
 import torch
 import torch.nn as nn
 from scipy.optimize import root_scalar
-from scipy.special import betainc
+from scipy.special import betainc, betaln
 from scipy.stats import ortho_group
 
 from torchvision import models
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-def build_backbone(path, name):
-    """ Build a pretrained torchvision backbone from its name.
-
-    Args:
-        path: path to the checkpoint, can be an URL
-        name: name of the architecture from torchvision (see https://pytorch.org/vision/stable/models.html) 
-        or timm (see https://rwightman.github.io/pytorch-image-models/models/). 
-        We highly recommand to use Resnet50 architecture as available in torchvision. 
-        Using other architectures (such as non-convolutional ones) might need changes in the implementation.
-    """
+def build_architecture(name):
+    """ Build an uninitialized torchvision/timm architecture from its name, without fetching pretrained weights. """
     if hasattr(models, name):
-        model = getattr(models, name)(pretrained=True)
+        model = getattr(models, name)(weights=None)
     else:
         import timm
         if name in timm.list_models():
-            model = timm.models.create_model(name, num_classes=0)
+            model = timm.models.create_model(name, pretrained=False, num_classes=0)
         else:
             raise NotImplementedError('Model %s does not exist in torchvision'%name)
     model.head = nn.Identity()
     model.fc = nn.Identity()
+    return model
+
+def load_checkpoint_state_dict(path):
+    """ Load a (DINO-style) pickled checkpoint and return the backbone state dict with cleaned-up keys. """
+    if path.startswith("http"):
+        checkpoint = torch.hub.load_state_dict_from_url(path, progress=False, map_location="cpu")
+    else:
+        checkpoint = torch.load(path, map_location="cpu", weights_only=False)
+    state_dict = checkpoint
+    for ckpt_key in ['state_dict', 'model_state_dict', 'teacher']:
+        if ckpt_key in checkpoint:
+            state_dict = checkpoint[ckpt_key]
+    state_dict = {k.replace("module.", ""): v for k, v in state_dict.items()}
+    state_dict = {k.replace("backbone.", ""): v for k, v in state_dict.items()}
+    return state_dict
+
+def check_key_coverage(model, state_dict, path):
+    """ Raise if the state dict does not provide every parameter and buffer of the model. """
+    missing = set(model.state_dict().keys()) - set(state_dict.keys())
+    # BatchNorm counters are not used in eval mode and are absent from some checkpoints
+    missing = {k for k in missing if not k.endswith('num_batches_tracked')}
+    if len(missing) > 0:
+        raise KeyError('Checkpoint %s is missing %i keys, e.g. %s' % (path, len(missing), sorted(missing)[:5]))
+
+def resolve_weights_path(path):
+    """ Returns the converted .safetensors sibling of a checkpoint if it exists, the checkpoint itself otherwise. """
+    if path is None or path.startswith("http"):
+        return path
+    converted = os.path.splitext(path)[0] + '.safetensors'
+    return converted if os.path.exists(converted) else path
+
+def build_backbone(path, name):
+    """ Build a torchvision backbone from its name and load its weights.
+
+    Args:
+        path: path to the checkpoint, can be an URL. 
+        Checkpoints converted with convert_weights.py (.safetensors) are memory-mapped and assigned without copies.
+        name: name of the architecture from torchvision (see https://pytorch.org/vision/stable/models.html) 
+        or timm (see https://rwightman.github.io/pytorch-image-models/models/). 
+        We highly recommand to use Resnet50 architecture as available in torchvision. 
+        Using other architectures (such as non-convolutional ones) might need changes in the implementation.
+    """
+    if path is not None and path.endswith('.safetensors'):
+        from safetensors.torch import load_file
+        # build on the meta device so that no parameter is allocated before being replaced by the mapped tensors
+        with torch.device('meta'):
+            model = build_architecture(name)
+        state_dict = load_file(path, device='cpu')
+        check_key_coverage(model, state_dict, path)
+        model.load_state_dict(state_dict, strict=True, assign=True)
+        return model.to(device, non_blocking=True)
+    model = build_architecture(name)
     if path is not None:
-        if path.startswith("http"):
-            checkpoint = torch.hub.load_state_dict_from_url(path, progress=False, map_location=device)
-        else:
-            cur_path = os.getcwd()
-            checkpoint = torch.load(path, map_location=device, weights_only=False)
-        state_dict = checkpoint
-        for ckpt_key in ['state_dict', 'model_state_dict', 'teacher']:
-            if ckpt_key in checkpoint:
-                state_dict = checkpoint[ckpt_key]
-        state_dict = {k.replace("module.", ""): v for k, v in state_dict.items()}
-        state_dict = {k.replace("backbone.", ""): v for k, v in state_dict.items()}
-        msg = model.load_state_dict(state_dict, strict=False)
+        state_dict = load_checkpoint_state_dict(path)
+        check_key_coverage(model, state_dict, path)
+        model.load_state_dict(state_dict, strict=False)
     return model.to(device, non_blocking=True)
 
 def get_linear_layer(weight, bias):
@@ -60,8 +96,12 @@ def get_linear_layer(weight, bias):
     return layer
 
 def load_normalization_layer(path, mode='whitening'):
-    """ Loads the normalization layer from a checkpoint and returns the layer. """
-    checkpoint = torch.load(path, map_location=device, weights_only=False)
+    """ Loads the normalization layer from a checkpoint (.pth or converted .safetensors) and returns the layer. """
+    if path.endswith('.safetensors'):
+        from safetensors.torch import load_file
+        checkpoint = load_file(path, device=str(device))
+    else:
+        checkpoint = torch.load(path, map_location=device, weights_only=False)
     if mode=='whitening':
         # if PCA whitening is used scale the feature by the dimension of the latent space
         D = checkpoint['weight'].shape[1] 
@@ -100,6 +140,72 @@ def cosine_pvalue(c, d, k=1):
         return 1.0
     return betainc(a, b, 1 - c ** 2)
 
+def log_betainc(a, b, x, max_iter=300, eps=1e-14):
+    """
+    Vectorized natural log of the regularized incomplete beta function I_x(a, b).
+    Where scipy's betainc would underflow (x small compared to the mean (a+1)/(a+b+2)),
+    the continued fraction is evaluated with the prefactor kept in log-space (modified Lentz method).
+    Args:
+        a, b: parameters of the beta function (scalars)
+        x: array of values in [0, 1]
+    """
+    x = np.asarray(x, dtype=np.float64)
+    out = np.empty_like(x)
+    use_cf = x < (a + 1.0) / (a + b + 2.0)
+    # far from the lower tail, the value is not small and can be computed directly
+    with np.errstate(divide='ignore'):
+        out[~use_cf] = np.log(betainc(a, b, x[~use_cf]))
+    xs = x[use_cf]
+    if xs.size == 0:
+        return out
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c = np.ones_like(xs)
+    d = 1.0 - qab * xs / qap
+    d = np.where(np.abs(d) < tiny, tiny, d)
+    d = 1.0 / d
+    h = d.copy()
+    for m in range(1, max_iter + 1):
+        m2 = 2 * m
+        aa = m * (b - m) * xs / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = np.where(np.abs(d) < tiny, tiny, d)
+        c = 1.0 + aa / c
+        c = np.where(np.abs(c) < tiny, tiny, c)
+        d = 1.0 / d
+        h *= d * c
+        aa = -(a + m) * (qab + m) * xs / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = np.where(np.abs(d) < tiny, tiny, d)
+        c = 1.0 + aa / c
+        c = np.where(np.abs(c) < tiny, tiny, c)
+        d = 1.0 / d
+        delta = d * c
+        h *= delta
+        if np.all(np.abs(delta - 1.0) < eps):
+            break
+    with np.errstate(divide='ignore'):
+        out[use_cf] = a * np.log(xs) + b * np.log1p(-xs) - betaln(a, b) - np.log(a) + np.log(h)
+    return out
+
+def log10_cosine_pvalues(cosines, d, k=1):
+    """
+    Vectorized log10 of cosine_pvalue for a batch of cosine values.
+    Stays finite for p-values far below the float64 range (strongly watermarked images).
+    Args:
+        cosines: array of cosine values
+        d: dimension of the features
+        k: number of dimensions of the projection
+    """
+    assert k>0
+    cosines = np.asarray(cosines, dtype=np.float64)
+    a = (d - k) / 2.0
+    b = k / 2.0
+    log10_pvalues = np.zeros_like(cosines)
+    positive = cosines >= 0
+    log10_pvalues[positive] = log_betainc(a, b, 1 - cosines[positive] ** 2) / np.log(10)
+    return log10_pvalues
+
 def pvalue_angle(dim, k=1, angle=None, proba=None):
     """
     Links the pvalue to the angle of the hyperspace. 
@@ -116,6 +222,11 @@ def pvalue_angle(dim, k=1, angle=None, proba=None):
     a = root_scalar(f, x0=0.49*np.pi, bracket=[0, np.pi/2])
     return a.root
 
+@lru_cache(maxsize=None)
+def cached_pvalue_angle(dim, proba, k=1):
+    """ pvalue_angle for a target FPR, computed once per (dim, proba, k). """
+    return pvalue_angle(dim, k=k, proba=proba)
+
 def generate_carriers(k, d, output_fpath=None):
     """
     Generate k random orthonormal vectors of size d. 
@@ -0,0 +1,138 @@
+"""
+Local index of the watermarked hashes written by AssetMarket.updateHash.
+
+A row is recorded before the hash is submitted and marked verified once the
+transaction is mined, so a crashed purchase leaves a row that reconcile()
+settles against the chain later.
+
+Usage (from the repository root):
+    python src/traceability.py --reconcile
+"""
+import argparse
+from json import loads
+from Crypto.Hash import SHA256
+from web3.exceptions import ContractLogicError
+from db import get_demo_db
+from provider import RPCBatch
+from contract import get_Market_contract
+from constants import LOCAL_ENDPOINT
+
+
+def compute_sale_hash(asset_data: bytes, seller_id: int, buyer_id: int):
+    """Hash written on chain for a sale: SHA-256 of the original asset and both user IDs (32 bytes each)"""
+    cipher = SHA256.new(asset_data)
+    cipher.update(seller_id.to_bytes(32, "big") + buyer_id.to_bytes(32, "big"))
+    return cipher.digest()
+
+
+def compute_asset_digest(asset_data: bytes):
+    return SHA256.new(asset_data).hexdigest()
+
+
+def record_sale_hash(img_hash: bytes, asset_digest: str, agreement: str, token_id: int, seller_id: int, buyer_id: int):
+    con = get_demo_db()
+    con.execute("INSERT OR REPLACE INTO sale_hashes (hash, asset_digest, agreement, token_id, seller_id, buyer_id, verified) VALUES (?, ?, ?, ?, ?, ?, 0)", [
+        img_hash.hex(), asset_digest, agreement, token_id, seller_id, buyer_id])
+    con.commit()
+    con.close()
+
+
+def confirm_sale_hash(img_hash: bytes, block_number: int, tx_hash: str):
+    """Marks a hash as recorded on chain by a mined updateHash transaction"""
+    con = get_demo_db()
+    con.execute("UPDATE sale_hashes SET block_number = ?, tx_hash = ?, verified = 1 WHERE hash = ?", [
+        block_number, tx_hash, img_hash.hex()])
+    con.commit()
+    con.close()
+
+
+def find_sale_hashes(asset_digest: str, seller_id: int = None, buyer_id: int = None):
+    """
+    Returns the recorded sales of an asset, latest first, optionally narrowed to a seller and/or buyer.
+
+    Returns:
+        list of (hash, agreement, token_id, seller_id, buyer_id, block_number, verified)
+    """
+    query = "SELECT hash, agreement, token_id, seller_id, buyer_id, block_number, verified FROM sale_hashes WHERE asset_digest = ?"
+    params = [asset_digest]
+
+    if seller_id is not None:
+        query += " AND seller_id = ?"
+        params.append(seller_id)
+
+    if buyer_id is not None:
+        query += " AND buyer_id = ?"
+        params.append(buyer_id)
+
+    con = get_demo_db()
+    res = con.execute(
+        query + " ORDER BY verified DESC, block_number DESC", params)
+    rows = res.fetchall()
+    con.close()
+
+    return [(bytes.fromhex(h), agreement, token_id, seller, buyer, block, bool(verified))
+            for h, agreement, token_id, seller, buyer, block, verified in rows]
+
+
+def reconcile(endpoint: str, market_address: str):
+    """
+    Checks every recorded hash against the chain in one batched request and
+    updates its verified flag. A node error fails the reconcile instead of
+    marking the hashes unverified. A hash is no longer verified once a later sale
+    of the same token overwrote it. Hashes committed in a Merkle root (see
+    commitments.py) are verified with their proof, queued ones are not on
+    chain yet.
+
+    Returns:
+        (number of verified hashes, number of unverified hashes)
+    """
+    con = get_demo_db()
+    res = con.execute(
+        "SELECT sale_hashes.hash, sale_hashes.agreement, sale_hashes.token_id, sale_leaves.epoch, sale_leaves.proof FROM sale_hashes LEFT JOIN sale_leaves ON sale_hashes.hash = sale_leaves.hash")
+    rows = res.fetchall()
+
+    market = get_Market_contract(endpoint, market_address)
+
+    with RPCBatch(endpoint) as batch:
+        records = [batch.call(market, "findSaleRecord", (bytes.fromhex(h),)) if proof is None else
+                   batch.call(market, "verifySaleHash", (epoch, agreement, token_id, bytes.fromhex(h),
+                                                         [bytes.fromhex(p) for p in loads(proof)]))
+                   for h, agreement, token_id, epoch, proof in rows]
+
+    verified = 0
+
+    for (h, agreement, token_id, _, proof), record in zip(rows, records):
+        try:
+            if proof is None:
+                recorded_agreement, _, recorded_token_id = record.result()
+                ok = (recorded_agreement, recorded_token_id) == (
+                    agreement, token_id)
+            else:
+                ok = record.result()
+        except ContractLogicError:
+            # findSaleRecord reverts for unknown or overwritten hashes, only
+            # that item of the batch fails
+            ok = False
+
+        verified += ok
+        con.execute("UPDATE sale_hashes SET verified = ? WHERE hash = ?", [
+                    ok, h])
+
+    con.commit()
+    con.close()
+
+    return verified, len(rows) - verified
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reconcile", action="store_true",
+                        help="Check every recorded hash against the chain")
+    params = parser.parse_args()
+
+    if params.reconcile:
+        with open("contracts.json", "r") as f:
+            market_address = loads(f.read())["market"][0]
+
+        print("verified: %d, not on chain: %d" %
+              reconcile(LOCAL_ENDPOINT, market_address))
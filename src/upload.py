@@ -4,8 +4,11 @@ from uuid import uuid4
 from contract import AssetAgreement, AssetFactory
 from constants import LOCAL_ENDPOINT
 from db import get_demo_db
-from web3 import Web3
+from ledger import record_fee, DEPLOY, MINT
 from user_utils import get_user_display_options, get_user_from_display
+from listings import create_listing
+from traceability import compute_asset_digest
+from vouchers import create_voucher
 import time
 from decimal import Decimal
 
@@ -35,6 +38,8 @@ class Upload:
             asset = st.file_uploader("Asset")
             price = st.number_input("Price (ETH)", min_value=0.0, step=0.01)
             resale = st.checkbox("Resale Allowed")
+            lazy = st.checkbox(
+                "Lazy mint", help="Sign a voucher instead of minting, the asset is minted to its first buyer")
             submit = st.form_submit_button("Publish")
 
             if owner is None:
@@ -76,66 +81,80 @@ class Upload:
             if owner_agreement is None:
                 start_time = time.time()
                 factory = AssetFactory(LOCAL_ENDPOINT, self.factory_address, owner_wallet)
-                # Call deploy and get receipt to calculate fee
-                from contract import Contract
-                tx_hash = Contract.send_contract_call(
-                    factory.factory_contract.functions.createNewAssetAgreement(
-                        "ASSET", "ASSET", self.market_address))
-                deploy_receipt = factory.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=600)
-                data = factory.factory_contract.events.NewContract().process_receipt(deploy_receipt)
-                owner_agreement = data[0]["args"]["contractAddress"]
-                deploy_gas = deploy_receipt.gasUsed
-                
-                agreement = AssetAgreement(
-                    LOCAL_ENDPOINT, owner_agreement, owner_wallet)
-                approval_receipt = agreement.set_approval_for_all(self.market_address, True)
-                approval_gas = approval_receipt.gasUsed
-                
-                # Calculate fees
-                deploy_tx = factory.w3.eth.get_transaction(deploy_receipt.transactionHash)
-                deploy_gas_price = deploy_tx.get('gasPrice') or deploy_receipt.get('effectiveGasPrice', 0)
-                deploy_fee_eth = Web3.from_wei(deploy_gas * deploy_gas_price, 'ether')
-                
-                approval_tx = agreement.w3.eth.get_transaction(approval_receipt.transactionHash)
-                approval_gas_price = approval_tx.get('gasPrice') or approval_receipt.get('effectiveGasPrice', 0)
-                approval_fee_eth = Web3.from_wei(approval_gas * approval_gas_price, 'ether')
+
+                # the clone's initializer already approves the market
+                deploy_tx = factory.deploy_asset_agreement(
+                    "ASSET", "ASSET", self.market_address, wait=False)
+                deploy_receipt = factory.wait_for_receipt(deploy_tx)
+                owner_agreement = factory.agreement_address_from_receipt(deploy_receipt)
+
+                step3_gas, step3_fee_eth = record_fee(
+                    deploy_receipt, DEPLOY, owner_id, owner_agreement)
 
                 con.execute("UPDATE users SET agreement = ? WHERE id = ?", [
                             owner_agreement, owner_id])
                 con.commit()
                 step3_time = time.time() - start_time
-                step3_gas = deploy_gas + approval_gas
-                step3_fee_eth = deploy_fee_eth + approval_fee_eth
                 total_gas += step3_gas
                 total_fee_eth += step3_fee_eth
                 timing_log.append(f"3. Deploy Asset Agreement contract: {step3_time:.3f}s (Gas: {step3_gas:,} gas, Fee: {step3_fee_eth:.9f} ETH)")
             else:
                 timing_log.append(f"3. Use existing Asset Agreement contract: 0.000s")
 
+            if lazy:
+                # Step 4: Sign a voucher, nothing is minted until the asset is bought
+                start_time = time.time()
+                voucher_id = create_voucher(LOCAL_ENDPOINT, owner_id, owner_wallet, owner_agreement,
+                                            new_file_location, compute_asset_digest(data), price, resale)
+                step4_time = time.time() - start_time
+                timing_log.append(f"4. Sign lazy mint voucher: {step4_time:.3f}s (no gas)")
+
+                total_time = time.time() - overall_start
+                timing_log.append(f"**Total time: {total_time:.3f}s**")
+                if total_gas > 0:
+                    timing_log.append(f"**Total gas used: {total_gas:,} gas**")
+                    timing_log.append(f"**Total gas fee: {total_fee_eth:.9f} ETH**")
+
+                st.write("Asset %s has been published as voucher #%d, it is minted when bought" %
+                         (asset.name, voucher_id))
+                st.success(f"✅ Published successfully in {total_time:.3f}s")
+
+                with st.expander("Publish Log"):
+                    for log_entry in timing_log:
+                        st.write(log_entry)
+                    st.write(f"Agreement contract: {owner_agreement}")
+                con.close()
+                return
+
             # Step 4: Mint asset
             start_time = time.time()
             agreement = AssetAgreement(
                 LOCAL_ENDPOINT, owner_agreement, owner_wallet)
 
-            token_id = agreement.get_next_token_id()
             mint_receipt = agreement.mint([price], [resale])
+
+            if mint_receipt.status != 1:
+                raise RuntimeError("mint transaction %s reverted" %
+                                   mint_receipt.transactionHash.to_0x_hex())
+
+            # read from the receipt, another mint may land between a prediction and this one
+            token_id, = agreement.minted_tokens_from_receipt(mint_receipt)
             step4_time = time.time() - start_time
-            mint_gas = mint_receipt.gasUsed
-            # Calculate fee
-            mint_tx = agreement.w3.eth.get_transaction(mint_receipt.transactionHash)
-            mint_gas_price = mint_tx.get('gasPrice') or mint_receipt.get('effectiveGasPrice', 0)
-            mint_fee_eth = Web3.from_wei(mint_gas * mint_gas_price, 'ether')
+            mint_gas, mint_fee_eth = record_fee(
+                mint_receipt, MINT, owner_id, owner_agreement, token_id)
             total_gas += mint_gas
             total_fee_eth += mint_fee_eth
             timing_log.append(f"4. Mint asset (Token ID: {token_id}): {step4_time:.3f}s (Gas: {mint_gas:,} gas, Fee: {mint_fee_eth:.9f} ETH)")
 
-            # Step 5: Save to database
+            # Step 5: Save to database and list the asset (signed off chain, no gas)
             start_time = time.time()
             res = con.execute("INSERT INTO assets (owner_id, filepath, token_id) VALUES (?, ?, ?)", [
                               owner_id, new_file_location, token_id])
             con.commit()
+            create_listing(LOCAL_ENDPOINT, self.market_address, owner_wallet,
+                           owner_agreement, token_id, price)
             step5_time = time.time() - start_time
-            timing_log.append(f"5. Save to database: {step5_time:.3f}s")
+            timing_log.append(f"5. Save to database and sign listing: {step5_time:.3f}s")
 
             total_time = time.time() - overall_start
             timing_log.append(f"**Total time: {total_time:.3f}s**")
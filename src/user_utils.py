@@ -3,7 +3,7 @@ Utility functions for user-related operations
 """
 from web3 import Web3
 from db import get_demo_db
-from provider import get_web3_provider
+from provider import RPCBatch
 from constants import LOCAL_ENDPOINT
 
 
@@ -28,10 +28,13 @@ def get_user_display_options(include_balance: bool = True):
     user_data_dict = {}
     
     if include_balance:
-        web3 = get_web3_provider(LOCAL_ENDPOINT)
-        for uname, wallet in users:
+        # every balance in one JSON-RPC batch instead of one request per user
+        with RPCBatch(LOCAL_ENDPOINT) as batch:
+            balances = [batch.get_balance(wallet) for _, wallet in users]
+
+        for (uname, wallet), balance in zip(users, balances):
             try:
-                balance_wei = web3.eth.get_balance(wallet)
+                balance_wei = balance.result()
                 balance_eth = Web3.from_wei(balance_wei, 'ether')
                 display_text = f"{uname} ({wallet[:10]}...{wallet[-8:]}) - {balance_eth:.4f} ETH"
             except Exception as e:
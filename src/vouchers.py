@@ -0,0 +1,135 @@
+"""
+Lazy minting: publishing signs a voucher with the owner's account and stores
+it in the local database. Nothing is minted until the asset is bought, then
+AssetMarket.purchaseVoucher mints it to the buyer in the purchase transaction.
+
+The chain is the source of truth of a voucher's status: withdrawing one
+cancels it on chain, and a purchase is only settled while the voucher is open.
+"""
+import secrets
+import time
+from db import get_demo_db
+from contract import AssetAgreement
+
+OPEN = "open"
+REDEEMED = "redeemed"
+CANCELLED = "cancelled"
+
+VOUCHER_COLUMNS = "id, voucher_id, owner_id, agreement, filepath, asset_digest, price, resale_allowed, signature, status"
+
+
+def create_voucher(endpoint: str, owner_id: int, owner_wallet: str, agreement: str, filepath: str, asset_digest: str,
+                   price: float, resale_allowed: bool) -> int:
+    """Signs a lazy mint voucher for a published asset and stores it. Returns its row ID."""
+    agreement_contract = AssetAgreement(endpoint, agreement, owner_wallet)
+
+    voucher, signature = agreement_contract.sign_voucher(
+        secrets.randbits(64), bytes.fromhex(asset_digest), price, resale_allowed)
+
+    con = get_demo_db()
+    cur = con.execute("INSERT INTO vouchers (voucher_id, owner_id, agreement, filepath, asset_digest, price, resale_allowed, signature, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        str(voucher["voucherId"]), owner_id, agreement, filepath, asset_digest, str(voucher["price"]),
+        resale_allowed, signature.hex(), OPEN, time.time()])
+    con.commit()
+    con.close()
+
+    return cur.lastrowid
+
+
+def _to_voucher(row):
+    row_id, voucher_id, owner_id, agreement, filepath, asset_digest, price, resale_allowed, signature, status = row
+
+    voucher = {"voucherId": int(voucher_id), "assetDigest": bytes.fromhex(asset_digest),
+               "price": int(price), "resaleAllowed": bool(resale_allowed)}
+
+    return {"id": row_id, "owner_id": owner_id, "agreement": agreement, "filepath": filepath,
+            "voucher": voucher, "signature": bytes.fromhex(signature), "status": status}
+
+
+def get_voucher(row_id: int):
+    """
+    Returns:
+        dict with the voucher as passed to AssetMarket.purchase_voucher, its signature and local details
+    """
+    con = get_demo_db()
+    res = con.execute("SELECT %s FROM vouchers WHERE id = ?" %
+                      VOUCHER_COLUMNS, [row_id])
+    row = res.fetchone()
+    con.close()
+
+    if row is None:
+        raise KeyError("Unknown voucher %d" % row_id)
+
+    return _to_voucher(row)
+
+
+def get_open_vouchers(owner_id: int = None):
+    """Returns the vouchers still waiting for a buyer, optionally of a single owner"""
+    query = "SELECT %s FROM vouchers WHERE status = ?" % VOUCHER_COLUMNS
+    params = [OPEN]
+
+    if owner_id is not None:
+        query += " AND owner_id = ?"
+        params.append(owner_id)
+
+    con = get_demo_db()
+    res = con.execute(query + " ORDER BY id", params)
+    rows = res.fetchall()
+    con.close()
+
+    return [_to_voucher(row) for row in rows]
+
+
+def redeem_voucher(row_id: int, token_id: int):
+    """
+    Records the token minted for a voucher: the asset becomes a regular
+    minted asset of its owner. Recording it again is a no-op.
+    """
+    con = get_demo_db()
+    res = con.execute(
+        "SELECT owner_id, filepath FROM vouchers WHERE id = ?", [row_id])
+    owner_id, filepath = res.fetchone()
+
+    cur = con.execute("UPDATE vouchers SET status = ?, token_id = ? WHERE id = ? AND status = ?", [
+        REDEEMED, token_id, row_id, OPEN])
+
+    if cur.rowcount:
+        con.execute("INSERT INTO assets (owner_id, filepath, token_id) VALUES (?, ?, ?)", [
+            owner_id, filepath, token_id])
+
+    con.commit()
+    con.close()
+
+
+def cancel_voucher(endpoint: str, row_id: int, owner_wallet: str):
+    """
+    Withdraws an unsold asset: cancels its voucher on chain with the owner's
+    account, so that a purchase already holding the signed voucher reverts.
+
+    Returns:
+        the cancelVoucher receipt, None if a previous attempt already cancelled it
+    """
+    voucher = get_voucher(row_id)
+    voucher_id = voucher["voucher"]["voucherId"]
+    agreement = AssetAgreement(endpoint, voucher["agreement"], owner_wallet)
+
+    closed, _ = agreement.voucher_status(voucher_id)
+    receipt = None
+
+    if closed and agreement.find_voucher_redemption(voucher_id) is not None:
+        raise RuntimeError("Voucher %d was already bought" % row_id)
+
+    if not closed:
+        receipt = agreement.cancel_voucher(voucher_id)
+
+        if receipt.status != 1:
+            raise RuntimeError("cancelVoucher transaction %s reverted" %
+                               receipt.transactionHash.to_0x_hex())
+
+    con = get_demo_db()
+    con.execute("UPDATE vouchers SET status = ? WHERE id = ? AND status = ?", [
+        CANCELLED, row_id, OPEN])
+    con.commit()
+    con.close()
+
+    return receipt
@@ -0,0 +1,110 @@
+"""
+Job worker: executes queued purchase and checkout jobs outside of the Streamlit process.
+
+Usage (from the repository root):
+    python src/worker.py [--threads N] [--commit_interval SECONDS]
+"""
+import argparse
+import socket
+import threading
+import time
+import traceback
+from json import loads
+from os import getpid
+from jobs import JobQueue
+from commitments import commit_epoch, enqueue_commit_epoch, ONCHAIN
+from constants import LOCAL_ENDPOINT
+from provider import get_web3_provider
+from purchase import complete_checkout, complete_purchase, complete_voucher_purchase
+
+
+def run_purchase(queue: JobQueue, job_id: int, payload: dict):
+    return complete_purchase(
+        payload["market_address"], payload["manager_address"], payload["agreement_address"],
+        payload["token_id"], payload["buyer_id"], payload["watermark_method"],
+        report=lambda progress, message: queue.report_progress(job_id, progress, message),
+        listing_id=payload.get("listing_id"), hash_mode=payload.get("hash_mode", ONCHAIN))
+
+
+def run_checkout(queue: JobQueue, job_id: int, payload: dict):
+    return complete_checkout(
+        payload["market_address"], payload["manager_address"], payload["items"],
+        payload["buyer_id"], payload["watermark_method"],
+        report=lambda progress, message: queue.report_progress(job_id, progress, message),
+        hash_mode=payload.get("hash_mode", ONCHAIN))
+
+
+def run_voucher_purchase(queue: JobQueue, job_id: int, payload: dict):
+    return complete_voucher_purchase(
+        payload["market_address"], payload["manager_address"], payload["voucher_id"],
+        payload["buyer_id"], payload["watermark_method"],
+        report=lambda progress, message: queue.report_progress(job_id, progress, message))
+
+
+def run_commit_epoch(queue: JobQueue, job_id: int, payload: dict):
+    return commit_epoch(LOCAL_ENDPOINT, payload["market_address"], payload["manager_address"])
+
+
+HANDLERS = {
+    "purchase": run_purchase,
+    "checkout": run_checkout,
+    "voucher": run_voucher_purchase,
+    "commit_epoch": run_commit_epoch,
+}
+
+
+def schedule_commits(queue: JobQueue, interval: float):
+    """Queues a Merkle root commitment of the pending sale hashes every interval seconds"""
+    with open("contracts.json", "r") as f:
+        market_address = loads(f.read())["market"][0]
+
+    manager_address = get_web3_provider(LOCAL_ENDPOINT).eth.accounts[0]
+
+    while True:
+        time.sleep(interval)
+        enqueue_commit_epoch(queue, market_address, manager_address)
+
+
+def work_forever(queue: JobQueue, worker: str, poll_interval: float = 0.5):
+
+    while True:
+        job = queue.claim(worker, list(HANDLERS.keys()))
+
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        job_id, kind, payload, attempts = job
+        print("[%s] job %d (%s), attempt %d" % (worker, job_id, kind, attempts))
+
+        try:
+            result = HANDLERS[kind](queue, job_id, payload)
+            queue.complete(job_id, result)
+        except Exception:
+            queue.fail(job_id, traceback.format_exc())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=4,
+                        help="Number of jobs processed concurrently (Default: 4)")
+    parser.add_argument("--poll_interval", type=float, default=0.5)
+    parser.add_argument("--commit_interval", type=float, default=0,
+                        help="Seconds between Merkle root commitments of the sale hashes (Default: 0, disabled)")
+    params = parser.parse_args()
+
+    queue = JobQueue()
+    name = "%s-%d" % (socket.gethostname(), getpid())
+
+    threads = [threading.Thread(target=work_forever, args=(queue, "%s-%d" % (name, i), params.poll_interval), daemon=True)
+               for i in range(params.threads)]
+
+    if params.commit_interval > 0:
+        threads.append(threading.Thread(target=schedule_commits, args=(
+            queue, params.commit_interval), daemon=True))
+
+    for t in threads:
+        t.start()
+
+    for t in threads:
+        t.join()
@@ -0,0 +1,69 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+
+class FakeNode:
+    """
+    Minimal JSON-RPC node over HTTP. handlers maps a method to a function of
+    its params returning ("result", value) or ("error", error object), every
+    HTTP request is counted in round_trips.
+    """
+
+    def __init__(self) -> None:
+        self.handlers = dict()
+        self.round_trips = 0
+        self.requests = []
+
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(
+                    int(self.headers["Content-Length"])))
+                node.round_trips += 1
+                node.requests.append(body)
+
+                if isinstance(body, list):
+                    response = [node.answer(request) for request in body]
+                else:
+                    response = node.answer(body)
+
+                data = json.dumps(response).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.endpoint = "http://127.0.0.1:%d" % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def answer(self, request):
+        kind, value = self.handlers[request["method"]](request["params"])
+        return {"jsonrpc": "2.0", "id": request["id"], kind: value}
+
+
+@pytest.fixture
+def node():
+    fake = FakeNode()
+    yield fake
+    fake.server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def repository_root(monkeypatch):
+    # database and artifact paths are relative to the repository root
+    monkeypatch.chdir(ROOT)
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+from hexbytes import HexBytes
+from web3 import Web3
+
+import artifacts
+from artifacts import Artifact
+from async_contract import SyncContractClient
+from contract import Contract
+from test_provider import MINED, WALLET, receipt
+
+AGREEMENTS = [Web3.to_checksum_address("0x%040x" % i) for i in range(1, 9)]
+
+ABI = [{"type": "function", "name": "tokensOfOwner", "stateMutability": "view",
+        "inputs": [{"name": "owner", "type": "address"}],
+        "outputs": [{"name": "", "type": "uint256[]"}]},
+       {"type": "function", "name": "setApprovalForAll", "stateMutability": "nonpayable",
+        "inputs": [{"name": "operator", "type": "address"}, {"name": "approved", "type": "bool"}],
+        "outputs": []}]
+
+
+def uint_array(values):
+    return "0x" + "%064x" % 32 + "%064x" % len(values) + "".join("%064x" % v for v in values)
+
+
+@pytest.fixture(autouse=True)
+def agreement_abi(monkeypatch):
+    # the Hardhat artifacts are not compiled in the test environment
+    monkeypatch.setattr(artifacts.ARTIFACTS, "get", lambda filename: Artifact(filename, "", ABI, "0x", None))
+
+
+@pytest.fixture
+def client(node):
+    client = SyncContractClient(node.endpoint, max_concurrency=4)
+    yield client
+    client.close()
+
+
+def serve_holdings(node, delay):
+    """Each agreement i holds Token ID i, except agreement 2 (nothing) and agreement 3 (reverts)"""
+    in_flight, peak, lock = [0], [0], threading.Lock()
+
+    def tokens_of_owner(params):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+
+        time.sleep(delay)
+
+        with lock:
+            in_flight[0] -= 1
+
+        index = AGREEMENTS.index(Web3.to_checksum_address(params[0]["to"])) + 1
+
+        if index == 3:
+            return "error", {"code": 3, "message": "execution reverted", "data": "0x"}
+
+        return "result", uint_array([] if index == 2 else [index])
+
+    node.handlers["eth_call"] = tokens_of_owner
+    node.handlers["eth_chainId"] = lambda params: ("result", "0x7a69")
+    return peak
+
+
+def test_holdings_are_read_concurrently(node, client):
+    peak = serve_holdings(node, delay=0.2)
+
+    start = time.time()
+    holdings = client.fetch_holdings(WALLET, AGREEMENTS)
+    elapsed = time.time() - start
+
+    assert holdings == {agreement: [i + 1] for i, agreement in enumerate(AGREEMENTS) if i + 1 not in (2, 3)}
+    # bounded by max_concurrency, overlapping instead of summing the 8 latencies
+    assert peak[0] == 4
+    assert elapsed < 8 * 0.2
+
+
+def test_transactions_resolve_through_the_receipt_tracker(node, client, monkeypatch):
+    sent = []
+
+    def send_contract_call(call, value=None, sender=None, gas=None):
+        sent.append((call.fn_name, call.args, sender, threading.current_thread()))
+        return HexBytes(MINED)
+
+    monkeypatch.setattr(Contract, "send_contract_call", staticmethod(send_contract_call))
+    node.handlers["eth_blockNumber"] = lambda params: ("result", "0x6")
+    node.handlers["eth_getTransactionReceipt"] = lambda params: ("result", receipt(params[0]))
+    node.handlers["eth_newBlockFilter"] = lambda params: ("result", "0x1")
+    node.handlers["eth_getFilterChanges"] = lambda params: ("result", [])
+    node.handlers["web3_clientVersion"] = lambda params: ("result", "FakeNode")
+
+    agreement = client.client.agreement(AGREEMENTS[0], WALLET)
+    tx_receipt = client.run(agreement.set_approval_for_all(AGREEMENTS[1], True), timeout=10)
+
+    assert tx_receipt.transactionHash == HexBytes(MINED)
+    (fn_name, args, sender, thread), = sent
+    assert (fn_name, args, sender) == ("setApprovalForAll", (AGREEMENTS[1], True), WALLET)
+    # signing holds the nonce lock, it must not run on the event loop thread
+    assert thread is not client._thread
+
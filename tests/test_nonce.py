@@ -0,0 +1,72 @@
+import multiprocessing
+import time
+
+import pytest
+from web3 import Web3
+from web3.exceptions import Web3RPCError
+
+import db
+from nonce import NonceManager
+from test_provider import WALLET
+
+
+@pytest.fixture
+def manager(node, tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "NONCES_DB_PATH", str(tmp_path / "nonces.db"))
+    node.handlers["eth_getTransactionCount"] = lambda params: ("result", "0x0")
+    return NonceManager(Web3(Web3.HTTPProvider(node.endpoint)), node.endpoint)
+
+
+def test_rejected_transactions_free_their_nonce(manager):
+    def reject(raw_transaction):
+        raise Web3RPCError("nonce too high")
+
+    assert manager.submit(WALLET, lambda nonce: nonce, lambda raw: raw) == 0
+
+    with pytest.raises(Web3RPCError):
+        manager.submit(WALLET, lambda nonce: nonce, reject)
+
+    with pytest.raises(ValueError):
+        manager.submit(WALLET, lambda nonce: int("unsigned"), lambda raw: raw)
+
+    assert manager.submit(WALLET, lambda nonce: nonce, lambda raw: raw) == 1
+
+
+def test_possibly_sent_transactions_keep_their_nonce(manager):
+    def time_out(raw_transaction):
+        raise TimeoutError()
+
+    with pytest.raises(TimeoutError):
+        manager.submit(WALLET, lambda nonce: nonce, time_out)
+
+    assert manager.submit(WALLET, lambda nonce: nonce, lambda raw: raw) == 1
+
+
+def submit_several(manager, log_path, count):
+    def send(nonce):
+        # a slow node: another process would overtake here without the lock
+        time.sleep(0.01)
+
+        with open(log_path, "a") as f:
+            f.write("%d\n" % nonce)
+
+        return nonce
+
+    for _ in range(count):
+        manager.submit(WALLET, lambda nonce: nonce, send)
+
+
+def test_processes_submit_in_nonce_order(manager, tmp_path):
+    log_path = str(tmp_path / "sent.log")
+    ctx = multiprocessing.get_context("fork")
+    processes = [ctx.Process(target=submit_several, args=(manager, log_path, 10)) for _ in range(3)]
+
+    for p in processes:
+        p.start()
+
+    for p in processes:
+        p.join(30)
+        assert p.exitcode == 0
+
+    with open(log_path, "r") as f:
+        assert [int(line) for line in f] == list(range(30))
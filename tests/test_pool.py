@@ -0,0 +1,58 @@
+import os
+import time
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from ssl_watermarking import pool as pool_module
+from ssl_watermarking.pool import WatermarkPool
+
+
+class FakeWatermark:
+
+    def __init__(self, model=None, work_dir=None) -> None:
+        self.model = torch.nn.Linear(1, 1)
+
+
+def fake_worker_loop(worker_id, model, num_threads, work_dir, jobs, results):
+    """Decodes in 20 ms, dies on the image named "die" """
+    while True:
+        job = jobs.get()
+
+        if job is None:
+            break
+
+        job_id, kind, (img_filepath, ) = job
+        results.put((job_id, None, os.getpid()))
+
+        if img_filepath == "die":
+            results.close()
+            results.join_thread()
+            os._exit(9)
+
+        time.sleep(0.02)
+        results.put((job_id, True, (1, 2)))
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    # forked workers inherit the patched module, the backbone is never built
+    monkeypatch.setattr(pool_module.main_multibit, "Watermark", FakeWatermark)
+    monkeypatch.setattr(pool_module, "_worker_loop", fake_worker_loop)
+
+    pool = WatermarkPool(num_workers=2, threads_per_worker=1, max_pending=200, start_method="fork")
+    yield pool
+    pool.shutdown()
+
+
+def test_dead_replica_fails_its_job_while_others_return_results(pool):
+    doomed = pool.submit_decode("die")
+    others = [pool.submit_decode("image_%d.png" % i) for i in range(150)]
+
+    with pytest.raises(RuntimeError, match="died"):
+        doomed.result(timeout=10)
+
+    # the surviving replica was still streaming results when the job failed
+    assert not all(f.done() for f in others)
+    assert all(f.result(timeout=30) == (1, 2) for f in others)
@@ -0,0 +1,94 @@
+import pytest
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.exceptions import ContractLogicError
+
+from provider import PROVIDERS, RPCBatch, get_web3_provider
+
+MINED = "0x" + "11" * 32
+PENDING = "0x" + "22" * 32
+WALLET = Web3.to_checksum_address("0x" + "ab" * 20)
+
+ABI = [{"type": "function", "name": "findSaleRecord", "stateMutability": "view",
+        "inputs": [{"name": "_hash", "type": "bytes32"}],
+        "outputs": [{"name": "agreement", "type": "address"}, {"name": "holder", "type": "address"},
+                    {"name": "tokenId", "type": "uint256"}]}]
+
+
+def receipt(tx_hash):
+    return {"transactionHash": tx_hash, "blockHash": "0x" + "33" * 32, "blockNumber": "0x5",
+            "status": "0x1", "gasUsed": "0x5208", "effectiveGasPrice": "0x3b9aca00",
+            "cumulativeGasUsed": "0x5208", "transactionIndex": "0x0", "type": "0x2",
+            "from": "0x" + "ab" * 20, "to": None, "contractAddress": None,
+            "logsBloom": "0x" + "00" * 256,
+            "logs": [{"address": "0x" + "cd" * 20, "topics": ["0x" + "44" * 32], "data": "0x",
+                      "blockNumber": "0x5", "logIndex": "0x0", "transactionIndex": "0x0",
+                      "transactionHash": tx_hash, "blockHash": "0x" + "33" * 32, "removed": False}]}
+
+
+def test_failing_items_do_not_fail_the_batch(node):
+    node.handlers["eth_getTransactionReceipt"] = lambda params: (
+        "result", receipt(params[0]) if params[0] == MINED else None)
+    node.handlers["eth_getBalance"] = lambda params: ("result", "0x10")
+    node.handlers["eth_call"] = lambda params: (
+        "error", {"code": 3, "message": "execution reverted: Asset Hash does not exist", "data": "0x"})
+
+    market = Web3().eth.contract(address=Web3.to_checksum_address("0x" + "ef" * 20), abi=ABI)
+
+    with RPCBatch(node.endpoint) as batch:
+        mined = batch.get_transaction_receipt(MINED)
+        pending = batch.get_transaction_receipt(PENDING)
+        balance = batch.get_balance(WALLET)
+        record = batch.call(market, "findSaleRecord", (b"\x00" * 32,))
+
+    assert node.round_trips == 1
+    assert len(node.requests[0]) == 4
+
+    assert mined.result().transactionHash == HexBytes(MINED)
+    assert mined.result().blockNumber == 5
+    assert mined.result().logs[0].topics == [HexBytes("0x" + "44" * 32)]
+    assert pending.result() is None
+    assert balance.result() == 16
+
+    try:
+        record.result()
+    except ContractLogicError as e:
+        assert "Asset Hash does not exist" in str(e)
+    else:
+        raise AssertionError("reverted call resolved")
+
+
+def test_call_decodes_outputs(node):
+    agreement, holder = "0x" + "cd" * 20, "0x" + "ab" * 20
+    node.handlers["eth_call"] = lambda params: ("result", "0x" + "00" * 12 + agreement[2:] +
+                                                "00" * 12 + holder[2:] + "%064x" % 7)
+
+    market = Web3().eth.contract(address=Web3.to_checksum_address("0x" + "ef" * 20), abi=ABI)
+
+    with RPCBatch(node.endpoint) as batch:
+        record = batch.call(market, "findSaleRecord", (b"\x00" * 32,))
+
+    assert record.result() == [Web3.to_checksum_address(agreement), Web3.to_checksum_address(holder), 7]
+
+
+def test_unreachable_node_fails_every_future():
+    with RPCBatch("http://127.0.0.1:9") as batch:
+        futures = [batch.get_balance(WALLET), batch.get_transaction_receipt(MINED)]
+
+    for future in futures:
+        assert future.exception() is not None
+
+
+def test_provider_checks_connectivity_once(node):
+    node.handlers["web3_clientVersion"] = lambda params: ("result", "FakeNode")
+
+    w3 = get_web3_provider(node.endpoint)
+    assert get_web3_provider(node.endpoint) is w3
+    assert node.round_trips == 1
+
+
+def test_unreachable_provider_is_not_cached():
+    with pytest.raises(ConnectionError):
+        get_web3_provider("http://127.0.0.1:1")
+
+    assert "http://127.0.0.1:1" not in PROVIDERS
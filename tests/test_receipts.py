@@ -0,0 +1,71 @@
+import time
+from hexbytes import HexBytes
+
+from receipts import PendingReceipt, ReceiptTracker
+from test_provider import MINED, PENDING, receipt
+
+
+def serve_chain(node, mined):
+    node.handlers["eth_blockNumber"] = lambda params: ("result", "0x6")
+    node.handlers["eth_getTransactionReceipt"] = lambda params: (
+        "result", receipt(params[0]) if params[0] in mined else None)
+
+
+def pend(tracker, tx_hash, timeout=60):
+    entry = PendingReceipt(HexBytes(tx_hash), time.time() + timeout)
+    tracker._pending.setdefault(entry.tx_hash, []).append(entry)
+    return entry.future
+
+
+def test_pending_and_mined_in_one_sweep(node):
+    serve_chain(node, {MINED})
+    tracker = ReceiptTracker(node.endpoint)
+
+    mined, pending = pend(tracker, MINED), pend(tracker, PENDING)
+    tracker._check(tracker._pending_hashes())
+
+    assert node.round_trips == 1
+    assert mined.result(0).transactionHash == HexBytes(MINED)
+    assert not pending.done()
+    assert tracker._pending_hashes() == [HexBytes(PENDING)]
+
+
+def test_confirmations_wait_for_the_head(node):
+    serve_chain(node, {MINED})
+    tracker = ReceiptTracker(node.endpoint, confirmations=2)
+
+    mined = pend(tracker, MINED)
+    tracker._check(tracker._pending_hashes())
+
+    # mined in block 5, the head is 6
+    assert not mined.done()
+
+
+def test_new_blocks_cost_one_batch(node):
+    serve_chain(node, set())
+    node.handlers["eth_newBlockFilter"] = lambda params: ("result", "0x1")
+    node.handlers["eth_getFilterChanges"] = lambda params: ("result", ["0x" + "55" * 32, "0x" + "66" * 32])
+    node.handlers["eth_getBlockByHash"] = lambda params: ("error", {"code": -32601, "message": "unexpected"})
+
+    tracker = ReceiptTracker(node.endpoint, poll_interval=0.01)
+    future = tracker.track(PENDING, timeout=60)
+    serve_chain(node, {PENDING})
+
+    assert future.result(5).transactionHash == HexBytes(PENDING)
+    methods = [request["method"] for body in node.requests
+               for request in (body if isinstance(body, list) else [body])]
+    assert "eth_getBlockByHash" not in methods
+
+
+def test_waits_expire_while_the_node_is_unreachable():
+    tracker = ReceiptTracker("http://127.0.0.1:9")
+    start = time.time()
+
+    try:
+        tracker.wait(MINED, timeout=1)
+    except TimeoutError:
+        pass
+    else:
+        raise AssertionError("wait did not time out")
+
+    assert time.time() - start < 3
@@ -0,0 +1,20 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("safetensors")
+
+from safetensors.torch import save_file
+from ssl_watermarking import utils
+
+
+def test_normalization_layer_loads_alike_from_both_formats(tmp_path):
+    checkpoint = {"weight": torch.randn(4, 3), "bias": torch.randn(4)}
+    torch.save(checkpoint, str(tmp_path / "whitening.pth"))
+    save_file(checkpoint, str(tmp_path / "whitening.safetensors"))
+
+    from_pth = utils.load_normalization_layer(str(tmp_path / "whitening.pth"))
+    from_safetensors = utils.load_normalization_layer(str(tmp_path / "whitening.safetensors"))
+
+    assert from_safetensors.weight.device.type == from_pth.weight.device.type == utils.device.type
+    assert torch.equal(from_safetensors.weight, from_pth.weight)
+    assert torch.equal(from_safetensors.bias, from_pth.bias)
@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+from web3 import Web3
+
+import db
+import traceability
+from traceability import compute_sale_hash, reconcile
+from test_provider import ABI
+
+AGREEMENT = Web3.to_checksum_address("0x" + "cd" * 20)
+HOLDER = "0x" + "ab" * 20
+
+
+@pytest.fixture
+def demo_db(tmp_path, monkeypatch):
+    path = str(tmp_path / "demo.db")
+
+    with open("src/db/schema.sql", "r") as f:
+        con = sqlite3.connect(path)
+        con.executescript(f.read())
+        con.close()
+
+    monkeypatch.setattr(db, "DEMO_DB_PATH", path)
+    return path
+
+
+def test_sale_hash_accepts_large_user_ids():
+    assert compute_sale_hash(b"asset", 300, 70000) != compute_sale_hash(b"asset", 70000, 300)
+
+
+def test_reconcile_treats_a_revert_as_not_recorded(node, demo_db, monkeypatch):
+    known, unknown = b"\x01" * 32, b"\x02" * 32
+
+    con = sqlite3.connect(demo_db)
+    for h, token_id in [(known, 7), (unknown, 8)]:
+        con.execute("INSERT INTO sale_hashes (hash, asset_digest, agreement, token_id, seller_id, buyer_id, verified) VALUES (?, ?, ?, ?, 1, 2, 0)", [
+            h.hex(), "00", AGREEMENT, token_id])
+    con.commit()
+    con.close()
+
+    def find_sale_record(params):
+        if params[0]["data"].endswith(known.hex()):
+            return "result", "0x" + "00" * 12 + AGREEMENT[2:].lower() + "00" * 12 + HOLDER[2:] + "%064x" % 7
+        return "error", {"code": 3, "message": "execution reverted: Asset Hash does not exist", "data": "0x"}
+
+    node.handlers["eth_call"] = find_sale_record
+    market = Web3().eth.contract(address=Web3.to_checksum_address("0x" + "ef" * 20), abi=ABI)
+    monkeypatch.setattr(traceability, "get_Market_contract", lambda endpoint, address: market)
+
+    assert reconcile(node.endpoint, market.address) == (1, 1)
+    assert node.round_trips == 1
+
+    con = sqlite3.connect(demo_db)
+    verified = dict(con.execute("SELECT hash, verified FROM sale_hashes").fetchall())
+    con.close()
+    assert verified == {known.hex(): 1, unknown.hex(): 0}